@@ -39,4 +39,39 @@ import game
 
 a = airspace.Airspace()
 g = game.Client()
-g.mainloop(a)
\ No newline at end of file
+if g.args.headless:
+    import headless
+    if g.args.replay is not None:
+        from replay import Replay
+        replay = Replay(g.args.replay)
+        h = headless.HeadlessSimulation.from_replay(replay, a)
+        ticks = replay.ticks
+        if g.args.ticks is not None:
+            ticks = min(ticks, g.args.ticks)
+    else:
+        replay = None
+        if g.args.tick_rate is not None:
+            a.clock.tick_rate = g.args.tick_rate
+        h = headless.HeadlessSimulation(a, player_id=g.id_)
+        ticks = 36000 if g.args.ticks is None else g.args.ticks
+    recorder = g.start_recording(a)
+    try:
+        # A replay runs every recorded tick, even past the plane's exit
+        print(h.report(h.run(ticks, stop_at_exit=replay is None)))
+    finally:
+        if recorder is not None:
+            recorder.close()
+    if replay is None:
+        pass
+    elif h.ticks != replay.recorded_ticks:
+        print("The replay cannot be verified: {} ticks were replayed, "
+              "but the recording has {}.".format(
+                  h.ticks, replay.recorded_ticks or "no final state"))
+    elif replay.matches(h.plane):
+        print("The replay matches the recording.")
+    else:
+        print("The replay does NOT match the recording.")
+elif g.args.build_pack:
+    g.build_pack()
+else:
+    g.mainloop(a)
\ No newline at end of file
@@ -22,11 +22,14 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # Installs Python 3 division and print behaviour
 from __future__ import division, print_function
 
-import random
+import collections
 
 import pygame
 
+from clock import SimulationClock
+from rng import RandomStream
 from objects import AdvancedSpriteGroup, Airplane, Objective
+from spatial import KDTree, SpatialGrid
 
 class Airspace(pygame.rect.Rect):
     """The class for an airspace."""
@@ -36,8 +39,17 @@ class Airspace(pygame.rect.Rect):
     ALTITUDE_TOLERANCE = 1400
     ALTITUDE_WITHIN = 2000
     POINTS_REQUIRED = 10
-    def __init__(self, x=(0, 0, 0, 0), y=None, w=None, h=None):
-        """Initialize the instance."""
+    OBJECTIVE_BUFFER_SIZE = 16 # Spare objective positions to keep
+    MAX_SPAWN_ATTEMPTS = 64 # Tries to find room for one objective
+    def __init__(self, x=(0, 0, 0, 0), y=None, w=None, h=None,
+                 tick_rate=SimulationClock.DEFAULT_TICK_RATE, fleet=None,
+                 seed=None, stream=None):
+        """Initialize the instance.
+
+        If fleet is a fleet.Fleet, the airspace's planes are stored in
+        it and updated all at once.
+        Objectives are placed using stream, a rng.RandomStream, or a
+        new one with the seed seed if stream is None."""
         if y is None:
             x, y, w, h = x # Input: 1 list
         elif w is None and h is None:
@@ -46,6 +58,19 @@ class Airspace(pygame.rect.Rect):
             x, y, Airspace.AIRSPACE_DIM, Airspace.AIRSPACE_DIM)
         self.planes = AdvancedSpriteGroup()
         self.objectives = AdvancedSpriteGroup()
+        self.clock = SimulationClock(tick_rate)
+        self.fleet = fleet
+        self.random = RandomStream(seed) if stream is None else stream
+        self.recorders = [] # Called with (airspace, tick) after each step
+        # Spatial indexes for collision tests
+        self.plane_grid = SpatialGrid(
+            self.width*0.12, Airspace.ALTITUDE_TOLERANCE*2, True)
+        self.objective_grid = SpatialGrid(
+            self.width*0.12, Airspace.ALTITUDE_TOLERANCE*2, True)
+        self._objective_tree = None # Rebuilt when objectives change
+        # Positions for upcoming objectives
+        self.objective_buffer = collections.deque()
+        self._pending_objectives = 0 # Objectives there was no room for
 
     def __repr__(self):
         """Display important informathion about the airspace."""
@@ -54,6 +79,20 @@ class Airspace(pygame.rect.Rect):
             ''.join(["\n%s" % repr(plane) for plane in self.planes]),
             ''.join(["\n%s" % repr(obj) for obj in self.objectives]))
 
+    @property
+    def seed(self):
+        """Get the seed objectives are placed with."""
+        return self.random.seed
+
+    def reseed(self, seed):
+        """Start placing objectives with a new seed.
+
+        Positions already drawn are thrown away, so the same seed
+        gives the same objectives from now on."""
+        self.random = RandomStream(seed, self.random.use_numpy,
+                                   self.random.batch_size)
+        self.objective_buffer.clear()
+
     def draw(self, client):
         """Draw the airspace and everything inside it."""
         client.screen.blit(
@@ -63,68 +102,245 @@ class Airspace(pygame.rect.Rect):
         for obj in self.objectives: # Draw objectives
             obj.draw(client, self)
 
-    def update(self):
-        """Update the airspace."""
-        self.planes.update()
+    def update(self, elapsed=None):
+        """Update the airspace.
 
-        for plane in self.planes: # Check for plane-objective collision
-            collisions = pygame.sprite.spritecollide(
-                plane, self.objectives, True, self.collided)
-            for collision in collisions:
+        Runs as many fixed-length steps as the clock says are due.
+        If elapsed is None, the clock measures the real time since the
+        last update; otherwise the airspace advances by elapsed
+        seconds.  Returns the number of steps run."""
+        if elapsed is None:
+            steps = self.clock.tick()
+        else:
+            steps = self.clock.advance(elapsed)
+        first_tick = self.clock.ticks - steps + 1
+        for tick in range(first_tick, first_tick + steps):
+            self.step(self.clock.timestep)
+            for recorder in self.recorders:
+                recorder.record(self, tick)
+        return steps
+
+    def step(self, tick_duration):
+        """Advance the airspace by one step of tick_duration seconds."""
+        if self.fleet is None:
+            self.planes.update(tick_duration)
+            for plane in self.planes:
+                self.plane_grid.move(plane)
+            near = [plane for plane in self.planes
+                    if self.objective_grid.is_near(
+                        self.plane_grid.cell_of(plane))]
+        else: # Do as much as possible for all planes at once
+            self.fleet.update(tick_duration)
+            self.fleet.refile(self.plane_grid)
+            near = [self.fleet.planes[index]
+                    for index in self.fleet.near(self.objective_grid)]
+
+        for plane in near: # Check for plane-objective collision
+            for objective in self.colliding_objectives(plane):
+                self.remove_objective(objective)
                 plane.points += 1
                 self.generate_objective()
+        # Retry the objectives there was no room for
+        pending = self._pending_objectives
+        self._pending_objectives = 0
+        for _ in range(pending):
+            self.generate_objective()
 
     def add_plane(self, plane=None, player_id=None):
         """Add a plane to the airspace.
 
         Create a new airplane no plane is supplied.
         Created airplane is at the center of the airspace.
+        If the airspace has a fleet, planes must come from it.
         Returns the newly-added plane."""
         if plane is None:
-            plane = Airplane(
+            if self.fleet is None:
+                new_plane = Airplane
+            else:
+                new_plane = self.fleet.add_plane
+            plane = new_plane(
                 self.width/2, self.height/2,
                 self.width*0.06, self.height*0.06, 0,
                 player_id=player_id)
         if isinstance(plane, Airplane):
+            if (self.fleet is not None
+                    and getattr(plane, 'fleet', None) is not self.fleet):
+                raise ValueError("plane must be in the airspace's fleet.")
             self.planes.add(plane)
+            self.plane_grid.add(plane)
             return plane
         raise TypeError("plane must be an Airplane or None.")
 
     def remove_plane(self, player_id):
         """Deletes the plane with id player_id."""
-        for plane in self.planes:
-            if plane.id_ == player_id:
-                self.planes.remove(plane)
-                break
+        plane = self.planes.get(player_id)
+        if plane is None:
+            return
+        self.planes.remove(plane)
+        self.plane_grid.discard(plane)
+        if self.fleet is not None:
+            self.fleet.remove_plane(plane)
 
-    def generate_objective(self):
-        """Generate an objective."""
-        objective = Objective(
-            -1, -1, self.width*0.06, self.height*0.06, -1)
-        # no collide; correct coords
-        objective_correct = False
-        while objective_correct != True:
-            objective_correct = False
-            # generate objective
-            objective.x = random.randint(0, self.width)
-            objective.z = random.randint(0, self.height)
-            objective.altitude = random.randint(
-                Airspace.MIN_OBJ_ALT, Airspace.MAX_ALTITUDE)
-            # test for collision
-            if not pygame.sprite.spritecollide(
-                    objective, self.planes, False,
-                    Airspace.collided):
-                objective_correct = True
+    def add_objective(self, objective):
+        """Add an objective to the airspace."""
         self.objectives.add(objective)
+        self.objective_grid.add(objective)
+        self._objective_tree = None
+
+    def remove_objective(self, objective):
+        """Remove an objective from the airspace."""
+        self.objectives.remove(objective)
+        self.objective_grid.discard(objective)
+        self._objective_tree = None
+
+    def clear_objectives(self):
+        """Remove every objective from the airspace."""
+        self.objectives.empty()
+        self.objective_grid.clear()
+        self._objective_tree = None
+
+    def nearest_objectives(self, plane, k=1):
+        """Get the k objectives nearest to a plane, nearest first.
+
+        Distances are measured horizontally."""
+        if self._objective_tree is None:
+            self._objective_tree = KDTree(
+                self.objectives.ordered(), lambda obj: (obj.x, obj.z))
+        return self._objective_tree.nearest((plane.x, plane.z), k)
+
+    def all_nearest_objectives(self, k=1):
+        """Get the k objectives nearest to every plane.
+
+        Returns a dictionnary from plane IDs to lists of objectives,
+        nearest first."""
+        return collections.OrderedDict(
+            (plane.id_, self.nearest_objectives(plane, k))
+            for plane in self.planes.ordered())
+
+    def colliding_objectives(self, plane):
+        """Get the objectives a plane collides with."""
+        return self._colliding(plane, self.objective_grid)
+
+    def colliding_planes(self, objective):
+        """Get the planes an objective collides with."""
+        return self._colliding(objective, self.plane_grid)
+
+    def _colliding(self, sprite, grid):
+        """Get the sprites in grid that collide with sprite.
+
+        Does the same test as collided(), but only looks up sprite's
+        rect and altitude once."""
+        return self.touching(sprite.rect, sprite.altitude, grid)
+
+    def _touching_planes(self, rect, altitude):
+        """Get the planes touching a rect at an altitude."""
+        return self.touching(rect, altitude, self.plane_grid)
+
+    def touching(self, rect, altitude, grid):
+        """Get the sprites in grid touching a rect at an altitude.
+
+        grid can be any SpatialGrid, not only the airspace's own."""
+        tolerance = self.ALTITUDE_TOLERANCE
+        return [other for other in grid.query_rect(
+                    rect, altitude - tolerance, altitude + tolerance)
+                if abs(other.altitude - altitude) <= tolerance
+                and rect.colliderect(other.rect)]
+
+    def generate_objective(self):
+        """Generate an objective where no plane touches it.
+
+        Takes the position from the objective buffer, refilling it if
+        needed.  If there is no room anywhere, no objective is made
+        and another try happens next step.
+        Returns the objective, or None if there was no room."""
+        refilled = False
+        while True:
+            if not self.objective_buffer:
+                if refilled: # No room
+                    self._pending_objectives += 1
+                    return None
+                self.fill_objective_buffer()
+                refilled = True
+                continue
+            x, z, altitude = self.objective_buffer.popleft()
+            objective = Objective(
+                x, z, self.width*0.06, self.height*0.06, altitude)
+            # planes may have moved there since the position was drawn
+            if not self.colliding_planes(objective):
+                self.add_objective(objective)
+                return objective
+
+    def generate_objectives(self, n):
+        """Generate n objectives where no plane touches them.
+
+        Returns the objectives; there may be less than n if the
+        airspace is full of planes."""
+        objectives = []
+        for x, z, altitude in self.free_positions(n):
+            objective = Objective(
+                x, z, self.width*0.06, self.height*0.06, altitude)
+            self.add_objective(objective)
+            objectives.append(objective)
+        return objectives
+
+    def fill_objective_buffer(self):
+        """Draw positions until the objective buffer is full."""
+        self.objective_buffer.extend(self.free_positions(
+            self.OBJECTIVE_BUFFER_SIZE - len(self.objective_buffer)))
+
+    def free_positions(self, n):
+        """Get up to n random objective positions that no plane touches.
+
+        Positions in a plane grid cell with no plane near it are free
+        straight away; others are tested against the planes in the
+        cells around them.  If a position is not found within
+        MAX_SPAWN_ATTEMPTS tries, the airspace is taken to be full and
+        the positions found so far are returned.
+        Returns a list of (x, z, altitude) tuples."""
+        size = (self.width*0.06, self.height*0.06)
+        positions = []
+        while len(positions) < n:
+            for _ in range(self.MAX_SPAWN_ATTEMPTS):
+                x, z, altitude = self.random.position(
+                    self.width, self.height,
+                    Airspace.MIN_OBJ_ALT, Airspace.MAX_ALTITUDE)
+                if (not self.plane_grid.is_near(
+                        self.plane_grid.key(x, z, altitude))
+                        or not self._touching_planes(
+                            pygame.rect.Rect((x, z), size), altitude)):
+                    positions.append((x, z, altitude))
+                    break
+            else: # Full
+                break
+        return positions
+
+    def get_exit_code(self, plane):
+        """Get the exit code for a plane, or None if it can go on.
+
+        The codes index Client.EXIT_TITLES and Client.EXIT_REASONS."""
+        if plane.health <= 0:
+            return 5 # Overstressed the aircraft
+        elif (plane.points >= self.POINTS_REQUIRED
+              and plane.altitude <= 0):
+            return 1 # You Won!
+        # position-related exit
+        if plane.altitude > self.MAX_ALTITUDE:
+            return 6
+        elif (plane.altitude <= 0
+              and plane.total_vertical_velocity < -20):
+            return 3
+        elif not self.in_bounds(plane, False):
+            return 4
 
     @staticmethod
     def collided(airplane, objective, altitude_tolerance=None):
         """Test if a airplane collides with an objective."""
         if altitude_tolerance is None:
             altitude_tolerance = Airspace.ALTITUDE_TOLERANCE
-        return (airplane.rect.colliderect(objective.rect)
-                and abs(objective.altitude - airplane.altitude)
-                <= altitude_tolerance)
+        # The altitude test is cheaper, so it goes first
+        return (abs(objective.altitude - airplane.altitude)
+                <= altitude_tolerance
+                and airplane.rect.colliderect(objective.rect))
 
     def in_bounds(self, sprite, use_zeroed_coords=True):
         """Tests if an object is in bounds.
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+"""Resource providers and lazy asset dictionnaries
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import io
+import os
+import posixpath
+import zipfile
+try:
+    from collections.abc import MutableMapping
+except ImportError: # Python 2
+    from collections import MutableMapping
+
+import pygame
+
+
+class DirectoryProvider(object):
+    """Reads resources from a directory.
+
+    Resource paths use forward slashes and are relative to the
+    directory, like "Images/logo.png".
+    """
+    def __init__(self, path):
+        """Initialize the instance."""
+        self.path = path
+
+    def __repr__(self):
+        """Display the directory."""
+        return "<DirectoryProvider {}>".format(self.path)
+
+    def _full_path(self, path):
+        """Get the filesystem path of a resource."""
+        return os.path.join(self.path, *path.split('/'))
+
+    def listdir(self, path=''):
+        """Get the names of the files in a folder."""
+        full_path = self._full_path(path) if path else self.path
+        return sorted(name for name in os.listdir(full_path)
+                      if os.path.isfile(os.path.join(full_path, name)))
+
+    def exists(self, path):
+        """Test if a resource exists."""
+        return os.path.isfile(self._full_path(path))
+
+    def open(self, path):
+        """Open a resource as a binary file."""
+        return open(self._full_path(path), 'rb')
+
+    def read(self, path):
+        """Get the contents of a resource as bytes."""
+        with self.open(path) as f:
+            return f.read()
+
+    def source(self, path):
+        """Get something pygame can load a resource from.
+
+        For a directory, that is the resource's filesystem path."""
+        return self._full_path(path)
+
+    def close(self):
+        """Close the provider.  Directories need no closing."""
+        pass
+
+
+class ZipProvider(object):
+    """Reads resources from a zip archive, without extracting it.
+
+    The resources can be at the root of the archive, or inside a
+    single folder at its root.  Resources are read into memory
+    buffers when opened.
+    """
+    def __init__(self, path):
+        """Initialize the instance."""
+        self.path = path
+        self.archive = zipfile.ZipFile(path)
+        self._files = set(name for name in self.archive.namelist()
+                          if not name.endswith('/'))
+        # Look for the resources inside a single top-level folder
+        roots = set(name.split('/')[0] for name in self._files)
+        if (len(roots) == 1 and not self._files & roots):
+            self._prefix = roots.pop() + '/'
+        else:
+            self._prefix = ''
+
+    def __repr__(self):
+        """Display the archive."""
+        return "<ZipProvider {}>".format(self.path)
+
+    def listdir(self, path=''):
+        """Get the names of the files in a folder."""
+        folder = self._prefix + (path + '/' if path else '')
+        names = [name[len(folder):] for name in self._files
+                 if name.startswith(folder)]
+        return sorted(name for name in names if '/' not in name)
+
+    def exists(self, path):
+        """Test if a resource exists."""
+        return self._prefix + path in self._files
+
+    def open(self, path):
+        """Open a resource as an in-memory binary file."""
+        return io.BytesIO(self.read(path))
+
+    def read(self, path):
+        """Get the contents of a resource as bytes."""
+        return self.archive.read(self._prefix + path)
+
+    def source(self, path):
+        """Get something pygame can load a resource from.
+
+        For a zip archive, that is a new in-memory file."""
+        return self.open(path)
+
+    def close(self):
+        """Close the archive."""
+        self.archive.close()
+
+
+def get_provider(path):
+    """Get the right provider for a directory or zip archive."""
+    if os.path.isdir(path):
+        return DirectoryProvider(path)
+    elif zipfile.is_zipfile(path):
+        return ZipProvider(path)
+    raise ValueError("{} is not a directory or zip archive.".format(path))
+
+
+def read_colors(provider):
+    """Read the colours from colors.txt or colours.txt.
+
+    Lines look like colorid=hexcode.  Blank lines and lines starting
+    with a # are ignored.
+    Returns a dictionnary from colour IDs to pygame Colors."""
+    if provider.exists("colors.txt"):
+        colors_file = provider.read("colors.txt")
+    elif provider.exists("colours.txt"):
+        colors_file = provider.read("colours.txt")
+    else:
+        return {}
+    colors = {}
+    for line in colors_file.decode('utf-8').splitlines():
+        if line.strip() == '':
+            continue
+        elif line.strip()[0] == '#':
+            continue
+        colorname, color = line.split('=')
+        colors[colorname.strip()] = pygame.color.Color(color.strip())
+    return colors
+
+
+def read_fonts(provider):
+    """Read the fonts from fonts.txt.
+
+    Lines look like fontid=fontname size, where size is a fraction of
+    the window's height.  Blank lines and lines starting with a # are
+    ignored.
+    Returns a dictionnary from font IDs to (font name, size); the font
+    name is None for the default font."""
+    fonts = {}
+    for line in provider.read("fonts.txt").decode('utf-8').splitlines():
+        if line.strip() == '':
+            continue
+        elif line.strip()[0] == '#':
+            continue
+        fontname, font = line.split('=')
+        font_info = font.strip().split(' ')
+        font = ' '.join(font_info[:-1])
+        if font.lower() in ['none', 'default']:
+            font = None
+        fonts[fontname.strip()] = font, float(font_info[-1])
+    return fonts
+
+
+def join(*parts):
+    """Join parts of a resource path."""
+    return posixpath.join(*parts)
+
+
+class LazyDict(MutableMapping):
+    """A dictionnary whose values are made the first time they are used.
+
+    The keys are known up front; the value for a key is made by calling
+    loader(key) when it is first looked up, and kept after that.
+    Iterating over the keys or testing for one loads nothing.
+
+    Values can also be loaded in the background with preload; looking
+    up a value that is still loading waits for just that value.
+    """
+    def __init__(self, loader, keys=()):
+        """Initialize the instance."""
+        self._loader = loader
+        self._keys = list(keys)
+        self._key_set = set(self._keys)
+        self._values = {}
+        self._pending = {} # Results of values loading in the background
+
+    def __repr__(self):
+        """Display how many values are loaded."""
+        return "<LazyDict {}/{} loaded>".format(
+            len(self._values), len(self._keys))
+
+    def __getitem__(self, key):
+        """Get the value for key, loading it if needed."""
+        try:
+            return self._values[key]
+        except KeyError:
+            if key not in self._key_set:
+                raise
+        if key in self._pending: # Wait for it to finish loading
+            value = self._pending.pop(key).get()
+        else:
+            value = self._loader(key)
+        self._values[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        """Set the value for key."""
+        if key not in self._key_set:
+            self._keys.append(key)
+            self._key_set.add(key)
+        self._pending.pop(key, None)
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        """Remove key and its value."""
+        self._key_set.remove(key)
+        self._keys.remove(key)
+        self._values.pop(key, None)
+        self._pending.pop(key, None)
+
+    def __contains__(self, key):
+        """Test if key is in the dictionnary, without loading it."""
+        return key in self._key_set
+
+    def __iter__(self):
+        """Iterate over the keys."""
+        return iter(self._keys)
+
+    def __len__(self):
+        """Get the number of keys."""
+        return len(self._keys)
+
+    def is_loaded(self, key):
+        """Test if the value for key has been loaded."""
+        return key in self._values
+
+    def is_ready(self, key):
+        """Test if the value for key can be looked up without waiting."""
+        return key in self._values or (
+            key in self._pending and self._pending[key].ready())
+
+    def preload(self, pool, keys=None):
+        """Start loading values in the background.
+
+        pool is a multiprocessing.pool.ThreadPool; keys defaults to
+        every key, and keys that are loaded or loading are skipped.
+        The loader must be safe to call from the pool's threads."""
+        if keys is None:
+            keys = self._keys
+        for key in keys:
+            if key not in self._values and key not in self._pending:
+                self._pending[key] = pool.apply_async(self._loader, (key,))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""The RotationAtlas class
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import pygame
+
+
+class RotationAtlas(object):
+    """Copies of an image rotated by multiples of step degrees.
+
+    Angles are rounded to the nearest multiple of step, so drawing a
+    rotated image is a lookup instead of a pygame.transform.rotate.
+    If the angles from low to high cover a full turn, any angle can be
+    looked up; otherwise angles are clamped to that range.
+
+    If lazy is True, each angle is rotated the first time it is looked
+    up instead of all at once.  If size is given, only that much of
+    each rotated image, around its center, is kept.
+    """
+    def __init__(self, image, step=1, low=-180, high=180, lazy=False,
+                 size=None):
+        """Initialize the instance."""
+        if step <= 0:
+            raise ValueError("step must be positive.")
+        self.image = image
+        self.full_turn = high - low >= 360
+        if self.full_turn: # Make the step divide a full turn evenly
+            self._count = max(int(round(360 / step)), 1)
+            step = 360 / self._count
+        self.step = step
+        self.size = size
+        self._low = int(round(low / step))
+        self._high = int(round(high / step))
+        self._rotations = {}
+        if not lazy:
+            for index in self.indexes():
+                self._rotations[index] = self._render(index)
+
+    def __len__(self):
+        """Get the number of angles rendered so far."""
+        return len(self._rotations)
+
+    def __repr__(self):
+        """Display the step and number of rendered angles."""
+        return "<RotationAtlas {} angles every {}\xb0>".format(
+            len(self._rotations), self.step)
+
+    def indexes(self):
+        """Get the indexes of every angle in the atlas."""
+        if self.full_turn:
+            return range(self._count)
+        return range(self._low, self._high + 1)
+
+    def index(self, angle):
+        """Get the index of the atlas angle nearest to angle."""
+        index = int(round(angle / self.step))
+        if self.full_turn:
+            return index % self._count
+        return min(max(index, self._low), self._high)
+
+    def angle(self, angle):
+        """Round an angle to the nearest angle in the atlas."""
+        index = self.index(angle)
+        if self.full_turn and index > self._count // 2:
+            index -= self._count # Keep the sign of small angles
+        return index * self.step
+
+    def get(self, angle):
+        """Get the image rotated by the atlas angle nearest to angle."""
+        index = self.index(angle)
+        image = self._rotations.get(index)
+        if image is None:
+            image = self._rotations[index] = self._render(index)
+        return image
+
+    def _render(self, index):
+        """Rotate the image by the angle with index index."""
+        image = pygame.transform.rotate(self.image, index * self.step)
+        if self.size is None:
+            return image
+        # Keep the middle, with its center where the full image's was
+        crop = pygame.rect.Rect((0, 0), self.size)
+        crop.center = image.get_rect().center
+        crop = crop.clip(image.get_rect())
+        return image.subsurface(crop).copy()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""The LRUCache class
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import collections
+
+
+class LRUCache(object):
+    """A dictionnary holding at most max_size items.
+
+    When it is full, adding an item throws away the least recently
+    used one.  hits and misses count how many lookups found an item.
+    """
+    def __init__(self, max_size=256):
+        """Initialize the instance."""
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1.")
+        self.max_size = max_size
+        self._items = collections.OrderedDict() # Least recent first
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Get the number of items in the cache."""
+        return len(self._items)
+
+    def __contains__(self, key):
+        """Test if key is in the cache, without counting it as used."""
+        return key in self._items
+
+    def __repr__(self):
+        """Display the size and hit rate of the cache."""
+        return "<LRUCache {}/{} items, {} hits, {} misses>".format(
+            len(self._items), self.max_size, self.hits, self.misses)
+
+    @property
+    def hit_rate(self):
+        """Get the fraction of lookups that found an item."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def get(self, key, default=None):
+        """Get the item for key, or default if it is not cached."""
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items[key] = value # Now the most recently used
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        """Cache an item, throwing away the oldest if full."""
+        self._items.pop(key, None)
+        self._items[key] = value
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """Throw away every item.  The counters are kept."""
+        self._items.clear()
+
+    def reset_counters(self):
+        """Set the hit and miss counters back to 0."""
+        self.hits = 0
+        self.misses = 0
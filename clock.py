@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""The SimulationClock class
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import time
+
+
+class SimulationClock(object):
+    """A fixed-timestep clock for the physics simulation.
+
+    Elapsed time is added to an accumulator and consumed in steps of
+    exactly one timestep, so the simulation does the same thing no
+    matter how often it is updated.  The leftover fraction of a step
+    is available as alpha, for interpolating between the previous and
+    current state when drawing.
+    """
+    DEFAULT_TICK_RATE = 120
+    MAX_FRAME_TIME = 0.25 # Never simulate more than this per update
+
+    def __init__(self, tick_rate=DEFAULT_TICK_RATE,
+                 max_frame_time=MAX_FRAME_TIME, time_function=time.time):
+        """Initialize the instance."""
+        self.tick_rate = tick_rate
+        self.max_frame_time = max_frame_time
+        self._time_function = time_function
+        self._last_time = None
+        self._accumulator = 0
+        self._ticks = 0
+        self._paused = False
+
+    def __repr__(self):
+        """Display the state of the clock."""
+        return "<SimulationClock {} Hz, tick {}>".format(
+            self.tick_rate, self.ticks)
+
+    @property
+    def tick_rate(self):
+        """Get the number of simulation steps per second."""
+        return self._tick_rate
+    @tick_rate.setter
+    def tick_rate(self, new_value):
+        """Set the number of simulation steps per second."""
+        if not isinstance(new_value, (int, float)):
+            raise TypeError("Tick rate must be a number.")
+        if new_value <= 0:
+            raise ValueError("Tick rate must be positive.")
+        self._tick_rate = new_value
+        self._timestep = 1 / new_value
+    @property
+    def timestep(self):
+        """Get the length of one simulation step in seconds."""
+        return self._timestep
+    @property
+    def ticks(self):
+        """Get the number of steps simulated so far."""
+        return self._ticks
+    @property
+    def time(self):
+        """Get the simulated time in seconds."""
+        return self._ticks * self._timestep
+    @property
+    def alpha(self):
+        """Get how far the clock is between the last and next step.
+
+        0 means the simulation is exactly at the last step, and 1
+        means it is due for another one."""
+        return min(self._accumulator / self._timestep, 1)
+    @property
+    def paused(self):
+        """Get whether the clock is paused."""
+        return self._paused
+
+    def advance(self, elapsed):
+        """Add elapsed seconds and return the number of steps due."""
+        if self._paused:
+            return 0
+        self._accumulator += min(elapsed, self.max_frame_time)
+        steps = int(self._accumulator // self._timestep)
+        self._accumulator -= steps * self._timestep
+        self._ticks += steps
+        return steps
+
+    def tick(self):
+        """Measure the time since the last tick and advance by it.
+
+        Returns the number of steps due.  The first tick after
+        creating or restarting the clock only starts the measurement.
+        """
+        now = self._time_function()
+        if self._last_time is None:
+            elapsed = 0
+        else:
+            elapsed = now - self._last_time
+        self._last_time = now
+        return self.advance(elapsed)
+
+    def restart(self):
+        """Forget the time that passed since the last tick."""
+        self._last_time = None
+
+    def pause(self):
+        """Stop the clock from advancing."""
+        self._paused = True
+
+    def resume(self):
+        """Let the clock advance again, skipping the paused time."""
+        self._paused = False
+        self.restart()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+
+"""The FlightEnv, VectorFlightEnv and ProcessVectorFlightEnv classes
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+These let a program fly the plane instead of the keyboard, for
+training autopilots.  They follow the reset()/step(action) style of
+Gym environments, without needing Gym:
+
+ -> An action is (roll level, vertical roll level, throttle).  Roll
+    levels go from -4 to 4 and the throttle from 0 to 100; values
+    outside are clamped like the keyboard controls are.
+ -> An observation is an array of the values in OBSERVATION.
+ -> The reward is the number of objectives reached during the step.
+ -> An episode terminates when the airspace gives an exit code, and
+    is truncated after max_ticks ticks.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import multiprocessing
+
+import numpy
+
+from airspace import Airspace
+from clock import SimulationClock
+from headless import HeadlessSimulation
+from rng import RandomStream
+
+# What each value of an observation is
+OBSERVATION = (
+    'x', 'z', 'altitude', 'heading', 'pitch', 'speed', 'acceleration',
+    'gravity', 'throttle', 'roll_level', 'vertical_roll_level',
+    'health', 'points',
+    # Where the nearest objective is, relative to the plane
+    'objective-dx', 'objective-dz', 'objective-daltitude',
+)
+PLANE_OBSERVATION = OBSERVATION[:13] # Read straight from the plane
+
+
+class FlightEnv(object):
+    """An environment where a program flies one plane in an airspace.
+
+    Each step sets the plane's controls to the action and simulates
+    ticks_per_step ticks, or less if the episode ends.  Every episode
+    places its objectives with a new stream spawned from stream, a
+    rng.RandomStream, or a new one with the seed seed if stream is
+    None; so the same seed always gives the same episodes.
+    """
+    MAX_TICKS = 36000 # Ticks an episode can last by default
+    def __init__(self, seed=None, stream=None,
+                 tick_rate=SimulationClock.DEFAULT_TICK_RATE,
+                 ticks_per_step=1, max_ticks=MAX_TICKS):
+        """Initialize the instance."""
+        self.stream = RandomStream(seed) if stream is None else stream
+        self.tick_rate = tick_rate
+        self.ticks_per_step = ticks_per_step
+        self.max_ticks = max_ticks
+        self.simulation = None
+        self.episodes = 0
+
+    def __repr__(self):
+        """Display the seed and the number of episodes."""
+        return "<FlightEnv seed {} {} episodes>".format(
+            self.stream.seed, self.episodes)
+
+    @property
+    def airspace(self):
+        """Get the current episode's airspace."""
+        return self.simulation.airspace
+    @property
+    def plane(self):
+        """Get the current episode's plane."""
+        return self.simulation.plane
+
+    def reset(self):
+        """Start a new episode.
+
+        Returns the first observation."""
+        airspace = Airspace(tick_rate=self.tick_rate,
+                            stream=self.stream.spawn(1)[0])
+        self.simulation = HeadlessSimulation(airspace, player_id=0)
+        self.episodes += 1
+        return self.observe()
+
+    def observe(self, out=None):
+        """Get the current observation, writing it into out if given."""
+        if out is None:
+            out = numpy.empty(len(OBSERVATION))
+        plane = self.plane
+        out[:len(PLANE_OBSERVATION)] = [
+            getattr(plane, name) for name in PLANE_OBSERVATION]
+        nearest = self.airspace.nearest_objectives(plane)
+        if nearest:
+            out[len(PLANE_OBSERVATION):] = (
+                nearest[0].x - plane.x, nearest[0].z - plane.z,
+                nearest[0].altitude - plane.altitude)
+        else: # Every objective is waiting for room
+            out[len(PLANE_OBSERVATION):] = 0
+        return out
+
+    def act(self, action):
+        """Set the plane's controls to an action."""
+        roll_level, vertical_roll_level, throttle = action
+        plane = self.plane
+        plane.roll_level = float(roll_level)
+        plane.vertical_roll_level = float(vertical_roll_level)
+        plane.throttle = float(throttle)
+
+    def advance(self):
+        """Simulate the ticks of one step, with the controls as they are.
+
+        Returns (reward, terminated, truncated, exit code)."""
+        simulation = self.simulation
+        points = self.plane.points
+        exit_code = None
+        for _ in range(self.ticks_per_step):
+            simulation.step()
+            exit_code = simulation.exit_code
+            if exit_code or simulation.ticks >= self.max_ticks:
+                break
+        return (self.plane.points - points, bool(exit_code),
+                not exit_code and simulation.ticks >= self.max_ticks,
+                exit_code or 0)
+
+    def step(self, action):
+        """Fly a step with an action.
+
+        Returns (observation, reward, terminated, truncated, info);
+        info is a dictionnary with the exit code, points and ticks.
+        Call reset once the episode is terminated or truncated."""
+        self.act(action)
+        reward, terminated, truncated, exit_code = self.advance()
+        return (self.observe(), reward, terminated, truncated,
+                self.info(exit_code))
+
+    def info(self, exit_code=0):
+        """Get the info dictionnary returned by step."""
+        return {
+            'exit-code': exit_code,
+            'points': self.plane.points,
+            'ticks': self.simulation.ticks,
+        }
+
+
+class VectorFlightEnv(object):
+    """Steps n independent FlightEnvs at once, in this process.
+
+    Actions are an array with one row per environment, and
+    observations, rewards, terminations and truncations are returned
+    as arrays with one entry per environment.  An environment whose
+    episode ended is reset straight away; the observation returned is
+    then the new episode's first one, and the last observation of the
+    ended episode is in its info's 'final-observation'.
+
+    The environments' streams are spawned from stream, or from a new
+    one with the seed seed if stream is None; streams, if given, is a
+    list of the streams to use instead.
+    """
+    def __init__(self, n=None, seed=None, stream=None, streams=None,
+                 **options):
+        """Initialize the instance.
+
+        options are passed on to FlightEnv."""
+        if streams is None:
+            if n is None:
+                raise TypeError("Either n or streams must be given.")
+            if stream is None:
+                stream = RandomStream(seed)
+            streams = stream.spawn(n)
+        self.envs = [FlightEnv(stream=stream_, **options)
+                     for stream_ in streams]
+        self.observations = numpy.zeros((len(self.envs), len(OBSERVATION)))
+        self.rewards = numpy.zeros(len(self.envs))
+        self.terminated = numpy.zeros(len(self.envs), numpy.bool_)
+        self.truncated = numpy.zeros(len(self.envs), numpy.bool_)
+
+    def __len__(self):
+        """Get the number of environments."""
+        return len(self.envs)
+
+    def __repr__(self):
+        """Display the number of environments."""
+        return "<VectorFlightEnv of {} environments>".format(len(self))
+
+    def reset(self):
+        """Start a new episode in every environment.
+
+        Returns the first observations."""
+        for index, env in enumerate(self.envs):
+            env.reset()
+            env.observe(self.observations[index])
+        return self.observations.copy()
+
+    def step(self, actions):
+        """Fly a step in every environment.
+
+        Returns (observations, rewards, terminated, truncated, infos);
+        infos is a list of dictionnaries."""
+        actions = numpy.asarray(actions, numpy.float64)
+        if actions.shape != (len(self), 3):
+            raise ValueError("Expected actions of shape {}, got {}.".format(
+                (len(self), 3), actions.shape))
+        infos = []
+        for index, (env, action) in enumerate(zip(self.envs, actions)):
+            env.act(action)
+            reward, terminated, truncated, exit_code = env.advance()
+            info = env.info(exit_code)
+            if terminated or truncated:
+                info['final-observation'] = env.observe()
+                env.reset()
+            env.observe(self.observations[index])
+            self.rewards[index] = reward
+            self.terminated[index] = terminated
+            self.truncated[index] = truncated
+            infos.append(info)
+        return (self.observations.copy(), self.rewards.copy(),
+                self.terminated.copy(), self.truncated.copy(), infos)
+
+    def close(self):
+        """Do nothing; there is nothing to clean up."""
+
+
+def _run_worker(connection, streams, options):
+    """Run a VectorFlightEnv for a ProcessVectorFlightEnv's commands."""
+    envs = VectorFlightEnv(streams=streams, **options)
+    try:
+        while True:
+            command, data = connection.recv()
+            if command == 'reset':
+                connection.send(envs.reset())
+            elif command == 'step':
+                connection.send(envs.step(data))
+            elif command == 'close':
+                break
+    except (EOFError, KeyboardInterrupt): # Parent went away
+        pass
+    finally:
+        connection.close()
+
+
+class ProcessVectorFlightEnv(object):
+    """Steps n independent FlightEnvs at once, across processes.
+
+    Works like VectorFlightEnv, but the environments are split between
+    processes worker processes (by default one per CPU) that step
+    their share at the same time.  With the same seed, the episodes
+    are the same as a VectorFlightEnv's.  Call close when done.
+    """
+    def __init__(self, n, seed=None, stream=None, processes=None,
+                 **options):
+        """Initialize the instance.
+
+        options are passed on to FlightEnv."""
+        if stream is None:
+            stream = RandomStream(seed)
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        processes = max(min(processes, n), 1)
+        streams = stream.spawn(n)
+        self.n = n
+        self.connections = []
+        self.workers = []
+        self.slices = [] # The environments each worker has
+        for index in range(processes):
+            start = n * index // processes
+            end = n * (index + 1) // processes
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_run_worker,
+                args=(worker_connection, streams[start:end], options))
+            worker.daemon = True
+            worker.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.workers.append(worker)
+            self.slices.append(slice(start, end))
+
+    def __len__(self):
+        """Get the number of environments."""
+        return self.n
+
+    def __repr__(self):
+        """Display the number of environments and processes."""
+        return "<ProcessVectorFlightEnv of {} environments in {} " \
+               "processes>".format(self.n, len(self.workers))
+
+    def reset(self):
+        """Start a new episode in every environment.
+
+        Returns the first observations."""
+        for connection in self.connections:
+            connection.send(('reset', None))
+        return numpy.concatenate([connection.recv()
+                                  for connection in self.connections])
+
+    def step(self, actions):
+        """Fly a step in every environment.
+
+        Returns (observations, rewards, terminated, truncated, infos)
+        like VectorFlightEnv.step."""
+        actions = numpy.asarray(actions, numpy.float64)
+        if actions.shape != (self.n, 3):
+            raise ValueError("Expected actions of shape {}, got {}.".format(
+                (self.n, 3), actions.shape))
+        for connection, slice_ in zip(self.connections, self.slices):
+            connection.send(('step', actions[slice_]))
+        results = [connection.recv() for connection in self.connections]
+        infos = []
+        for result in results:
+            infos.extend(result[4])
+        return tuple(numpy.concatenate([result[index] for result in results])
+                     for index in range(4)) + (infos,)
+
+    def close(self):
+        """Stop the worker processes."""
+        for connection in self.connections:
+            try:
+                connection.send(('close', None))
+            except (IOError, OSError): # Already stopped
+                pass
+            connection.close()
+        for worker in self.workers:
+            worker.join()
+        self.connections = []
+        self.workers = []
@@ -0,0 +1,450 @@
+#!/usr/bin/env python
+
+"""The Fleet class, which simulates many planes at once with NumPy
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import math
+
+import numpy
+
+from objects import Airplane
+
+
+class Fleet(object):
+    """Stores the state of many airplanes in NumPy arrays.
+
+    Each field is one contiguous array, indexed by the plane's slot.
+    The planes themselves are FleetAirplane views that read and write
+    their slot, so they can be used anywhere an Airplane can.
+    update() advances every plane with one vectorized step.
+    """
+    FIELDS = (
+        ('x', numpy.float64),
+        ('z', numpy.float64),
+        ('altitude', numpy.float64),
+        ('heading', numpy.float64),
+        ('pitch', numpy.float64),
+        ('speed', numpy.float64),
+        ('acceleration', numpy.float64),
+        ('gravity', numpy.float64),
+        ('throttle', numpy.float64),
+        ('roll_level', numpy.float64),
+        ('vertical_roll_level', numpy.float64),
+        ('health', numpy.float64),
+        ('autopilot', numpy.bool_),
+        ('roll_centered', numpy.bool_),
+        ('vertical_roll_centered', numpy.bool_),
+        ('throttle_centered', numpy.bool_),
+        ('previous_x', numpy.float64),
+        ('previous_z', numpy.float64),
+        ('previous_altitude', numpy.float64),
+        ('previous_heading', numpy.float64),
+        # The plane's cell in the grid last passed to refile()
+        ('cell_x', numpy.int64),
+        ('cell_z', numpy.int64),
+        ('cell_y', numpy.int64),
+    )
+    DEFAULT_CAPACITY = 64
+    CELL_OFFSET = 2 ** 20 # Makes cell keys positive for cell_codes
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """Initialize the instance."""
+        self._count = 0
+        self._capacity = capacity
+        self.arrays = self._allocate(capacity)
+        self.planes = [] # The view in each slot
+        self._near_version = None # The grid version _near_codes is for
+        self._near_codes = None
+
+    def __len__(self):
+        """Get the number of planes in the fleet."""
+        return self._count
+
+    def __repr__(self):
+        """Display the size of the fleet."""
+        return "<Fleet of {} planes>".format(self._count)
+
+    @property
+    def capacity(self):
+        """Get the number of planes that fit without reallocating."""
+        return self._capacity
+
+    def _allocate(self, capacity):
+        """Create empty arrays for capacity planes."""
+        return dict((name, numpy.zeros(capacity, dtype))
+                    for name, dtype in self.FIELDS)
+
+    def _grow(self):
+        """Double the capacity, keeping every plane's state."""
+        arrays = self._allocate(self._capacity * 2)
+        for name in arrays:
+            arrays[name][:self._count] = self.arrays[name][:self._count]
+        self.arrays = arrays
+        self._capacity *= 2
+
+    def column(self, name):
+        """Get a field's array for the planes currently in the fleet."""
+        return self.arrays[name][:self._count]
+
+    def add_plane(self, *args, **kw):
+        """Add a plane to the fleet and return its view.
+
+        Takes the same arguments as Airplane."""
+        if self._count >= self._capacity:
+            self._grow()
+        index = self._count
+        for name in self.arrays: # Clear the slot
+            self.arrays[name][index] = 0
+        self._count += 1
+        plane = FleetAirplane(self, index, *args, **kw)
+        self.planes.append(plane)
+        return plane
+
+    def remove_plane(self, plane):
+        """Remove a plane from the fleet.
+
+        The last plane moves into the freed slot."""
+        if plane.fleet is not self:
+            raise ValueError("Plane {} is not in this fleet.".format(
+                plane.id_))
+        index = plane.index
+        last = self._count - 1
+        if index != last:
+            for array in self.arrays.values():
+                array[index] = array[last]
+            moved = self.planes[last]
+            moved._index = index
+            self.planes[index] = moved
+        self.planes.pop()
+        self._count -= 1
+        plane._detach()
+
+    def update(self, tick_duration):
+        """Advance every plane by tick_duration seconds."""
+        step(self.arrays, tick_duration, 0, self._count)
+
+    @classmethod
+    def cell_codes(cls, cell_x, cell_z, cell_y):
+        """Pack cell key arrays into one integer per cell."""
+        offset = cls.CELL_OFFSET
+        return (((cell_x + offset) << 42) | ((cell_z + offset) << 21)
+                | (cell_y + offset))
+
+    def refile(self, grid):
+        """Refile the planes that changed cells in a SpatialGrid.
+
+        Every plane's cell is worked out at once, and the grid is only
+        touched for the planes that moved to another cell."""
+        count = self._count
+        cells = [self.arrays['cell_x'][:count],
+                 self.arrays['cell_z'][:count],
+                 self.arrays['cell_y'][:count]]
+        keys = [self.arrays['x'][:count] // grid.cell_size,
+                self.arrays['z'][:count] // grid.cell_size,
+                self.arrays['altitude'][:count] // grid.cell_height]
+        keys = [key.astype(numpy.int64) for key in keys]
+        changed = ((keys[0] != cells[0]) | (keys[1] != cells[1])
+                   | (keys[2] != cells[2]))
+        for index in numpy.flatnonzero(changed):
+            plane = self.planes[index]
+            if plane in grid:
+                grid.move(plane, (int(keys[0][index]), int(keys[1][index]),
+                                  int(keys[2][index])))
+        for cell, key in zip(cells, keys):
+            cell[:] = key
+
+    def near(self, grid):
+        """Get the slots of the planes near a sprite in a SpatialGrid.
+
+        Uses the cells from the last refile(), and the grid must track
+        near cells."""
+        if not grid.near_keys():
+            return numpy.zeros(0, numpy.int64)
+        if self._near_version != (id(grid), grid.version):
+            keys = numpy.array(list(grid.near_keys()), numpy.int64)
+            self._near_codes = self.cell_codes(
+                keys[:, 0], keys[:, 1], keys[:, 2])
+            self._near_version = (id(grid), grid.version)
+        codes = self.cell_codes(self.column('cell_x'),
+                                self.column('cell_z'),
+                                self.column('cell_y'))
+        return numpy.flatnonzero(numpy.isin(codes, self._near_codes))
+
+
+def step(arrays, tick_duration, start, stop):
+    """Advance the planes in slots start to stop by tick_duration.
+
+    This is the same maths as Airplane.update, one field at a time.
+    """
+    max_speed = Airplane.MAX_SPEED
+    terminal_velocity = Airplane.TERMINAL_VELOCITY
+    planes = slice(start, stop)
+    x = arrays['x'][planes]
+    z = arrays['z'][planes]
+    altitude = arrays['altitude'][planes]
+    heading = arrays['heading'][planes]
+    pitch = arrays['pitch'][planes]
+    speed = arrays['speed'][planes]
+    acceleration = arrays['acceleration'][planes]
+    gravity = arrays['gravity'][planes]
+    throttle = arrays['throttle'][planes]
+    roll_level = arrays['roll_level'][planes]
+    vertical_roll_level = arrays['vertical_roll_level'][planes]
+    health = arrays['health'][planes]
+    autopilot = arrays['autopilot'][planes]
+
+    # remember the previous state for interpolation
+    arrays['previous_x'][planes] = x
+    arrays['previous_z'][planes] = z
+    arrays['previous_altitude'][planes] = altitude
+    arrays['previous_heading'][planes] = heading
+
+    # stall and gravity
+    max_vert_roll = numpy.where(
+        speed <= max_speed / 5,
+        numpy.maximum((speed - max_speed / 10) / (max_speed / 40), 0), 4)
+    gravity += ((((max_speed / 10 - speed)
+                  / max_speed * terminal_velocity)
+                 - (gravity ** 2 / (terminal_velocity ** 2 / 10)))
+                * Airplane.GRAVITY_RATE * tick_duration)
+    gravity[gravity < 0] = 0
+    gravity[altitude <= 0.1] = 0
+
+    # get heading and pitch
+    roll_degrees = ((35/198) * roll_level**3 + (470/99) * roll_level)
+    heading += numpy.radians(roll_degrees) * tick_duration
+    heading %= math.pi * 2
+    numpy.minimum(vertical_roll_level, max_vert_roll,
+                  out=vertical_roll_level)
+    pitch[:] = numpy.radians(vertical_roll_level * 10)
+
+    # acceleration
+    acceleration[:] = (throttle**2 / 250
+                       - speed**2 * 40 / max_speed**2)
+    speed += acceleration * tick_duration
+
+    # move plane
+    hspeed = speed * numpy.cos(pitch) * tick_duration
+    vspeed = (speed * numpy.sin(pitch) - gravity) * tick_duration
+    x += numpy.sin(heading) * hspeed
+    z -= numpy.cos(heading) * hspeed
+    altitude += vspeed
+    altitude[altitude < 0.1] = 0
+
+    # overspeed damage
+    damage = numpy.where(
+        speed > max_speed * 0.75,
+        (speed - max_speed*0.75) ** 2 / (max_speed**2*10) * tick_duration,
+        0)
+    damage += numpy.where(
+        throttle > 75, (throttle - 75) ** 2 / 1000 * tick_duration, 0)
+
+    # autopilot: see if it can be disabled, then center the controls
+    centered = autopilot & (numpy.abs(roll_level) < 0.1)
+    roll_level[centered] = 0
+    arrays['roll_centered'][planes] |= centered
+    centered = autopilot & (numpy.abs(vertical_roll_level) < 0.1)
+    vertical_roll_level[centered] = 0
+    arrays['vertical_roll_centered'][planes] |= centered
+    centered = autopilot & (numpy.abs(50 - throttle) < 1)
+    throttle[centered] = 50
+    arrays['throttle_centered'][planes] |= centered
+    autopilot &= ~(arrays['roll_centered'][planes]
+                   & arrays['vertical_roll_centered'][planes]
+                   & arrays['throttle_centered'][planes])
+    decay = 0.5 ** tick_duration
+    roll_level[autopilot] *= decay
+    vertical_roll_level[autopilot] *= decay
+    throttle[autopilot] = 50 + (throttle[autopilot] - 50) * decay
+
+    # deal damage
+    health -= damage
+
+
+class FleetPosition(object):
+    """The (x, z) position of a plane in a fleet, as a sequence."""
+    def __init__(self, plane):
+        """Initialize the instance."""
+        self._plane = plane
+
+    def __len__(self):
+        """Get the number of coordinates."""
+        return 2
+
+    def __getitem__(self, key):
+        """Get the x (0) or z (1) coordinate."""
+        return self._plane._get_field(('x', 'z')[key])
+
+    def __setitem__(self, key, value):
+        """Set the x (0) or z (1) coordinate."""
+        self._plane._set_field(('x', 'z')[key], value)
+
+    def __iter__(self):
+        """Iterate over the coordinates."""
+        yield self[0]
+        yield self[1]
+
+    def __repr__(self):
+        """Display the position like a list."""
+        return repr(list(self))
+
+
+def _field(name):
+    """Make a property that stores an Airplane attribute in a fleet."""
+    return property(lambda self: self._get_field(name),
+                    lambda self, new_value: self._set_field(
+                        name, new_value))
+
+
+class FleetAirplane(Airplane):
+    """An airplane whose state is stored in a Fleet.
+
+    Works like an Airplane, but its fields live in the fleet's arrays.
+    """
+    def __init__(self, fleet, index, *args, **kw):
+        """Initialize the instance."""
+        self._fleet = fleet
+        self._storage = fleet # Whatever holds the arrays
+        self._index = index
+        super(FleetAirplane, self).__init__(*args, **kw)
+
+    @property
+    def fleet(self):
+        """Get the fleet storing the plane, or None if removed."""
+        return self._fleet
+    @property
+    def index(self):
+        """Get the plane's slot in the fleet."""
+        return self._index
+
+    def _get_field(self, name):
+        """Get a field from the fleet's arrays."""
+        return self._storage.arrays[name][self._index].item()
+
+    def _set_field(self, name, new_value):
+        """Set a field in the fleet's arrays."""
+        self._storage.arrays[name][self._index] = new_value
+
+    def _detach(self):
+        """Copy the plane's state out of the fleet after removal."""
+        state = dict((name, self._get_field(name))
+                     for name, _ in Fleet.FIELDS)
+        self._fleet = None
+        self._storage = _DetachedStorage(state)
+        self._index = 0
+
+    # The private attributes Airplane uses, stored in the fleet
+    @property
+    def _pos(self):
+        """Get the plane's (x, z) position, stored in the fleet."""
+        return FleetPosition(self)
+    @_pos.setter
+    def _pos(self, new_value):
+        """Set the plane's (x, z) position, stored in the fleet."""
+        self._set_field('x', new_value[0])
+        self._set_field('z', new_value[1])
+    _altitude = _field('altitude')
+    _heading = _field('heading')
+    _pitch = _field('pitch')
+    _speed = _field('speed')
+    _acceleration = _field('acceleration')
+    _gravity = _field('gravity')
+    _throttle = _field('throttle')
+    _roll_level = _field('roll_level')
+    _vertical_roll_level = _field('vertical_roll_level')
+    _health = _field('health')
+    @property
+    def _previous_state(self):
+        """Get the state before the last step, stored in the fleet."""
+        return (self._get_field('previous_x'),
+                self._get_field('previous_z'),
+                self._get_field('previous_altitude'),
+                self._get_field('previous_heading'))
+    @_previous_state.setter
+    def _previous_state(self, new_value):
+        """Set the state before the last step, stored in the fleet."""
+        for name, value in zip(('previous_x', 'previous_z',
+                                'previous_altitude', 'previous_heading'),
+                               new_value):
+            self._set_field(name, value)
+    @property
+    def _autopilot_info(self):
+        """Get a copy of the autopilot's state, stored in the fleet."""
+        return {
+            'enabled': self._get_field('autopilot'),
+            'conditions': {
+                'roll-centered': self._get_field('roll_centered'),
+                'vertical-roll-centered': self._get_field(
+                    'vertical_roll_centered'),
+                'throttle-centered': self._get_field('throttle_centered')
+            }
+        }
+    @_autopilot_info.setter
+    def _autopilot_info(self, new_value):
+        """Set the autopilot's state, stored in the fleet."""
+        self._set_field('autopilot', new_value['enabled'])
+        conditions = new_value['conditions']
+        self._set_field('roll_centered', conditions['roll-centered'])
+        self._set_field('vertical_roll_centered',
+                        conditions['vertical-roll-centered'])
+        self._set_field('throttle_centered',
+                        conditions['throttle-centered'])
+
+    @property
+    def autopilot_enabled(self):
+        """Get the plane's autopilot's status."""
+        if not self._get_field('autopilot'):
+            return False
+        else: # See if the autopilot can be disabled
+            if abs(self.roll_level) < 0.1:
+                self.roll_level = 0
+                self._set_field('roll_centered', True)
+            if abs(self.vertical_roll_level) < 0.1:
+                self.vertical_roll_level = 0
+                self._set_field('vertical_roll_centered', True)
+            if abs(50 - self.throttle) < 1:
+                self.throttle = 50
+                self._set_field('throttle_centered', True)
+            if (self._get_field('roll_centered')
+                    and self._get_field('vertical_roll_centered')
+                    and self._get_field('throttle_centered')):
+                self._set_field('autopilot', False)
+            return self._get_field('autopilot')
+    @property
+    def autopilot_on(self):
+        """Get whether the autopilot is on, without changing anything."""
+        return bool(self._get_field('autopilot'))
+
+    def enable_autopilot(self):
+        """Enable the autopilot."""
+        self._set_field('autopilot', True)
+        self._set_field('roll_centered', False)
+        self._set_field('vertical_roll_centered', False)
+        self._set_field('throttle_centered', False)
+
+
+class _DetachedStorage(object):
+    """Holds the last state of a plane removed from its fleet."""
+    def __init__(self, state):
+        """Initialize the instance."""
+        self.arrays = dict((name, numpy.array([value]))
+                           for name, value in state.items())
@@ -0,0 +1,548 @@
+#!/usr/bin/env python
+
+"""The FlightLog class, for reading and analysing flight logs
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Two kinds of logs can be read:
+ -> Flight recordings made with --record (see recorder.py)
+ -> Debug logs, made with --log-to-file --log-level DEBUG
+
+Run this file with some logs to get a summary of each plane's flight:
+    python flightlog.py logs/*.log flight.fdr
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import argparse
+import json
+import mmap
+import os
+import sys
+import zlib
+try:
+    from collections.abc import Mapping
+except ImportError: # Python 2
+    from collections import Mapping
+
+import numpy
+
+import recorder
+from objects import Airplane
+
+
+class _CompressedChunk(Mapping):
+    """A chunk of a compressed flight recording.
+
+    Works like a dictionnary from column names to arrays.  Each column
+    is decompressed the first time it is used, on its own if the
+    recording is version 2 or later.
+    """
+    def __init__(self, data, position, length, rows, columns, version):
+        """Initialize the instance.
+
+        The chunk's stored data is data[position:position + length]."""
+        self._data = data
+        self._position = position
+        self._length = length
+        self._rows = rows
+        self._columns = columns # (name, dtype) in the stored order
+        self._arrays = {}
+        self._parts = None # Each column's (position, length)
+        if version >= 2:
+            self._parts = {}
+            for name, _ in columns:
+                part_length, = recorder.COLUMN.unpack_from(data, position)
+                position += recorder.COLUMN.size
+                self._parts[name] = position, part_length
+                position += part_length
+
+    def __getitem__(self, name):
+        """Get a column's array, decompressing it if needed."""
+        if name not in self._arrays:
+            if self._parts is None: # Every column is in one stream
+                data = zlib.decompress(self._data[
+                    self._position:self._position + self._length])
+                offset = 0
+                for column, dtype in self._columns:
+                    self._arrays[column] = numpy.frombuffer(
+                        data, dtype, self._rows, offset)
+                    offset += self._rows * dtype.itemsize
+            else:
+                position, length = self._parts[name]
+                dtype = dict(self._columns)[name]
+                self._arrays[name] = numpy.frombuffer(zlib.decompress(
+                    self._data[position:position + length]), dtype,
+                    self._rows)
+        return self._arrays[name]
+
+    def __iter__(self):
+        """Iterate over the column names."""
+        return iter([name for name, _ in self._columns])
+
+    def __len__(self):
+        """Get the number of columns."""
+        return len(self._columns)
+
+
+class FlightLog(object):
+    """A flight log, mapped into memory.
+
+    Columns are NumPy arrays with one item per plane per sample, in
+    time order.  For uncompressed flight recordings, they are views
+    of the mapped file, so nothing is copied or parsed; compressed
+    ones are decompressed a column at a time, when it is first used.
+    Debug logs are parsed when opened.
+    """
+    # The debug log's columns for each plane, after the tick
+    TEXT_COLUMNS = ('plane', 'x', 'z', 'altitude', 'speed', 'acceleration',
+                    'vertical_velocity', 'heading', 'roll', 'pitch',
+                    'points', 'damage')
+
+    def __init__(self, path):
+        """Initialize the instance."""
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        try:
+            if not os.fstat(self._file.fileno()).st_size:
+                # Empty files cannot be mapped, and have no rows anyway
+                self.format = 'empty'
+                self.timestep = None
+                self._chunks = []
+            else:
+                self._map = mmap.mmap(self._file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+                if self._map[:len(recorder.MAGIC)] == recorder.MAGIC:
+                    self.format = 'binary'
+                    self._chunks = self._read_binary()
+                else:
+                    self.format = 'text'
+                    self.timestep = None
+                    self._chunks = [self._read_text()]
+        except Exception:
+            self.close()
+            raise
+        self._columns = {}
+        self._layout = None
+        self._rows = None # Each plane's row indexes, if irregular
+
+    def __repr__(self):
+        """Display the log's path, format and size."""
+        return "<FlightLog {} ({}) {} rows>".format(
+            self.path, self.format, len(self))
+
+    def __len__(self):
+        """Get the number of rows."""
+        return sum(len(chunk['plane']) for chunk in self._chunks)
+
+    @property
+    def names(self):
+        """Get the names of the columns."""
+        return list(self._chunks[0]) if self._chunks else []
+
+    def _read_binary(self):
+        """Find the chunks of a flight recording.
+
+        Returns a list of dictionnaries from column names to arrays."""
+        magic, version, schema_length = recorder.HEADER.unpack_from(
+            self._map)
+        if not 1 <= version <= recorder.VERSION:
+            raise ValueError(
+                "{} is version {} of the recording format; only versions "
+                "1 to {} can be read.".format(
+                    self.path, version, recorder.VERSION))
+        position = recorder.HEADER.size
+        schema = json.loads(self._map[
+            position:position + schema_length].decode('utf-8'))
+        position += schema_length
+        self.timestep = schema['timestep']
+        columns = [(name, numpy.dtype(dtype))
+                   for name, dtype in schema['columns']]
+        chunks = []
+        while position + recorder.CHUNK.size <= len(self._map):
+            rows, length = recorder.CHUNK.unpack_from(self._map, position)
+            position += recorder.CHUNK.size
+            if position + length > len(self._map):
+                break # Cut off, like if the recorder was not closed
+            if schema['compressed']:
+                chunk = _CompressedChunk(self._map, position, length, rows,
+                                         columns, version)
+            else: # Straight from the file
+                chunk = {}
+                offset = position
+                for name, dtype in columns:
+                    chunk[name] = numpy.frombuffer(
+                        self._map, dtype, rows, offset)
+                    offset += rows * dtype.itemsize
+            chunks.append(chunk)
+            position += length
+        return chunks
+
+    def _read_text(self):
+        """Parse the plane rows of a debug log.
+
+        Returns a dictionnary from column names to arrays."""
+        values = []
+        ticks = []
+        times = []
+        plane_count = 0
+        day = 0 # Log times are only hours, minutes and seconds
+        last_time = None
+        for line in iter(self._map.readline, b''):
+            fields = line.decode('utf-8', 'replace').rstrip().split('\t')
+            if len(fields) < 2 or not fields[0].endswith('DEBUG'):
+                continue
+            message = fields[1:]
+            if message[0] == 'TIME': # Headings; a new game started
+                plane_count = sum(field.startswith('PLN-')
+                                  for field in message)
+                continue
+            elif not message[0].isdigit():
+                continue
+            hours, minutes, seconds = fields[0].split()[0].split(':')
+            time = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+            if last_time is not None and time + day < last_time:
+                day += 86400 # Past midnight
+            last_time = time + day
+            size = len(self.TEXT_COLUMNS)
+            for index in range(plane_count):
+                plane = message[1 + index * size:1 + (index + 1) * size]
+                if len(plane) < size:
+                    break
+                ticks.append(int(message[0]))
+                times.append(last_time)
+                values.append([float(value) for value in plane])
+        values = numpy.array(values, dtype=numpy.float64).reshape(
+            -1, len(self.TEXT_COLUMNS))
+        columns = {
+            'tick': numpy.array(ticks, dtype=numpy.int64),
+            'time': numpy.array(times, dtype=numpy.float64),
+        }
+        for index, name in enumerate(self.TEXT_COLUMNS):
+            columns[name] = values[:, index]
+        for name in ('plane', 'points'):
+            columns[name] = columns[name].astype(numpy.int32)
+        columns['health'] = 100 - columns.pop('damage')
+        if len(columns['time']):
+            columns['time'] -= columns['time'][0]
+        return columns
+
+    def chunks(self):
+        """Get a dictionnary from column names to arrays for each chunk.
+
+        For uncompressed recordings, the arrays are always views of the
+        file.  Debug logs are one chunk.  Going through the chunks
+        needs less memory than joining whole columns."""
+        return list(self._chunks)
+
+    def column(self, name):
+        """Get every row's value for a column.
+
+        The array is a view of the file if the log is one uncompressed
+        chunk; otherwise the chunks are joined into a new array."""
+        if name not in self._columns:
+            if len(self._chunks) == 1:
+                self._columns[name] = self._chunks[0][name]
+            else:
+                self._columns[name] = numpy.concatenate(
+                    [chunk[name] for chunk in self._chunks])
+        return self._columns[name]
+
+    def planes(self):
+        """Get the IDs of the planes in the log, in the order logged."""
+        if not self._chunks:
+            return []
+        if self._layout is None:
+            ids = self.column('plane')
+            _, first = numpy.unique(ids, return_index=True)
+            order = ids[numpy.sort(first)]
+            # If every sample has the same planes in the same order,
+            # each plane's rows are evenly spaced
+            count = len(order)
+            regular = (count > 0 and len(ids) % count == 0 and numpy.all(
+                ids.reshape(-1, count) == order))
+            self._layout = [int(id_) for id_ in order], bool(regular)
+            if not regular: # Group the rows by plane once for all
+                rows = numpy.argsort(ids, kind='mergesort')
+                sorted_ids, starts = numpy.unique(ids[rows],
+                                                  return_index=True)
+                self._rows = dict(zip(
+                    (int(id_) for id_ in sorted_ids),
+                    numpy.split(rows, starts[1:])))
+        return list(self._layout[0])
+
+    def plane(self, plane_id):
+        """Get a dictionnary from column names to a plane's values.
+
+        If every sample has the same planes, the arrays are strided
+        views of the columns; otherwise they are copies."""
+        order = self.planes()
+        if plane_id not in order:
+            raise KeyError("No plane {} in {}.".format(plane_id, self.path))
+        if self._layout[1]:
+            rows = slice(order.index(plane_id), None, len(order))
+        else:
+            rows = self._rows[plane_id]
+        return dict((name, self.column(name)[rows]) for name in self.names)
+
+    def plane_chunks(self, plane_id):
+        """Iterate over a plane's values, one chunk at a time.
+
+        Yields dictionnaries like plane's, for each chunk with rows of
+        the plane, without joining the chunks' columns."""
+        order = self.planes()
+        if plane_id not in order:
+            raise KeyError("No plane {} in {}.".format(plane_id, self.path))
+        start = 0 # The chunk's first row in the whole log
+        for chunk in self._chunks:
+            count = len(chunk['plane'])
+            if self._layout[1]:
+                rows = slice((order.index(plane_id) - start) % len(order),
+                             None, len(order))
+            else:
+                plane_rows = self._rows[plane_id]
+                rows = plane_rows[numpy.searchsorted(plane_rows, start):
+                                  numpy.searchsorted(plane_rows,
+                                                     start + count)] - start
+            start += count
+            part = dict((name, chunk[name][rows]) for name in chunk)
+            if len(part['plane']):
+                yield part
+
+    def close(self):
+        """Unmap and close the log."""
+        self._chunks = []
+        self._columns = {}
+        self._rows = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass # Arrays still use it; it goes away with them
+            self._map = None
+        self._file.close()
+
+
+def warning_conditions(plane):
+    """Work out when each cockpit warning was on.
+
+    plane is a dictionnary from column names to a plane's values, like
+    from FlightLog.plane.  Uses the same tests as
+    Client.calculate_warnings, except the altitude warning, which needs
+    the objectives.
+    Returns a dictionnary from warning names to boolean arrays."""
+    speed = plane['speed']
+    altitude = plane['altitude']
+    if 'roll_level' in plane: # Like Airplane.roll_degrees
+        roll = ((35/198) * plane['roll_level']**3
+                + (470/99) * plane['roll_level'])
+    else:
+        roll = numpy.degrees(plane['roll'])
+    if 'gravity' in plane:
+        vertical = speed * numpy.sin(plane['pitch']) - plane['gravity']
+    else: # Debug logs leave out gravity
+        vertical = plane['vertical_velocity']
+    warnings = {
+        'stall': (speed < Airplane.MAX_SPEED * 0.2) & (altitude != 0),
+        'overspeed': speed > Airplane.MAX_SPEED * 0.75,
+        'bank_angle': numpy.abs(roll) >= 30,
+        'pullup': (altitude <= 1000) & (vertical <= -20),
+        'terrain': (altitude <= 500) & (speed > Airplane.MAX_SPEED * 0.3),
+    }
+    return warnings
+
+
+def analyse(plane):
+    """Sum up a plane's flight.
+
+    plane is a dictionnary from column names to a plane's values, like
+    from FlightLog.plane, or an iterable of such dictionnaries for
+    consecutive parts of the flight, like from FlightLog.plane_chunks.
+    Returns a dictionnary of statistics; rates are per minute,
+    warning counts are how many times each warning came on, and
+    'autopilot' is the fraction of the time the autopilot was on (None
+    if the log does not say)."""
+    parts = [plane] if isinstance(plane, dict) else plane
+    samples = 0
+    first = None # The first row's time and points
+    last = None # The last row's values so far, to go on from
+    reached = [] # When objectives were reached
+    damage = 0
+    warnings = {} # The samples each warning was on and how often it came on
+    autopilot = None
+    for part in parts:
+        time = part['time']
+        if not len(time):
+            continue
+        # Objectives are reached when the points go up
+        points = part['points']
+        if last is not None and points[0] > last['points']:
+            reached.append(time[:1])
+        reached.append(time[numpy.flatnonzero(numpy.diff(points) > 0) + 1])
+        # Damage only counts when health goes down
+        health = part['health']
+        health_change = numpy.diff(health)
+        damage += float(numpy.abs(health_change[health_change < 0]).sum())
+        conditions = warning_conditions(part)
+        for name, condition in conditions.items():
+            total = warnings.setdefault(name, [0, 0])
+            total[0] += int(numpy.count_nonzero(condition))
+            total[1] += int(numpy.count_nonzero(
+                condition[1:] & ~condition[:-1]))
+        if last is None:
+            first = float(time[0]), int(points[0])
+        else:
+            damage += max(last['health'] - float(health[0]), 0)
+            for name, condition in conditions.items():
+                if condition[0] and not last['warnings'][name]:
+                    warnings[name][1] += 1
+        if 'autopilot' in part:
+            autopilot = (autopilot or 0) + int(numpy.count_nonzero(
+                part['autopilot']))
+        samples += len(time)
+        last = {
+            'time': float(time[-1]),
+            'points': int(points[-1]),
+            'health': float(health[-1]),
+            'warnings': dict((name, bool(condition[-1]))
+                             for name, condition in conditions.items()),
+        }
+    duration = last['time'] - first[0] if samples else 0
+    minutes = duration / 60
+    objective_times = numpy.diff(numpy.concatenate(
+        [first[:1]] + reached)) if samples else numpy.zeros(0)
+    points_gained = last['points'] - first[1] if samples else 0
+    return {
+        'samples': samples,
+        'duration': duration,
+        'points': points_gained,
+        'score-rate': points_gained / minutes if minutes else 0,
+        'objectives': len(objective_times),
+        'time-to-objective': (float(objective_times.mean())
+                              if len(objective_times) else None),
+        'first-objective': (float(objective_times[0])
+                            if len(objective_times) else None),
+        'damage': damage,
+        'damage-rate': damage / minutes if minutes else 0,
+        'warnings': dict((name, {
+            'fraction': on / samples,
+            'count': starts,
+            'rate': starts / minutes if minutes else 0,
+        }) for name, (on, starts) in warnings.items()),
+        'autopilot': autopilot / samples if autopilot is not None else None,
+    }
+
+
+def combine(results):
+    """Combine the statistics from several calls to analyse."""
+    duration = sum(result['duration'] for result in results)
+    minutes = duration / 60
+    points = sum(result['points'] for result in results)
+    damage = sum(result['damage'] for result in results)
+    objectives = sum(result['objectives'] for result in results)
+    objective_time = sum(result['time-to-objective'] * result['objectives']
+                         for result in results if result['objectives'])
+    warnings = {}
+    for result in results:
+        for name, warning in result['warnings'].items():
+            total = warnings.setdefault(
+                name, {'fraction': 0, 'count': 0, 'rate': 0})
+            total['fraction'] += warning['fraction'] * result['duration']
+            total['count'] += warning['count']
+    for warning in warnings.values():
+        warning['fraction'] = warning['fraction'] / duration if duration else 0
+        warning['rate'] = warning['count'] / minutes if minutes else 0
+    # Only the logs that say when the autopilot was on count for it
+    autopilot = [result for result in results
+                 if result.get('autopilot') is not None]
+    autopilot_duration = sum(result['duration'] for result in autopilot)
+    autopilot_time = sum(result['autopilot'] * result['duration']
+                         for result in autopilot)
+    return {
+        'samples': sum(result['samples'] for result in results),
+        'duration': duration,
+        'points': points,
+        'score-rate': points / minutes if minutes else 0,
+        'objectives': objectives,
+        'time-to-objective': (objective_time / objectives
+                              if objectives else None),
+        'first-objective': None,
+        'damage': damage,
+        'damage-rate': damage / minutes if minutes else 0,
+        'warnings': warnings,
+        'autopilot': (autopilot_time / autopilot_duration
+                      if autopilot_duration else None),
+    }
+
+
+def report(name, result):
+    """Get a human-readable summary of a result from analyse."""
+    lines = ["{}: {:.1f} s, {} samples".format(
+        name, result['duration'], result['samples'])]
+    lines.append("  Score: {} points ({:.2f} per minute)".format(
+        result['points'], result['score-rate']))
+    if result['objectives']:
+        lines.append("  Time to objective: {:.1f} s average".format(
+            result['time-to-objective']))
+    lines.append("  Damage: {:.1f} ({:.2f} per minute)".format(
+        result['damage'], result['damage-rate']))
+    if result.get('autopilot') is not None:
+        lines.append("  Autopilot: on {:.1%} of the time".format(
+            result['autopilot']))
+    for warning_name, warning in sorted(result['warnings'].items()):
+        lines.append(
+            "  {} warning: on {:.1%} of the time, {} times "
+            "({:.2f} per minute)".format(
+                warning_name, warning['fraction'], warning['count'],
+                warning['rate']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """Summarize the flight logs named on the command line."""
+    parser = argparse.ArgumentParser(
+        description='Summarize flight recordings and debug logs.')
+    parser.add_argument('logs', nargs='+', metavar='LOG',
+                        help='a flight recording or debug log')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+    results = {}
+    for path in args.logs:
+        log = FlightLog(path)
+        try:
+            if not log.planes():
+                print("{} has no planes; skipping it.".format(path),
+                      file=sys.stderr)
+            for plane_id in log.planes():
+                results["{} PLN-{}".format(path, plane_id)] = analyse(
+                    log.plane_chunks(plane_id))
+        finally:
+            log.close()
+    if len(results) > 1:
+        results['TOTAL'] = combine(list(results.values()))
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        for name, result in results.items():
+            print(report(name, result))
+
+
+if __name__ == '__main__':
+    main()
@@ -24,17 +24,25 @@ from __future__ import division, print_function
 
 import argparse
 import datetime
-import io
 import json
 import logging
+import logging.handlers
 import math
+import multiprocessing.pool
 import os
 import sys
 import time
-import zipfile
 
 import pygame
 
+import assets
+import hud
+from atlas import RotationAtlas
+from cache import LRUCache
+from logqueue import LogQueue
+from pack import ResourcePack, build_pack
+from profiler import FrameProfiler
+from replay import InputRecorder, Replay
 from __init__ import __version__
 
 class Client(pygame.rect.Rect):
@@ -45,6 +53,8 @@ class Client(pygame.rect.Rect):
     LOG_PATH = os.path.join(PATH, "logs")
     DEFAULT_SIZE = (1280, 960)
     DEFAULT_ASPECT_RATIO = DEFAULT_SIZE[0] / DEFAULT_SIZE[1]
+    # Frequency, sample size, channels and buffer size of the mixer
+    MIXER_SETTINGS = (44100, -16, 2, 2048)
     NEXT_ID = 0 # The next unused ID for this class
     EXIT_TITLES = (
         "UNEXPECTED",
@@ -86,7 +96,8 @@ Your score was {}.",
             'throttle-100': -1,
             'autopilot': pygame.K_a,
             'pause': pygame.K_p,
-            'quit': pygame.K_ESCAPE
+            'quit': pygame.K_ESCAPE,
+            'profiler': pygame.K_F12
         }
     }
     INSTRUCTIONS_TEXT = """\
@@ -110,7 +121,7 @@ Be careful of your falling speed, or you may crash!
         'horiz-', 'horiz+', 'vert-', 'vert+',
         'throttle+', 'throttle-', 'throttle-0', 'throttle-25',
         'throttle-50', 'throttle-75', 'throttle-100',
-        'autopilot', 'pause', 'quit',
+        'autopilot', 'pause', 'quit', 'profiler',
     ]
     DEFAULT_CONTROLS = DEFAULT_OPTIONS['controls']
     CONTROL_NAMES = {
@@ -128,8 +139,31 @@ Be careful of your falling speed, or you may crash!
         'autopilot': "Autopilot",
         'pause': "Pause",
         'quit': "Quit",
+        'profiler': "Profiler",
     }
     FPS_OPTIONS = [1, 5, 10, 20, 30, 60, float('inf')]
+    TEXT_CACHE_SIZE = 512 # Rendered strings to keep
+    ATTITUDE_MAX_ROLL = 45 # Degrees the attitude tape is rotated to
+    ATTITUDE_MAX_PITCH = 45 # Degrees of pitch the attitude tape covers
+    SCALE_CACHE_SIZE = 4 # Window sizes to keep scaled images and fonts for
+    RESIZE_DELAY = 0.1 # Seconds the window size must settle for
+    IDLE_TIMEOUT = 1 # Most seconds to wait for events on idle screens
+    MAX_FRAME_TIME = 0.25 # Most seconds of control input in one frame
+    ASSET_THREADS = 4 # Threads decoding images and sounds
+    LOG_QUEUE_SIZE = 4096 # Log records waiting to be written
+    LOG_BATCH_SIZE = 64 # Log records written at once
+    LOG_MAX_BYTES = 16 * 1024 * 1024 # Size of a log file before rotating
+    LOG_BACKUPS = 4 # Rotated log files to keep
+    PROFILE_FRAMES = 3600 # Frames the profiler keeps
+    PROFILE_REFRESH = 0.5 # Seconds between profiler overlay updates
+    STAGE_IMAGES = { # The images each stage needs before it starts
+        0: ['logo', 'logotext', 'titleprompt'],
+        1: ['attitudetape-bg', 'attitudetape-overlay', 'attitudecrosshair',
+            'navcircle', 'navmarker', 'objectivemarker', 'msg_apengaged',
+            'msg_apdisconnect'],
+    }
+    # The images drawn from a RotationAtlas
+    ROTATED_IMAGES = ['navmarker', 'attitudetape-bg', 'attitudetape-overlay']
     UNITS = ( # The unit sets
         {
             'name': "SI", # Set name
@@ -176,12 +210,22 @@ Be careful of your falling speed, or you may crash!
         """Initializes the instance. Does not start the game."""
         super(Client, self).__init__(0, 0, *window_size)
         # Finds a folder if possible, otherwise tries a zip archive
+        self.pack_path = os.path.join(self.PATH, "resources.pack")
         if "resources" in os.listdir(self.PATH):
             self.resources_path = os.path.join(self.PATH, "resources")
         elif "resources.zip" in os.listdir(self.PATH):
             self.resources_path = os.path.join(self.PATH, "resources.zip")
+        elif os.path.exists(self.pack_path): # Only the pack is needed
+            self.resources_path = None
         else: raise Exception("Resources not found!")
+        if self.resources_path is not None:
+            self.resources = assets.get_provider(self.resources_path)
+        else: self.resources = None
+        self.pack = None
         self.clock = pygame.time.Clock() # Controls ticking
+        self.text_cache = LRUCache(self.TEXT_CACHE_SIZE)
+        self.image_cache = LRUCache(self.SCALE_CACHE_SIZE)
+        self.font_cache = LRUCache(self.SCALE_CACHE_SIZE)
         # Gets a player ID
         if player_id is None:
             self._id = Client.NEXT_ID
@@ -199,19 +243,60 @@ Be careful of your falling speed, or you may crash!
             '--log-level', default='WARNING',
             choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
             help='the least important log item type to display')
+        self.parser.add_argument(
+            '--tick-rate', type=float, default=None,
+            help='the number of physics steps per second')
+        self.parser.add_argument(
+            '--headless', action='store_true',
+            help='simulate without a display or audio, as fast as possible')
+        self.parser.add_argument(
+            '--ticks', type=int, default=None,
+            help='the most physics steps to simulate in headless mode '
+            '(default: 36000, or the whole replay)')
+        self.parser.add_argument(
+            '--build-pack', action='store_true',
+            help='pack the resources into resources.pack and exit')
+        self.parser.add_argument(
+            '--no-pack', action='store_true',
+            help='load the resources even if there is a resources.pack')
+        self.parser.add_argument(
+            '--rotation-step', type=float, default=1,
+            help='the angle in degrees between pre-rotated images')
+        self.parser.add_argument(
+            '--record', metavar='FILE', default=None,
+            help='record every plane\'s state after every tick to FILE')
+        self.parser.add_argument(
+            '--record-uncompressed', action='store_true',
+            help='do not compress the flight recording')
+        self.parser.add_argument(
+            '--record-inputs', metavar='FILE', default=None,
+            help='record the controls to FILE, so the flight can be replayed')
+        self.parser.add_argument(
+            '--replay', metavar='FILE', default=None,
+            help='replay a flight recorded with --record-inputs')
+        self.parser.add_argument(
+            '--replay-speed', type=float, default=1,
+            help='how many times faster than real time to show a replay')
+        self.parser.add_argument(
+            '--profile', metavar='FILE', default=None,
+            help='save how long each part of each frame took to FILE on '
+            'exit, as CSV if it ends in .csv or else as JSON')
         self.args = self.parser.parse_args()
         # Handles command line arguments
         if self.args.version:
             print("Slight Fimulator v{}".format(__version__))
             sys.exit()
         self.log_to_file = self.args.log_to_file
+        self.rotation_step = self.args.rotation_step
         self.log_level = getattr(logging, self.args.log_level)
         # Gets controls
         if os.path.exists("{}/.options.json".format(self.PATH)):
             # options file found - use these
             with open("{}/.options.json".format(self.PATH), 'rt') as f:
                 prefs = json.load(f)
-                self.controls = prefs['controls']
+                # Controls added since the file was saved get defaults
+                self.controls = self.DEFAULT_CONTROLS.copy()
+                self.controls.update(prefs['controls'])
                 self.music_enabled = prefs['music']
                 self.sound_enabled = prefs['sound']
                 self.unit_id = prefs['units']
@@ -233,50 +318,65 @@ Be careful of your falling speed, or you may crash!
     @stage.setter
     def stage(self, new_value):
         """Set the stage variable to change the stage."""
+        self.prepare_stage_images(new_value)
         self.GAME_STAGES[new_value](self)
         self._stage = new_value
+        self.redraw = True
+    @property
+    def idle(self):
+        """Get whether the screen only changes when something happens.
+
+        That is every screen but the main one, which is idle while
+        paused."""
+        return self.stage != 1 or bool(self.paused)
     @property
     def exit_code(self):
         """Return the exit code."""
-        if self.plane.health <= 0:
-            return 5 # Overstressed the aircraft
-        elif (self.plane.points >= self.airspace.POINTS_REQUIRED
-              and self.plane.altitude <= 0):
-            return 1 # You Won!
-        # position-related exit
-        if self.plane.altitude > self.airspace.MAX_ALTITUDE:
-            return 6
-        elif (self.plane.altitude <= 0
-              and self.plane.total_vertical_velocity < -20):
-            return 3
-        elif not self.airspace.in_bounds(self.plane, False):
-            return 4
+        return self.airspace.get_exit_code(self.plane)
 
     def mainloop(self, airspace):
         """The game's loop."""
-        # Setup Pygame
+        start_time = time.time()
+        self.start_logging()
+        # Setup Pygame; the mixer must be set up before the pack opens
+        pygame.mixer.pre_init(*self.MIXER_SETTINGS)
         pygame.init()
+        pygame.mixer.init()
         self.screen = pygame.display.set_mode(self.size, pygame.RESIZABLE)
         pygame.display.set_caption(
             "Slight Fimulator v{}".format(__version__))
         # Setup resources
         self.load_resources()
-        pygame.mixer.pre_init(44100, -16, 2, 2048)
-        pygame.mixer.init()
         if not self.music_enabled:
             pygame.mixer.music.set_volume(0)
+        self.preload_resources()
         self.scale_images()
         self.scale_buttons()
+        self.hud = hud.DirtyRectRenderer()
         # Setup airspace
         self.airspace = airspace
+        if self.args.tick_rate is not None:
+            self.airspace.clock.tick_rate = self.args.tick_rate
+        self.input_recorder = None
+        self.replay = None
+        self.replay_time = 0 # Replay time not yet stepped through
+        if self.args.replay is not None:
+            self.replay = Replay(self.args.replay)
+            self.airspace.clock.tick_rate = self.replay.tick_rate
+            self.airspace.reseed(self.replay.seed)
+        elif self.args.record_inputs is not None:
+            self.input_recorder = InputRecorder(
+                self.args.record_inputs, self.airspace.clock.tick_rate,
+                self.id_, self.airspace.seed)
+        self.recorder = self.start_recording(self.airspace)
         self.airspace_rect = pygame.rect.Rect(
             self.size[0]*7/16, self.size[1]/24,
             self.size[0]*35/64, self.size[1]*35/48)
         # Setup plane and objective
         self.plane = self.airspace.add_plane(player_id=self.id_)
         self.airspace.generate_objective()
-        for obj in self.airspace.objectives: # Get closest objective
-            self.closest_objective = obj
+        self.closest_objective = self.airspace.nearest_objectives(
+            self.plane)[0]
         # Makes a list of length [# of keys registered by Pygame + 1]
         # The +1 is so key # -1 registers nothing
         self.keys_held = [0] * (len(pygame.key.get_pressed()) + 1)
@@ -327,26 +427,79 @@ Be careful of your falling speed, or you may crash!
         self.event_toggletext = pygame.USEREVENT + 2
         pygame.time.set_timer(self.event_toggletext, 333)
 
+        self.resize_to = None # The size to resize to once it settles
+        self.resize_time = 0
+
+        self.profiler = FrameProfiler(self.PROFILE_FRAMES)
+        self.show_profiler = False
+        self.profiler_overlay = None # The overlay's image
+        self.profiler_overlay_time = 0 # When it was made
+
         # Game loop
         self.done = False
+        self.first_frame_time = None
+        self.redraw = True # Whether idle screens need drawing
         while not self.done:
-            self.clock.tick(self.max_fps) # Handles FPS
+            self.profiler.start_frame()
+            if self.idle:
+                draw = self.wait_for_events()
+            else:
+                self.clock.tick(self.max_fps) # Handles FPS
+                self.profiler.mark('wait')
+                self.events = pygame.event.get() # Gets events
+                draw = True
             self.fps = self.clock.get_fps() # Stores FPS in a variable
-            self.events = pygame.event.get() # Gets events
-            self.screen.fill(self.colors['background'])
-            self.GAME_LOOPS[self.stage](self) # Runs the correct loop
+            self.frame_time = min(self.clock.get_time() / 1000,
+                                  self.MAX_FRAME_TIME)
+            self.profiler.mark('events')
+            if draw:
+                self.GAME_LOOPS[self.stage](self) # Runs the correct loop
+            self.profiler.mark('other')
+            if draw and self.show_profiler and self.stage != 1:
+                # The main screen draws it with the HUD instead
+                overlay = self.profiler_widget()
+                overlay[3]()
+                pygame.display.update(overlay[2])
+                self.profiler.mark('profiler')
+            if self.first_frame_time is None:
+                self.first_frame_time = time.time() - start_time
             for event in self.events:
                 if event.type == pygame.QUIT or self.stage == 'END':
                     self.done = True
                 elif event.type == pygame.KEYDOWN:
                     if event.key == self.controls['quit']:
                         self.done = True
+                    elif event.key == self.controls['profiler']:
+                        self.show_profiler = not self.show_profiler
+                        self.redraw = True
                 elif event.type == pygame.VIDEORESIZE:
-                    self.update_screen_size(event.size)
+                    # Wait for the size to settle before rescaling
+                    self.resize_to = event.size
+                    self.resize_time = time.time()
+                    self.hud.redraw_all()
+            if (self.resize_to is not None and time.time()
+                    - self.resize_time >= self.RESIZE_DELAY):
+                self.update_screen_size(self.resize_to)
+                self.resize_to = None
+                self.redraw = True
+            self.profiler.mark('other')
+            self.profiler.end_frame()
         # This runs when the program is finished running
         pygame.quit() # Exits Pygame
-        if self.resources_path.endswith('.zip'): # Close Zip
+        self.asset_pool.terminate()
+        logging.info("Time to first frame: %.3f s", self.first_frame_time)
+        logging.info("Text cache: %i hits, %i misses",
+                     self.text_cache.hits, self.text_cache.misses)
+        if self.args.profile is not None:
+            self.profiler.export(self.args.profile)
+        if self.resources is not None:
             self.resources.close()
+        if self.pack is not None:
+            self.pack.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.stop_input_recording()
+        self.log_queue.stop()
         # Save preferences
         preferences = {
             'music': self.music_enabled,
@@ -358,71 +511,116 @@ Be careful of your falling speed, or you may crash!
         with open('{}/.options.json'.format(self.PATH), 'wt') as f:
             json.dump(preferences, f)
 
+    def start_recording(self, airspace):
+        """Start recording an airspace if --record was given.
+
+        Returns the recorder, which must be closed, or None."""
+        if self.args.record is None:
+            return None
+        from recorder import FlightRecorder # Needs NumPy
+        recorder = FlightRecorder(
+            self.args.record, airspace.clock.timestep,
+            compress=not self.args.record_uncompressed)
+        airspace.recorders.append(recorder)
+        return recorder
+
+    def stop_input_recording(self):
+        """Finish recording the controls, if they are being recorded.
+
+        Only one flight is recorded, so this happens when it ends."""
+        if self.input_recorder is not None:
+            self.input_recorder.close(self.plane, self.airspace.clock.ticks)
+            self.input_recorder = None
+
+    def wait_for_events(self):
+        """Get the events on an idle screen.
+
+        Unless the screen needs drawing, waits for an event (timers
+        like event_toggletext count) instead of ticking at max_fps.
+        Returns whether to run the stage's loop."""
+        if self.redraw:
+            self.events = pygame.event.get()
+        else:
+            timeout = self.IDLE_TIMEOUT
+            if self.resize_to is not None: # Wake up to rescale
+                timeout = self.RESIZE_DELAY - (time.time() - self.resize_time)
+            event = pygame.event.wait(max(int(timeout * 1000), 1))
+            self.events = [] if event.type == pygame.NOEVENT else [event]
+            self.events += pygame.event.get()
+        self.clock.tick() # Keeps the frame time right
+        self.profiler.mark('wait')
+        draw = self.redraw or any(event.type != pygame.MOUSEMOTION
+                                  for event in self.events)
+        # Loops handle events after drawing, so show their effects
+        self.redraw = draw and bool(self.events)
+        return draw
+
     def reset(self):
         """Resets the game for another play."""
         self.airspace.remove_plane(self.id_)
-        for obj in self.airspace.objectives:
-            self.airspace.objectives.remove(obj)
+        self.airspace.clear_objectives()
         self.plane = self.airspace.add_plane(player_id=self.id_)
         self.airspace.generate_objective()
-        for obj in self.airspace.objectives: # Get closest objective
-            self.closest_objective = obj
+        self.closest_objective = self.airspace.nearest_objectives(
+            self.plane)[0]
 
-    def prepare_log(self):
-        """Prepare the log."""
+    def start_logging(self):
+        """Send log records to stdout or a log file.
+
+        Records are written by a background thread, so the game never
+        waits for them.  Log files are rotated when they get too big."""
+        warn = False
         if not self.log_to_file: # Settings for output logging
-            logging.basicConfig(
-                datefmt="%H:%M:%S", format=
-                "%(asctime)s    %(levelname)s\t%(message)s",
-                level=self.log_level)
+            target = logging.StreamHandler(sys.stdout)
         else: # Settings for file logging
-            warn = False
             if not os.path.isdir(self.LOG_PATH):
                 # If no logging directory, create one
                 os.makedirs(self.LOG_PATH)
                 warn = True
-            logging.basicConfig(
-                datefmt="%H:%M:%S", level=self.log_level,
-                format="%(asctime)s    %(levelname)s\t%(message)s",
-                filename=os.path.join(
-                    self.LOG_PATH, "{}.log".format(
-                        datetime.datetime.now().strftime(
-                            "%Y-%m-%d-%H-%M-%S"))))
-            if warn: # If a logging directory was created, warn the user
-                logging.warning(
-                    "No logging directory found, created directory %s",
-                    os.path.abspath(self.LOG_PATH))
-
-        # If on debug mode, log headings
+            target = logging.handlers.RotatingFileHandler(
+                os.path.join(self.LOG_PATH, "{}.log".format(
+                    datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S"))),
+                maxBytes=self.LOG_MAX_BYTES, backupCount=self.LOG_BACKUPS)
+        target.setFormatter(logging.Formatter(
+            "%(asctime)s    %(levelname)s\t%(message)s", "%H:%M:%S"))
+        logging.getLogger().setLevel(self.log_level)
+        self.log_queue = LogQueue(target, self.LOG_QUEUE_SIZE,
+                                  self.LOG_BATCH_SIZE)
+        self.log_queue.start()
+        if warn: # If a logging directory was created, warn the user
+            logging.warning(
+                "No logging directory found, created directory %s",
+                os.path.abspath(self.LOG_PATH))
+
+    def prepare_log(self):
+        """Log the headings of the debug log."""
+        if not logging.getLogger().isEnabledFor(logging.DEBUG):
+            return
         output = []
         # first row labels
         output.append("TIME\t")
-        for plane_id in range(len(self.airspace.planes)):
+        for plane_id in self.airspace.planes.ids():
             output.append("PLN-%i\t\t\t\t\t\t\t\t\t\t\t\t" % plane_id)
-        for objective_id in range(len(self.airspace.objectives)):
+        for objective_id in self.airspace.objectives.ids():
             output.append("OBJ-%i\t\t\t" % objective_id)
         logging.debug(''.join(output))
         output = []
         # second row labels - tick 0 stats
         output.append("TICK:\t")
-        for plane_id in range(len(self.airspace.planes)):
-            for plane in self.airspace.planes:
-                if plane.id_ == plane_id:
-                    output.append(plane.LABELS)
-                    break
-        for objective_id in range(len(self.airspace.objectives)):
-            for objective in self.airspace.objectives:
-                if objective.id_ == objective_id:
-                    output.append(objective.LABELS)
-                    break
+        for plane in self.airspace.planes.ordered():
+            output.append(plane.LABELS)
+        for objective in self.airspace.objectives.ordered():
+            output.append(objective.LABELS)
         logging.debug(''.join(output)) # Log it!
 
     def load_resources(self):
         """Load the game's resources. Compatible with zips.
 
         Images, Sounds, Colors and Fonts use Pygame Objects.
-        Music uses filepaths/file objects (both compatible with
-        pygame.mixer.music.load)
+        Images and Sounds are only loaded when first used.
+        Music uses resource paths, for Client.play_music.
+        If there is a resources.pack (see --build-pack), everything
+        comes from it instead.
 
         Directory Layout:
 
@@ -442,72 +640,133 @@ Be careful of your falling speed, or you may crash!
         Blank lines are also ignored
         """
         # Create dictionnaries to put the resources in
-        self.images = {}
-        self.sounds = {}
+        self.image_files = {}
+        self.sound_files = {}
         self.music_files = {}
-        self.colors = {}
         self.fonts = {}
-        self.font_data = {}
-        images_path = os.path.join(self.resources_path, "Images")
-        for image_name in os.listdir(images_path): # Load Images
-            image_file = os.path.join(images_path, image_name)
-            image_name = image_name.split('.')[0]
-            image = pygame.image.load(image_file)
-            self.images[image_name] = image
-        sounds_path = os.path.join(self.resources_path, "Sounds")
-        for sound_name in os.listdir(sounds_path): # Load Sounds
-            sound_file = os.path.join(sounds_path, sound_name)
-            sound_name = sound_name.split('.')[0]
-            sound = pygame.mixer.Sound(sound_file)
-            self.sounds[sound_name] = sound
-        music_path = os.path.join(self.resources_path, "Music")
-        for music_name in os.listdir(music_path): # Load Music
-            music_file = os.path.join(music_path, music_name)
-            music_name = music_name.split('.')[0]
-            self.music_files[music_name] = music_file
-        if "colors.txt" in os.listdir(self.resources_path):
-            colors_file = open(os.path.join(
-                self.resources_path, "colors.txt"), 'rt')
-        elif "colours.txt" in os.listdir(self.resources_path):
-            colors_file = open(os.path.join(
-                self.resources_path, "colours.txt"), 'rt')
-        else: colors_file = None
-        if colors_file != None: # Load Colours
-            for line in colors_file.readlines():
-                if line.strip() == '':
-                    continue
-                elif line.strip()[0] == '#':
-                    continue
-                colorname, color = line.split('=')
-                colorname = colorname.strip()
-                color = pygame.color.Color(color.strip())
-                self.colors[colorname] = color
-            colors_file.close()
+        if (not self.args.no_pack and os.path.exists(self.pack_path)
+                and self.open_pack()):
+            # Everything is ready to use in the pack
+            self.images = assets.LazyDict(
+                self.pack.load_image, sorted(self.pack.images))
+            self.sounds = assets.LazyDict(
+                self.pack.load_sound, sorted(self.pack.sounds))
+            self.music_files = dict(
+                (music_name, music_name) for music_name in self.pack.music)
+            self.colors = self.pack.colors
+            self.font_data = self.pack.font_data
+        else:
+            for file_name in self.resources.listdir("Images"): # Find Images
+                self.image_files[file_name.split('.')[0]] = assets.join(
+                    "Images", file_name)
+            for file_name in self.resources.listdir("Sounds"): # Find Sounds
+                self.sound_files[file_name.split('.')[0]] = assets.join(
+                    "Sounds", file_name)
+            for file_name in self.resources.listdir("Music"): # Find Music
+                self.music_files[file_name.split('.')[0]] = assets.join(
+                    "Music", file_name)
+            self.images = assets.LazyDict(
+                self.load_image, sorted(self.image_files))
+            self.sounds = assets.LazyDict(
+                self.load_sound, sorted(self.sound_files))
+            self.colors = assets.read_colors(self.resources)
+            try:
+                self.font_data = assets.read_fonts(self.resources)
+            except Exception as e:
+                logging.warning(str(e))
+                self.font_data = {}
         try: # Load Fonts
-            fonts_file = open(os.path.join(
-                self.resources_path, "fonts.txt"))
-            for line in fonts_file.readlines():
-                if line.strip() == '':
-                    continue
-                elif line.strip()[0] == '#':
-                    continue
-                fontname, font = line.split('=')
-                fontname = fontname.strip()
-                font_info = font.strip().split(' ')
-                font = ' '.join(font_info[:-1])
-                size = int(float(font_info[-1]) * self.height)
-                if font.lower() in ['none', 'default']:
-                    font = None
-                self.font_data[fontname] = font, float(font_info[-1])
-                self.fonts[fontname] = pygame.font.Font(font, size)
-            fonts_file.close()
+            for fontname, (font, size) in self.font_data.items():
+                self.fonts[fontname] = pygame.font.Font(
+                    font, int(size * self.height))
         except Exception as e:
             logging.warning(str(e))
-
+
+    def open_pack(self):
+        """Open resources.pack, if it suits this display and mixer.
+
+        Returns True if the pack can be used.  The mixer must be set
+        up.  Raises ValueError if the pack was built for another audio
+        format and there are no resources to use instead."""
+        try:
+            pack = ResourcePack(self.pack_path)
+        except (IOError, ValueError) as e:
+            logging.warning("Could not open the resource pack: %s", e)
+            return False
+        if pack.mixer_format != pygame.mixer.get_init():
+            pack.close()
+            if self.resources is None:
+                raise ValueError(
+                    "{} was built for the audio format {}, not the mixer's "
+                    "{}, and there are no resources to load instead; "
+                    "rebuild it with --build-pack where the resources "
+                    "are.".format(self.pack_path, pack.mixer_format,
+                                  pygame.mixer.get_init()))
+            logging.warning("The resource pack was built for another "
+                            "audio format; rebuild it with --build-pack")
+            return False
+        self.pack = pack
+        return True
+
+    def build_pack(self):
+        """Pack the resources into resources.pack."""
+        pygame.mixer.pre_init(*self.MIXER_SETTINGS)
+        pygame.init()
+        # The pack holds images in the display's pixel format
+        pygame.display.set_mode((1, 1), getattr(pygame, 'HIDDEN', 0))
+        size = build_pack(self.resources, self.pack_path)
+        pygame.quit()
+        print("Packed {} into {} ({:.1f} MB)".format(
+            self.resources_path, self.pack_path, size / 2**20))
+
+    def preload_resources(self):
+        """Start decoding the images and sounds in background threads.
+
+        The startup screen's images go first, then the other stages'
+        images, then everything else."""
+        self.asset_pool = multiprocessing.pool.ThreadPool(self.ASSET_THREADS)
+        for stage in sorted(self.STAGE_IMAGES, key=str):
+            self.images.preload(self.asset_pool, self.STAGE_IMAGES[stage])
+        self.images.preload(self.asset_pool)
+        self.sounds.preload(self.asset_pool)
+        self.asset_pool.close() # Nothing else will be loaded in it
+
+    def prepare_stage_images(self, stage):
+        """Get the images a stage needs ready, waiting if needed."""
+        for image_name in self.STAGE_IMAGES.get(stage, ()):
+            self.scaled_images[image_name]
+
+    def load_image(self, image_name):
+        """Load an image from the resources."""
+        path = self.image_files[image_name]
+        with self.resources.open(path) as image_file:
+            return pygame.image.load(image_file, path).convert_alpha()
+
+    def load_sound(self, sound_name):
+        """Load a sound from the resources."""
+        with self.resources.open(self.sound_files[sound_name]) as sound_file:
+            return pygame.mixer.Sound(sound_file)
+
+    def play_music(self, music_name):
+        """Loop a music track, unless it is already playing."""
+        if self.music_playing != music_name:
+            pygame.mixer.music.stop()
+            # Keep the source, it is read while the music plays
+            if self.pack is not None:
+                self.music_source = self.pack.source(music_name)
+            else:
+                self.music_source = self.resources.source(
+                    self.music_files[music_name])
+            pygame.mixer.music.load(self.music_source)
+            self.music_playing = music_name
+            pygame.mixer.music.play(-1)
+
     def draw_text(self, text, x, y=None, mode="center",
                   color_id=(0, 0, 0), font_id='default', antialias=1,
-                  bg_color=None):
-        """Draw text \"text\" at x, y."""
+                  bg_color=None, surface=None):
+        """Draw text \"text\" at x, y.
+
+        Draws on the screen unless another surface is given."""
         if y is None:
             x, y = x # Handles iterable arguments
         # Gets the colour
@@ -534,31 +793,57 @@ Be careful of your falling speed, or you may crash!
             elif len(bg_color) == 4:
                 r, g, b, a = bg_color
                 bg_color = pygame.color.Color(r, g, b, a)
-        # Gets the font
-        if font_id in self.fonts.keys():
-            font = self.fonts[font_id]
-        else: # no font found
-            try:
-                font_info = font_id.strip().split(' ')
-                font_name = ' '.join(font_info[:-1])
-                size = font_info[-1]
-                if '.' in size:
-                    size = float(size) * self.size[1]
-                else:
-                    size = int(size)
-                if font.lower() in ['none', 'default']:
-                    font_name = None
-                font = pygame.font.Font(font_name, size)
-            except:
-                raise ValueError("Invalid font %s" % font_id)
+        if surface is None:
+            surface = self.screen
+        # Render the text, unless it was rendered recently
+        key = (text, font_id, tuple(color), antialias,
+               tuple(bg_color) if bg_color else None)
+        text_obj = self.text_cache.get(key)
+        if text_obj is None:
+            font = self.get_font(font_id)
+            if bg_color:
+                text_obj = font.render(
+                    text, antialias, color, bg_color).convert()
+            else:
+                text_obj = font.render(
+                    text, antialias, color).convert_alpha()
+            self.text_cache[key] = text_obj
         # Calculate the text position
-        text_obj = font.render(text, antialias, color)
         text_rect = text_obj.get_rect()
         setattr(text_rect, mode, (x, y))
         # Draw the text
-        if bg_color:
-            pygame.draw.rect(self.screen, bg_color, text_rect)
-        self.screen.blit(text_obj, text_rect)
+        surface.blit(text_obj, text_rect)
+
+    def get_font(self, font_id):
+        """Get the font with id font_id.
+
+        If there is no such font, font_id is read like a line of
+        fonts.txt: the font's name followed by its size."""
+        if font_id in self.fonts.keys():
+            return self.fonts[font_id]
+        # no font found
+        try:
+            font_info = font_id.strip().split(' ')
+            font_name = ' '.join(font_info[:-1])
+            size = font_info[-1]
+            if '.' in size:
+                size = float(size) * self.size[1]
+            else:
+                size = int(size)
+            if font_name.lower() in ['none', 'default']:
+                font_name = None
+            return pygame.font.Font(font_name, size)
+        except:
+            raise ValueError("Invalid font %s" % font_id)
+
+    def get_text_rect(self, text, x, y=None, mode="center",
+                      font_id='default'):
+        """Get the rect draw_text would draw text \"text\" in."""
+        if y is None:
+            x, y = x
+        text_rect = pygame.rect.Rect((0, 0), self.get_font(font_id).size(text))
+        setattr(text_rect, mode, (x, y))
+        return text_rect
 
     def get_coordinates(self, x, y):
         """Gets coordinates for a fraction of the screen size."""
@@ -591,256 +876,359 @@ Be careful of your falling speed, or you may crash!
         self.scale_images()
         self.scale_fonts()
         self.scale_buttons()
+        self.hud.invalidate()
 
     def scale_images(self):
-        """Set up the images with the correct size."""
-        self.scaled_images = {}
-        for image_name in self.images:
-            x, y = self.images[image_name].get_rect().size
-            x *= (self.width / self.DEFAULT_SIZE[0])
-            y *= (self.height / self.DEFAULT_SIZE[1])
-            x = int(x)
-            y = int(y)
-            self.scaled_images[image_name] = pygame.transform.scale(
-                self.images[image_name], (x, y))
+        """Set up the images with the correct size.
+
+        Images are scaled (and rotated) when first used.  The images
+        for the last few sizes are kept, so going back to one of those
+        sizes takes no work."""
+        cached = self.image_cache.get(self.size)
+        if cached is not None:
+            self.scaled_images, self.rotations = cached
+            return
+        size = self.size
+        self.scaled_images = assets.LazyDict(
+            lambda image_name: self.scale_image(image_name, size),
+            self.images)
+        scaled_images = self.scaled_images
+        self.rotations = assets.LazyDict(
+            lambda image_name: self.rotate_image(
+                image_name, scaled_images, size),
+            self.ROTATED_IMAGES)
+        self.image_cache[self.size] = self.scaled_images, self.rotations
+
+    def scale_image(self, image_name, size):
+        """Scale an image for a window of size size."""
+        x, y = self.images[image_name].get_rect().size
+        x *= (size[0] / self.DEFAULT_SIZE[0])
+        y *= (size[1] / self.DEFAULT_SIZE[1])
+        x = int(x)
+        y = int(y)
+        return pygame.transform.scale(self.images[image_name], (x, y))
+
+    def rotate_image(self, image_name, scaled_images, size):
+        """Pre-rotate a scaled image that is drawn at an angle.
+
+        Returns an atlas.RotationAtlas."""
+        step = self.rotation_step
+        if image_name == 'navmarker':
+            return RotationAtlas(scaled_images[image_name], step)
+        elif image_name == 'attitudetape-bg':
+            # The attitude tape only shows around the hole in the panels
+            pitch_offset = 3/1600 * size[1] * self.ATTITUDE_MAX_PITCH
+            tape_size = (int(size[0]*5/32 + pitch_offset*2) + 4,
+                         int(size[1]/4 + pitch_offset*2) + 4)
+            return RotationAtlas(
+                scaled_images[image_name], step,
+                -self.ATTITUDE_MAX_ROLL, self.ATTITUDE_MAX_ROLL,
+                lazy=True, size=tape_size)
+        return RotationAtlas(
+            scaled_images[image_name], step,
+            -self.ATTITUDE_MAX_ROLL, self.ATTITUDE_MAX_ROLL, lazy=True)
 
     def scale_fonts(self):
         """Set up the fonts with the correct size.
 
-        Scales according to height."""
-        self.font_names = self.fonts.keys()
-        self.fonts = {}
-        for font_name in self.font_names:
-            self.fonts[font_name] = pygame.font.Font(
-                self.font_data[font_name][0],
-                int(self.font_data[font_name][1] * self.height))
+        Scales according to height.  Like the images, the fonts for the
+        last few sizes are kept."""
+        self.text_cache.clear() # Rendered with the old sizes
+        self.font_names = self.font_data.keys()
+        fonts = self.font_cache.get(self.height)
+        if fonts is None:
+            fonts = {}
+            for font_name in self.font_names:
+                fonts[font_name] = pygame.font.Font(
+                    self.font_data[font_name][0],
+                    int(self.font_data[font_name][1] * self.height))
+            self.font_cache[self.height] = fonts
+        self.fonts = fonts
 
     def scale_buttons(self):
         """Set up the buttons with the correct size."""
         self.btn_settings = self.get_rect(5/256, 5/96, 1/6, 1/24)
 
-    def draw(self):
-        """Draw the info box and airspace."""
-        # get closest objective
-        closest_dist = float('inf')
-        for obj in self.airspace.objectives:
-            dist = ((self.plane.rect.x - obj.rect.x) ** 2
-                    + (self.plane.rect.y - obj.rect.y) ** 2) ** 0.5
-            if dist < closest_dist:
-                closest_dist = dist
-                closest_objective = obj
-        self.closest_objective = closest_objective
+    def draw_background(self):
+        """Draw the parts of the main screen that never change.
 
-        # attitude tape
-        attitude_tape = pygame.transform.rotate(
-            self.scaled_images['attitudetape-bg'],
-            self.plane.roll_degrees)
-        # calculate the position
-        attitude_tape_rect = attitude_tape.get_rect()
-        attitude_tape_rect.center = self.get_coords(55/256, 9/24)
-        offset_total = (
-            attitude_tape_rect.height * 3/1600 * self.height
-            / attitude_tape_rect.height * self.plane.pitch_degrees)
-        offset_x = math.sin(self.plane.roll) * offset_total
-        offset_y = math.cos(self.plane.roll) * offset_total
-        attitude_tape_rect.x += offset_x
-        attitude_tape_rect.y += offset_y
-
-        attitude_tape_overlay = pygame.transform.rotate(
-            self.scaled_images['attitudetape-overlay'],
-            self.plane.roll_degrees)
-        attitude_tape_overlay_rect = attitude_tape_overlay.get_rect()
-        attitude_tape_overlay_rect.center = self.get_coords(55/256, 9/24)
-        offset_total = (
-            attitude_tape_overlay_rect.height * 3/1600 * self.height
-            / attitude_tape_overlay_rect.height
-            * self.plane.pitch_degrees)
-        offset_x = math.sin(self.plane.roll) * offset_total
-        offset_y = math.cos(self.plane.roll) * offset_total
-        attitude_tape_overlay_rect.x += offset_x
-        attitude_tape_overlay_rect.y += offset_y
-        self.screen.blit(attitude_tape, attitude_tape_rect)
-        self.screen.blit(attitude_tape_overlay,
-                         attitude_tape_overlay_rect)
+        Returns a surface the size of the screen."""
+        background = pygame.Surface(self.screen.get_size()).convert()
+        background.fill(self.colors['background'])
         # surrounding panels
-        pygame.draw.rect(
-            self.screen, self.colors['panel'],
-            self.get_rect(5/256, 5/48, 25/64, 7/48))
-        pygame.draw.rect(
-            self.screen, self.colors['panel'],
-            self.get_rect(5/256, 5/48, 15/128, 25/48))
-        pygame.draw.rect(
-            self.screen, self.colors['panel'],
-            self.get_rect(75/256, 5/48, 15/128, 25/48))
-        pygame.draw.rect(
-            self.screen, self.colors['panel'],
-            self.get_rect(5/256, 1/2, 25/64, 7/48))
-        self.screen.blit(
-            self.scaled_images['attitudecrosshair'],
-            self.get_coords(35/256, 9/24))
+        top_panel = self.get_rect(5/256, 5/48, 25/64, 7/48)
+        left_panel = self.get_rect(5/256, 5/48, 15/128, 25/48)
+        right_panel = self.get_rect(75/256, 5/48, 15/128, 25/48)
+        bottom_panel = self.get_rect(5/256, 1/2, 25/64, 7/48)
+        for panel in (top_panel, left_panel, right_panel, bottom_panel):
+            pygame.draw.rect(background, self.colors['panel'], panel)
+        # The attitude tape shows through the hole between the panels
+        self.attitude_rect = pygame.rect.Rect(
+            left_panel.right, top_panel.bottom,
+            right_panel.left - left_panel.right,
+            bottom_panel.top - top_panel.bottom)
 
         # redraw background
         pygame.draw.rect(
-            self.screen, self.colors['background'],
+            background, self.colors['background'],
             (0, 0, self.x*2 + self.width, self.y + self.height*5/48))
         pygame.draw.rect(
-            self.screen, self.colors['background'],
+            background, self.colors['background'],
             (0, 0, self.x + self.width*5/256, self.y*2 + self.height))
         pygame.draw.rect(
-            self.screen, self.colors['background'],
+            background, self.colors['background'],
             (0, self.y + self.height*15/24,
              self.x*2 + self.width, self.y + self.height*9/24))
         pygame.draw.rect(
-            self.screen, self.colors['background'],
+            background, self.colors['background'],
             (self.x + self.width*105/256 - 1, 0,
              self.x + self.width*151/256, self.y*2 + self.height))
         # The -1 deals with an issue with sizing innacuracy.
 
+        # NAV circle
+        background.blit(self.images['navcircle'], self.airspace_rect)
+
+        # panel labels
+        for label, x, y in (("THROTTLE", 3/128, 1/4),
+                            ("GRAVITY", 3/128, 17/48),
+                            ("DAMAGE", 3/128, 11/24),
+                            ("SPEED", 5/16, 1/4),
+                            ("HORIZ SPD", 5/16, 17/48),
+                            ("VERT SPD", 5/16, 11/24)):
+            self.draw_text(label, self.get_coords(x, y), color_id='white',
+                           mode='topleft', surface=background)
+
+        # throttle bar
+        pygame.draw.rect(background, self.colors['red'],
+                         self.get_rect(15/128, 76/192, 1/64, 5/192))
+        pygame.draw.rect(background, self.colors['white'],
+                         self.get_rect(15/128, 81/192, 1/64, 15/192))
+        return background
+
+    def draw(self):
+        """Draw the info box and airspace.
+
+        Only the parts that changed since the last frame are drawn,
+        over the background from draw_background.
+        Returns the rects of the screen that changed."""
+        if self.hud.background is None:
+            self.hud.background = self.draw_background()
+        # get closest objective
+        nearest = self.airspace.nearest_objectives(self.plane)
+        if nearest:
+            self.closest_objective = nearest[0]
+        closest_objective = self.closest_objective
+        # interpolate between physics steps
+        plane_x, plane_z, plane_altitude, plane_heading = (
+            self.plane.interpolate(self.airspace.clock.alpha))
+        widgets = []
+
+        # attitude tape
+        crosshair_rect = self.scaled_images['attitudecrosshair'].get_rect(
+            topleft=self.get_coords(35/256, 9/24))
+        widgets.append((
+            'attitude', (self.rotations['attitudetape-bg'].index(
+                self.plane.roll_degrees), self.plane.pitch),
+            self.attitude_rect.union(crosshair_rect),
+            lambda: self.draw_attitude(crosshair_rect)))
+
         # draw NAV/airspace
-        self.airspace.draw(self)
+        markers = self.rotations['navmarker']
+        for plane in self.airspace.planes:
+            center, angle = plane.get_draw_position(self, self.airspace)
+            widgets.append((
+                ('plane', plane), markers.index(angle),
+                markers.get(angle).get_rect(center=center),
+                lambda plane=plane: plane.draw(self, self.airspace)))
+        for obj in self.airspace.objectives:
+            draw_rect = self.scaled_images['objectivemarker'].get_rect(
+                center=obj.get_draw_position(self, self.airspace))
+            widgets.append((
+                ('objective', obj), None, draw_rect,
+                lambda obj=obj: obj.draw(self, self.airspace)))
 
         # NAV text
-        self.draw_text(
-            "PLANE LOCATION", self.get_coords(29/64, 1/16),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            self.get_unit_text(self.plane.x, 'pos', 'X', False),
-            self.get_coords(29/64, 1/12),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            self.get_unit_text(self.plane.z, 'pos', 'Z', False),
-            self.get_coords(29/64, 5/48),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            self.get_unit_text(self.plane.altitude, 'pos', 'ALT'),
-            self.get_coords(29/64, 1/8),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            "HEADING: %.1f\xb0" % self.plane.heading_degrees,
-            self.get_coords(91/128, 1/16),
-            color_id='white', mode='midtop')
-        self.draw_text(
-            "PITCH: %.1f\xb0" % self.plane.pitch_degrees,
-            self.get_coords(91/128, 1/12),
-            color_id='white', mode='midtop')
-        self.draw_text(
-            "SCORE: %i" % self.plane.points,
-            self.get_coords(91/128, 5/48),
-            color_id='white', mode='midtop')
-        self.draw_text(
-            "OBJECTIVE LOCATION", self.get_coords(31/32, 1/16),
-            color_id='white', mode='topright')
-        self.draw_text(
-            self.get_unit_text(closest_objective.x, 'pos', 'X', False),
-            self.get_coords(31/32, 1/12),
-            color_id='white', mode='topright')
-        self.draw_text(
-            self.get_unit_text(closest_objective.z, 'pos', 'Z', False),
-            self.get_coords(31/32, 5/48),
-            color_id='white', mode='topright')
-        self.draw_text(
-            self.get_unit_text(closest_objective.altitude, 'pos', 'ALT'),
-            self.get_coords(31/32, 1/8),
-            color_id='white', mode='topright')
+        for text, x, y, mode in (
+                ("PLANE LOCATION", 29/64, 1/16, 'topleft'),
+                (self.get_unit_text(plane_x, 'pos', 'X', False),
+                 29/64, 1/12, 'topleft'),
+                (self.get_unit_text(plane_z, 'pos', 'Z', False),
+                 29/64, 5/48, 'topleft'),
+                (self.get_unit_text(plane_altitude, 'pos', 'ALT'),
+                 29/64, 1/8, 'topleft'),
+                ("HEADING: %.1f\xb0" % math.degrees(plane_heading),
+                 91/128, 1/16, 'midtop'),
+                ("PITCH: %.1f\xb0" % self.plane.pitch_degrees,
+                 91/128, 1/12, 'midtop'),
+                ("SCORE: %i" % self.plane.points, 91/128, 5/48, 'midtop'),
+                ("OBJECTIVE LOCATION", 31/32, 1/16, 'topright'),
+                (self.get_unit_text(closest_objective.x, 'pos', 'X', False),
+                 31/32, 1/12, 'topright'),
+                (self.get_unit_text(closest_objective.z, 'pos', 'Z', False),
+                 31/32, 5/48, 'topright'),
+                (self.get_unit_text(closest_objective.altitude, 'pos',
+                                    'ALT'),
+                 31/32, 1/8, 'topright')):
+            widgets.append(self.text_widget(
+                ('nav', x, y), text, self.get_coords(x, y), mode=mode))
 
         # panel text
-        self.draw_text(
-            "THROTTLE", self.get_coords(3/128, 1/4),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            "%.1f%%" % self.plane.throttle, self.get_coords(3/128, 13/48),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            "GRAVITY", self.get_coords(3/128, 17/48),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            self.get_unit_text(-self.plane.gravity, 'speed'),
-            self.get_coords(3/128, 3/8),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            "DAMAGE", self.get_coords(3/128, 11/24),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            "%.1f%%" % (100 - self.plane.health),
-            self.get_coords(3/128, 23/48),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            "SPEED", self.get_coords(5/16, 1/4),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            self.get_unit_text(self.plane.speed, 'speed'),
-            self.get_coords(5/16, 13/48),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            "HORIZ SPD", self.get_coords(5/16, 17/48),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            self.get_unit_text(self.plane.horizontal_speed, 'speed'),
-            self.get_coords(5/16, 3/8),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            "VERT SPD", self.get_coords(5/16, 11/24),
-            color_id='white', mode='topleft')
-        self.draw_text(
-            self.get_unit_text(self.plane.vertical_velocity, 'speed'),
-            self.get_coords(5/16, 23/48),
-            color_id='white', mode='topleft')
+        for text, x, y in (
+                ("%.1f%%" % self.plane.throttle, 3/128, 13/48),
+                (self.get_unit_text(-self.plane.gravity, 'speed'),
+                 3/128, 3/8),
+                ("%.1f%%" % (100 - self.plane.health), 3/128, 23/48),
+                (self.get_unit_text(self.plane.speed, 'speed'),
+                 5/16, 13/48),
+                (self.get_unit_text(self.plane.horizontal_speed, 'speed'),
+                 5/16, 3/8),
+                (self.get_unit_text(self.plane.vertical_velocity, 'speed'),
+                 5/16, 23/48)):
+            widgets.append(self.text_widget(
+                ('panel', x, y), text, self.get_coords(x, y),
+                mode='topleft'))
 
         # throttle bar
-        pygame.draw.rect(self.screen, self.colors['red'],
-                         self.get_rect(15/128, 76/192, 1/64, 5/192))
-        pygame.draw.rect(self.screen, self.colors['white'],
-                         self.get_rect(15/128, 81/192, 1/64, 15/192))
-        pygame.draw.rect(
-            self.screen, self.colors['green'],
-            (self.x + self.width*15/128,
-             self.y + self.height/self.DEFAULT_SIZE[1]
-             * (480-self.plane.throttle),
-             self.width/64,
-             self.height/self.DEFAULT_SIZE[1]*self.plane.throttle))
+        throttle = self.plane.throttle
+        widgets.append((
+            'throttle', round(throttle, 1),
+            self.get_rect(15/128, 76/192, 1/64, 5/48).inflate(2, 2),
+            lambda: pygame.draw.rect(
+                self.screen, self.colors['green'],
+                (self.x + self.width*15/128,
+                 self.y + self.height/self.DEFAULT_SIZE[1]
+                 * (480-throttle),
+                 self.width/64,
+                 self.height/self.DEFAULT_SIZE[1]*throttle))))
 
         # status
-        for line_id in range(len(self.status.split('\n'))):
-            self.draw_text(
-                self.status.split('\n')[line_id],
+        for line_id, line in enumerate(self.status.split('\n')):
+            widgets.append(self.text_widget(
+                ('status', line_id), line,
                 self.get_coords(5/256, 21/32+1/24*line_id),
-                font_id="large", color_id='white', mode='topleft')
+                font_id="large", mode='topleft'))
         # warnings
-        if self.show_warning("pullup"):
-            self.screen.blit(
-                self.scaled_images['msg_pullup'],
-                self.get_coords(5/32, 49/96))
-        if self.show_warning("terrain"):
-            self.screen.blit(
-                self.scaled_images['msg_warning'],
-                self.get_coords(187/1280, 7/40))
-        if self.show_warning("stall"):
-            self.screen.blit(
-                self.scaled_images['msg_stall'],
-                self.get_coords(33/1280, 491/960))
-        if self.show_warning("bank_angle"):
-            self.screen.blit(
-                self.scaled_images['msg_bankangle'],
-                self.get_coords(1/40, 109/192))
-        if self.show_warning("overspeed"):
-            self.screen.blit(
-                self.scaled_images['msg_overspeed'],
-                self.get_coords(73/256, 49/96))
+        for warning_name, image_name, x, y in (
+                ("pullup", 'msg_pullup', 5/32, 49/96),
+                ("terrain", 'msg_warning', 187/1280, 7/40),
+                ("stall", 'msg_stall', 33/1280, 491/960),
+                ("bank_angle", 'msg_bankangle', 1/40, 109/192),
+                ("overspeed", 'msg_overspeed', 73/256, 49/96)):
+            if self.show_warning(warning_name):
+                widgets.append(self.image_widget(
+                    warning_name, image_name, self.get_coords(x, y)))
         # autopilot message
-        if self.plane.autopilot_enabled:
-            self.screen.blit(
-                self.scaled_images['msg_apengaged'],
-                self.get_coords(17/128, 11/96))
+        if self.autopilot_on():
+            widgets.append(self.image_widget(
+                'autopilot', 'msg_apengaged', self.get_coords(17/128, 11/96)))
         else:
-            self.screen.blit(
-                self.scaled_images['msg_apdisconnect'],
-                self.get_coords(7/64, 11/96))
+            widgets.append(self.image_widget(
+                'autopilot', 'msg_apdisconnect',
+                self.get_coords(7/64, 11/96)))
         if self.paused:
             # draw the buttons
-            pygame.draw.rect(self.screen, self.colors['panel'],
-                             self.btn_settings)
-            self.draw_text("Settings", self.btn_settings.center,
-                           color_id='white')
+            text_rect = self.get_text_rect(
+                "Settings", self.btn_settings.center)
+            widgets.append((
+                'btn-settings', None, self.btn_settings.union(text_rect),
+                self.draw_settings_button))
+            if self.paused != 1: # Blinks
+                widgets.append(self.text_widget(
+                    'paused', "PAUSED", self.airspace_rect.center,
+                    font_id='large'))
+        if self.show_profiler:
+            widgets.append(self.profiler_widget())
+        return self.hud.render(self.screen, widgets)
+
+    def draw_attitude(self, crosshair_rect):
+        """Draw the attitude tape and crosshair."""
+        roll = self.rotations['attitudetape-bg'].angle(
+            self.plane.roll_degrees)
+        # calculate the offset from pitch
+        offset_total = 3/1600 * self.height * self.plane.pitch_degrees
+        offset_x = math.sin(math.radians(roll)) * offset_total
+        offset_y = math.cos(math.radians(roll)) * offset_total
+        # Only the hole between the panels shows the tape
+        self.screen.set_clip(self.attitude_rect)
+        for image_name in ('attitudetape-bg', 'attitudetape-overlay'):
+            image = self.rotations[image_name].get(roll)
+            image_rect = image.get_rect()
+            image_rect.center = self.get_coords(55/256, 9/24)
+            image_rect.x += offset_x
+            image_rect.y += offset_y
+            self.screen.blit(image, image_rect)
+        self.screen.set_clip(None)
+        self.screen.blit(
+            self.scaled_images['attitudecrosshair'], crosshair_rect)
+
+    def draw_settings_button(self):
+        """Draw the settings button shown while paused."""
+        pygame.draw.rect(self.screen, self.colors['panel'],
+                         self.btn_settings)
+        self.draw_text("Settings", self.btn_settings.center,
+                       color_id='white')
+
+    def text_widget(self, name, text, x, y=None, mode="center",
+                    color_id='white', font_id='default'):
+        """Get a widget drawing text, for hud.DirtyRectRenderer."""
+        if y is None:
+            x, y = x
+        return (name, (text, color_id),
+                self.get_text_rect(text, x, y, mode, font_id),
+                lambda: self.draw_text(text, x, y, mode, color_id, font_id))
+
+    def image_widget(self, name, image_name, x, y=None):
+        """Get a widget drawing a scaled image, for hud.DirtyRectRenderer.
+
+        (x, y) is the image's top left corner."""
+        if y is None:
+            x, y = x
+        image = self.scaled_images[image_name]
+        rect = image.get_rect(topleft=(x, y))
+        return (name, image_name, rect,
+                lambda: self.screen.blit(image, rect))
+
+    def profiler_widget(self):
+        """Get a widget drawing the profiler overlay.
+
+        The overlay is remade every PROFILE_REFRESH seconds."""
+        now = time.time()
+        if (self.profiler_overlay is None or now
+                - self.profiler_overlay_time >= self.PROFILE_REFRESH):
+            self.profiler_overlay = self.draw_profiler_overlay()
+            self.profiler_overlay_time = now
+        overlay = self.profiler_overlay
+        rect = overlay.get_rect(
+            bottomright=self.get_coords(255/256, 191/192))
+        return ('profiler', self.profiler_overlay_time, rect,
+                lambda: self.screen.blit(overlay, rect))
+
+    def draw_profiler_overlay(self):
+        """Make an image of the median and 99th percentile time of
+        each phase of the frame, in milliseconds."""
+        font = self.get_font('default')
+        rows = [("PHASE", "P50 MS", "P99 MS")] + [
+            (name.upper(), "%.2f" % (p50*1000), "%.2f" % (p99*1000))
+            for name, p50, p99, _, _ in self.profiler.summary()]
+        cells = [[font.render(text, 1, self.colors['white'])
+                  for text in row] for row in rows]
+        widths = [max(row[column].get_width() for row in cells)
+                  for column in range(3)]
+        gap = font.get_height()
+        line = font.get_linesize()
+        overlay = pygame.Surface(
+            (sum(widths) + gap*3, line*len(rows) + gap), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 192))
+        for y, row in enumerate(cells):
+            x = gap / 2
+            for column, cell in enumerate(row):
+                if column: # Right-align the numbers
+                    overlay.blit(cell, (x + widths[column]
+                                        - cell.get_width(), gap/2 + y*line))
+                else:
+                    overlay.blit(cell, (x, gap/2 + y*line))
+                x += widths[column] + gap
+        return overlay
 
     def get_unit_text(self, value, unit_name, label=None,
                       include_unit=True):
@@ -872,19 +1260,21 @@ Be careful of your falling speed, or you may crash!
                     self.keys_held[keyid] = 0
             # left/right
             self.plane.roll_level -= ((self.keys_held[self.controls[
-                'horiz-'] % len(keys)] / 3) ** .75 / self.fps)
+                'horiz-'] % len(keys)] / 3) ** .75 * self.frame_time)
             self.plane.roll_level += ((self.keys_held[self.controls[
-                'horiz+'] % len(keys)] / 3) ** .75 / self.fps)
+                'horiz+'] % len(keys)] / 3) ** .75 * self.frame_time)
             # up/down
             self.plane.vertical_roll_level -= ((self.keys_held[
-                self.controls['vert-'] % len(keys)] / 3) ** .75 / self.fps)
+                self.controls['vert-'] % len(keys)] / 3) ** .75
+                * self.frame_time)
             self.plane.vertical_roll_level += ((self.keys_held[
-                self.controls['vert+'] % len(keys)] / 3) ** .75 / self.fps)
+                self.controls['vert+'] % len(keys)] / 3) ** .75
+                * self.frame_time)
             # throttle
             self.plane.throttle -= ((self.keys_held[self.controls[
-                'throttle-'] % len(keys)] / 3) ** .75 / self.fps)
+                'throttle-'] % len(keys)] / 3) ** .75 * self.frame_time)
             self.plane.throttle += ((self.keys_held[self.controls[
-                'throttle+'] % len(keys)] / 3) ** .75 / self.fps)
+                'throttle+'] % len(keys)] / 3) ** .75 * self.frame_time)
             # keypress events
             for event in self.events:
                 if event.type == pygame.KEYDOWN:
@@ -922,11 +1312,29 @@ Be careful of your falling speed, or you may crash!
             <= self.airspace.ALTITUDE_WITHIN)
         if not self.warnings["altitude"]["condition"]:
             self.warnings["altitude"]["show"] = True
-        self.warnings["autopilot"]["condition"] = (
-            not self.plane.autopilot_enabled)
+        self.warnings["autopilot"]["condition"] = not self.autopilot_on()
         if not self.warnings["autopilot"]["condition"]:
             self.warnings["autopilot"]["show"] = True
 
+    def autopilot_on(self):
+        """Get whether the plane's autopilot is on.
+
+        A replay must not change the plane, so it only looks."""
+        if self.replay is not None:
+            return self.plane.controls[3]
+        return self.plane.autopilot_enabled
+
+    def replay_steps(self):
+        """Step a replay forward by the time since the last frame."""
+        self.replay_time += self.clock.get_time() / 1000 * (
+            self.args.replay_speed)
+        timestep = self.airspace.clock.timestep
+        while (self.replay_time >= timestep
+               and self.airspace.clock.ticks < self.replay.ticks):
+            self.replay(self.plane, self.airspace)
+            self.airspace.update(timestep)
+            self.replay_time -= timestep
+
     def show_warning(self, warning_name):
         """Return whether a warning should be shown/played or not."""
         return (self.warnings[warning_name]["condition"]
@@ -963,19 +1371,15 @@ Be careful of your falling speed, or you may crash!
          - The coordinates of all objectives
         If the argument text is specified, logs that instead.
         """
+        if not logging.getLogger().isEnabledFor(logging.DEBUG):
+            return # Don't build lines nobody will see
         output = []
         output.append("%i\t" % self.tick)
         # outputs stats in the correct order
-        for plane_id in range(len(self.airspace.planes)):
-            for plane in self.airspace.planes:
-                if plane.id_ == plane_id:
-                    output.append(plane.__repr__(False))
-                    break
-        for objective_id in range(len(self.airspace.objectives)):
-            for objective in self.airspace.objectives:
-                if objective.id_ == objective_id:
-                    output.append(objective.__repr__(False))
-                    break
+        for plane in self.airspace.planes.ordered():
+            output.append(plane.__repr__(False))
+        for objective in self.airspace.objectives.ordered():
+            output.append(objective.__repr__(False))
         logging.debug(''.join(output))
 
     def get_tick_values(self):
@@ -990,14 +1394,11 @@ Be careful of your falling speed, or you may crash!
 
     def startup_screen(self):
         """Activate the startup screen. Stage=0"""
-        if self.music_playing != 'chilled-eks':
-            pygame.mixer.music.stop()
-            pygame.mixer.music.load(self.music_files['chilled-eks'])
-            self.music_playing = 'chilled-eks'
-            pygame.mixer.music.play(-1)
+        self.play_music('chilled-eks')
     def game_loop_startup(self):
         """One iteration of the startup screen loop."""
         # Draw the startup screen
+        self.screen.fill(self.colors['background'])
         self.screen.blit(self.scaled_images['logo'],
                          ((self.x + self.width
                            - self.images['logo'].get_width()) / 2,
@@ -1020,7 +1421,9 @@ Be careful of your falling speed, or you may crash!
         self.draw_text("Instructions", btn_help.center, color_id='white')
         pygame.draw.rect(self.screen, self.colors['panel'], btn_settings)
         self.draw_text("Settings", btn_settings.center, color_id='white')
+        self.profiler.mark('draw')
         pygame.display.flip()
+        self.profiler.mark('display')
         # Events
         for event in self.events:
             if event.type == pygame.KEYDOWN:
@@ -1046,6 +1449,7 @@ Be careful of your falling speed, or you may crash!
             pygame.key.name(self.controls['vert+']),
             pygame.key.name(self.controls['throttle-75']))
     def game_loop_instructions(self):
+        self.screen.fill(self.colors['background'])
         # back button
         btn_back = self.get_rect(5/256, 5/192, 1/6, 1/24)
         pygame.draw.rect(self.screen, self.colors['panel'], btn_back)
@@ -1054,7 +1458,9 @@ Be careful of your falling speed, or you may crash!
             self.draw_text(
                 line, self.get_coords(55/256, i/30 + 1/40),
                 mode='topleft', color_id='white')
+        self.profiler.mark('draw')
         pygame.display.flip()
+        self.profiler.mark('display')
         for event in self.events:
             if event.type == pygame.MOUSEBUTTONUP:
                 # Use the un-click instead of the click
@@ -1069,6 +1475,7 @@ Be careful of your falling speed, or you may crash!
         self.control_selected = None
     def game_loop_settings(self):
         """The loop for the settings screen."""
+        self.screen.fill(self.colors['background'])
         # back button
         btn_back = self.get_rect(5/256, 5/192, 1/6, 1/24)
         pygame.draw.rect(self.screen, self.colors['panel'], btn_back)
@@ -1126,7 +1533,9 @@ Be careful of your falling speed, or you may crash!
             if y > 76:
                 y = 5
                 x += 50
+        self.profiler.mark('draw')
         pygame.display.flip()
+        self.profiler.mark('display')
         for event in self.events:
             if event.type == pygame.MOUSEBUTTONUP:
                 # Use the un-click instead of the click
@@ -1177,26 +1586,30 @@ Be careful of your falling speed, or you may crash!
 
     def main_screen(self):
         """Activate the main game screen. Stage=1"""
-        if self.music_playing != 'chip-respect':
-            pygame.mixer.music.stop()
-            pygame.mixer.music.load(self.music_files['chip-respect'])
-            self.music_playing = 'chip-respect'
-            pygame.mixer.music.play(-1)
+        self.play_music('chip-respect')
         self.prepare_log()
         self.log()
+        self.airspace.clock.restart()
+        self.hud.invalidate() # The screen was drawn over
     def game_loop_main(self):
         """One iteration of the main loop."""
         if not self.paused:
-            self.control_plane()
-            self.airspace.update()
+            if self.replay is not None:
+                self.replay_steps()
+            else:
+                self.control_plane()
+                if self.input_recorder is not None:
+                    self.input_recorder.capture(
+                        self.plane, self.airspace.clock.ticks + 1)
+                self.profiler.mark('control')
+                self.airspace.update()
+                if self.input_recorder is not None:
+                    self.input_recorder.settle(self.plane)
+            self.profiler.mark('update')
             self.calculate_warnings()
-            self.draw()
-        elif self.paused != 1:
-            self.draw()
-            self.draw_text("PAUSED", self.airspace_rect.center,
-                           color_id='white', font_id='large')
-        else:
-            self.draw()
+            self.profiler.mark('warnings')
+        changed = self.draw()
+        self.profiler.mark('draw')
         if self.exit_code: # If finished,
             logging.info("Exited main loop with exitcode %i",
                          self.exit_code)
@@ -1204,18 +1617,19 @@ Be careful of your falling speed, or you may crash!
             self.exit_reason = self.EXIT_REASONS[self.exit_code]
             self.exit_reason = self.exit_reason.format(self.plane.points)
             self.stage = 2
-        pygame.display.flip()
+        pygame.display.update(changed)
+        self.profiler.mark('display')
         for event in self.events:
             if event.type == pygame.KEYDOWN:
                 if event.key == self.controls['pause']:
                     if self.paused:
                         logging.info("Player unpaused")
-                        self.plane._time += time.time() - self.pause_start
+                        self.airspace.clock.resume()
                         self.paused = 0
                     else:
                         logging.info("Player paused")
                         self.paused = 1
-                        self.pause_start = time.time()
+                        self.airspace.clock.pause()
             elif event.type == pygame.MOUSEBUTTONUP:
                 if self.btn_settings.collidepoint(
                         event.pos) and self.paused:
@@ -1235,10 +1649,12 @@ Be careful of your falling speed, or you may crash!
 
     def end_screen(self):
         """Activate the end screen. Stage=2"""
+        self.stop_input_recording()
         pygame.mixer.music.fadeout(10000) # Fades out over 10 seconds
         self.music_playing = None
     def game_loop_end(self):
         """One iteration of the end screen loop."""
+        self.screen.fill(self.colors['background'])
         self.draw_text(self.exit_title,
                        (self.size[0]/37.6, self.height*5/192),
                        mode='topleft', color_id='white', font_id='large')
@@ -1250,7 +1666,9 @@ Be careful of your falling speed, or you may crash!
                 self.width / 6, self.height / 24)
         pygame.draw.rect(self.screen, self.colors['panel'], btn_reset)
         self.draw_text("Play Again", btn_reset.center, color_id='white')
+        self.profiler.mark('draw')
         pygame.display.flip()
+        self.profiler.mark('display')
         for event in self.events:
             if event.type == pygame.MOUSEBUTTONUP:
                 if btn_reset.collidepoint(event.pos):
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""The HeadlessSimulation class
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import time
+
+from airspace import Airspace
+from game import Client
+
+
+class HeadlessSimulation(object):
+    """Runs an airspace without a display or audio.
+
+    The simulation clock is advanced by exactly one step per tick
+    instead of following the wall clock, so it runs as fast as the
+    CPU allows.
+
+    controller, if given, is called as controller(plane, airspace)
+    before every tick, and can change the plane's controls.
+    """
+    def __init__(self, airspace=None, player_id=None, controller=None):
+        """Initialize the instance."""
+        if airspace is None:
+            airspace = Airspace()
+        self.airspace = airspace
+        self.controller = controller
+        self.plane = self.airspace.add_plane(player_id=player_id)
+        self.airspace.generate_objective()
+
+    @classmethod
+    def from_replay(cls, replay, airspace=None):
+        """Set up a simulation that replays a replay.Replay."""
+        if airspace is None:
+            airspace = Airspace()
+        airspace.clock.tick_rate = replay.tick_rate
+        airspace.reseed(replay.seed)
+        return cls(airspace, replay.player_id, replay)
+
+    @property
+    def ticks(self):
+        """Get the number of ticks simulated."""
+        return self.airspace.clock.ticks
+    @property
+    def exit_code(self):
+        """Return the exit code."""
+        return self.airspace.get_exit_code(self.plane)
+
+    def step(self):
+        """Simulate one tick."""
+        if self.controller is not None:
+            self.controller(self.plane, self.airspace)
+        self.airspace.update(self.airspace.clock.timestep)
+
+    def run(self, ticks=None, until=None, stop_at_exit=True):
+        """Simulate until the plane exits or ticks ticks have passed.
+
+        until, if given, is called as until(simulation) after every
+        tick and stops the run when it returns True.  If stop_at_exit
+        is False, the plane's exit does not stop the run; the game does
+        the same when a frame runs several ticks; ticks or until must
+        then be given, or the run would never end.
+        Returns a dictionnary describing the run."""
+        if ticks is None and until is None and not stop_at_exit:
+            raise ValueError("Without ticks or until, the run must stop "
+                             "at the plane's exit.")
+        start_ticks = self.ticks
+        start_time = time.time()
+        while ticks is None or self.ticks - start_ticks < ticks:
+            self.step()
+            if stop_at_exit and self.exit_code:
+                break
+            if until is not None and until(self):
+                break
+        wall_time = time.time() - start_time
+        ticks_run = self.ticks - start_ticks
+        return {
+            'ticks': ticks_run,
+            'time': ticks_run * self.airspace.clock.timestep,
+            'wall-time': wall_time,
+            'ticks-per-second': (ticks_run / wall_time if wall_time
+                                 else float('inf')),
+            'exit-code': self.exit_code or 0,
+            'points': self.plane.points,
+        }
+
+    @staticmethod
+    def report(result):
+        """Get a human-readable summary of a run's results."""
+        if result['exit-code']:
+            outcome = "{}: {}".format(
+                Client.EXIT_TITLES[result['exit-code']],
+                Client.EXIT_REASONS[result['exit-code']].format(
+                    result['points']))
+        else:
+            outcome = "Still flying. The score was {}.".format(
+                result['points'])
+        return ("Simulated {} ticks ({:.1f} s) in {:.2f} s "
+                "({:.0f} ticks per second)\n{}".format(
+                    result['ticks'], result['time'], result['wall-time'],
+                    result['ticks-per-second'], outcome))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""The DirtyRectRenderer class
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+
+class DirtyRectRenderer(object):
+    """Draws widgets over a cached background, redrawing only changes.
+
+    Every frame, the widgets are given in drawing order as
+    (name, key, rect, draw) tuples.  key is any value that changes
+    whenever the widget looks different, rect covers everything the
+    widget draws and draw() draws it on the screen.
+
+    A widget is redrawn if its key or rect changed, or if it overlaps
+    an area being redrawn.  Redrawn areas are first restored from the
+    background, so nothing is drawn twice over itself.
+    """
+    def __init__(self):
+        """Initialize the instance."""
+        self.background = None
+        self._last = {} # The key and rect of each widget last frame
+        self._full = True
+
+    def invalidate(self):
+        """Throw away the background and redraw everything next frame."""
+        self.background = None
+        self._full = True
+
+    def redraw_all(self):
+        """Redraw everything next frame, over the same background."""
+        self._full = True
+
+    def render(self, screen, widgets):
+        """Draw the widgets that changed on the screen.
+
+        Returns the rects of the screen that were drawn on, for
+        pygame.display.update."""
+        last = self._last
+        self._last = dict((name, (key, rect.copy()))
+                          for name, key, rect, _ in widgets)
+        if self._full:
+            self._full = False
+            screen.blit(self.background, (0, 0))
+            for widget in widgets:
+                widget[3]()
+            return [screen.get_rect()]
+
+        # Find what changed, and what was removed
+        dirty = []
+        redraw = set()
+        for name, key, rect, _ in widgets:
+            if name not in last:
+                dirty.append(rect)
+                redraw.add(name)
+            elif last[name] != (key, rect):
+                dirty.append(rect)
+                dirty.append(last[name][1])
+                redraw.add(name)
+        for name in last:
+            if name not in self._last:
+                dirty.append(last[name][1])
+        # Redraw anything overlapping a redrawn area, all of it
+        changed = True
+        while changed:
+            changed = False
+            for name, _, rect, _ in widgets:
+                if name not in redraw and rect.collidelist(dirty) != -1:
+                    redraw.add(name)
+                    dirty.append(rect)
+                    changed = True
+
+        for rect in dirty:
+            screen.blit(self.background, rect, rect)
+        for name, _, _, draw in widgets:
+            if name in redraw:
+                draw()
+        return dirty
+
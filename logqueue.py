@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""The LogQueue class, which writes log records in a background thread
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import logging
+import logging.handlers
+try:
+    import queue
+except ImportError: # Python 2
+    import Queue as queue
+
+# Python 2 has no QueueHandler, so logging there stays synchronous
+QUEUES_SUPPORTED = hasattr(logging.handlers, 'QueueHandler')
+
+
+if QUEUES_SUPPORTED:
+    class DroppingQueueHandler(logging.handlers.QueueHandler):
+        """A QueueHandler that never waits.
+
+        If the queue is full, records are dropped and counted in
+        dropped.  Records are formatted by the listener, not when
+        logged, so their arguments must not change after logging.
+        """
+        def __init__(self, queue_):
+            """Initialize the instance."""
+            super(DroppingQueueHandler, self).__init__(queue_)
+            self.dropped = 0
+
+        def prepare(self, record):
+            """Leave the record to be formatted in the writer thread."""
+            return record
+
+        def enqueue(self, record):
+            """Queue a record, or drop it if the queue is full."""
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    class _Listener(logging.handlers.QueueListener):
+        """A QueueListener that can be stopped with a full queue."""
+        def enqueue_sentinel(self):
+            """Tell the thread to stop, waiting for room if needed."""
+            self.queue.put(self._sentinel)
+
+
+class LogQueue(object):
+    """Sends log records to a handler from a background thread.
+
+    Logging only puts records in a queue of at most queue_size
+    records; a writer thread formats them and gives them to target in
+    batches of batch_size, or straight away for records of at least
+    flush_level.  When the queue is full, records are dropped instead
+    of waiting, and counted.
+    """
+    def __init__(self, target, queue_size=4096, batch_size=64,
+                 flush_level=logging.WARNING):
+        """Initialize the instance."""
+        self.target = target
+        self.logger = None
+        if QUEUES_SUPPORTED:
+            self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+            self.buffer = logging.handlers.MemoryHandler(
+                batch_size, flush_level, target)
+            self.listener = _Listener(self.handler.queue, self.buffer)
+        else:
+            self.handler = target
+
+    def __repr__(self):
+        """Display the target and how many records were dropped."""
+        return "<LogQueue to {} {} dropped>".format(
+            self.target, self.dropped)
+
+    @property
+    def dropped(self):
+        """Get the number of records dropped because the queue was full."""
+        return getattr(self.handler, 'dropped', 0)
+
+    def start(self, logger=None):
+        """Start sending a logger's records, by default the root's."""
+        self.logger = logging.getLogger() if logger is None else logger
+        self.logger.addHandler(self.handler)
+        if QUEUES_SUPPORTED:
+            self.listener.start()
+
+    def stop(self):
+        """Write every queued record and close the target."""
+        if self.logger is None:
+            return
+        self.logger.removeHandler(self.handler)
+        self.logger = None
+        if QUEUES_SUPPORTED:
+            self.listener.stop()
+            self.buffer.flush()
+            self.buffer.close()
+        if self.dropped:
+            self.target.handle(logging.makeLogRecord({
+                'msg': "%i log records were dropped",
+                'args': (self.dropped,),
+                'levelno': logging.WARNING,
+                'levelname': logging.getLevelName(logging.WARNING),
+            }))
+        self.target.close()
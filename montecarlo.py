@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+"""Monte Carlo runs of headless airspaces across processes
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A scenario is a dictionnary with:
+ -> 'planes': the number of planes in each airspace; when there are
+    several, they start on the ground at random places
+ -> 'policy': the name of the policy in POLICIES flying them
+ -> 'seeds': [first, last + 1], the airspace seeds to run, one run each
+ -> 'ticks': the most ticks a run lasts
+ -> 'tick-rate': the airspace's ticks per second
+
+Results are written as JSON lines: first the scenario, then one line
+per run as it finishes, in the order they finish.  A run's line has
+its seed and, for each plane, its final points, exit code (0 if still
+flying), ticks flown and peak damage.  Runs already in the file are
+skipped, so an interrupted sweep carries on where it stopped.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import argparse
+import json
+import multiprocessing
+import os
+try:
+    import concurrent.futures
+except ImportError: # Python 2 without the futures backport
+    concurrent = None
+
+from airspace import Airspace
+from clock import SimulationClock
+from game import Client
+
+DEFAULT_SCENARIO = {
+    'planes': 1,
+    'policy': 'random',
+    'seeds': [0, 100],
+    'ticks': 36000,
+    'tick-rate': SimulationClock.DEFAULT_TICK_RATE,
+}
+PENDING_PER_WORKER = 4 # Runs queued per worker process
+
+
+def idle_policy(stream):
+    """Leave the controls alone."""
+    return lambda plane, airspace: None
+
+
+def cruise_policy(stream):
+    """Climb to half the ceiling and fly straight."""
+    target = Airspace.MAX_ALTITUDE / 2
+    def cruise(plane, airspace):
+        plane.throttle = 60
+        plane.vertical_roll_level = max(min(
+            (target - plane.altitude) / 1000, 2), -2)
+    return cruise
+
+
+class RandomPolicy(object):
+    """Sets random controls every INTERVAL seconds.
+
+    The controls are drawn from stream, a rng.RandomStream, anywhere in
+    their ranges."""
+    INTERVAL = 1
+    def __init__(self, stream):
+        """Initialize the instance."""
+        self.stream = stream
+    def __call__(self, plane, airspace):
+        """Change the controls if it is time to."""
+        period = max(int(round(self.INTERVAL * airspace.clock.tick_rate)),
+                     1)
+        if airspace.clock.ticks % period == 0:
+            plane.roll_level = self.stream.uniform(-4, 4)
+            plane.vertical_roll_level = self.stream.uniform(-4, 4)
+            plane.throttle = self.stream.uniform(0, 100)
+
+
+# Policy names: functions making a controller(plane, airspace) from a
+# rng.RandomStream
+POLICIES = {
+    'idle': idle_policy,
+    'cruise': cruise_policy,
+    'random': RandomPolicy,
+}
+
+
+def spread(airspace, planes, stream):
+    """Move planes to random places on the ground of an airspace.
+
+    The places are drawn from stream, a rng.RandomStream, away from
+    the edges."""
+    margin_x, margin_z = airspace.width * 0.06, airspace.height * 0.06
+    for plane in planes:
+        x, z, _ = stream.position(int(airspace.width - margin_x * 2),
+                                  int(airspace.height - margin_z * 2), 0, 0)
+        plane.x = x + margin_x
+        plane.z = z + margin_z
+        plane.save_state()
+        airspace.plane_grid.move(plane)
+
+
+def run_once(scenario, seed):
+    """Simulate one run of a scenario with a seed.
+
+    Returns the run's result, as written to the results file."""
+    airspace = Airspace(tick_rate=scenario['tick-rate'], seed=seed)
+    timestep = airspace.clock.timestep
+    # Spawned streams leave the objective positions unchanged
+    streams = airspace.random.spawn(scenario['planes'] + 1)
+    controllers = [POLICIES[scenario['policy']](stream)
+                   for stream in streams[:-1]]
+    planes = [airspace.add_plane(player_id=index)
+              for index in range(scenario['planes'])]
+    if len(planes) > 1: # One plane starts in the middle, like in the game
+        spread(airspace, planes, streams[-1])
+    for _ in planes:
+        airspace.generate_objective()
+    points = [0] * len(planes)
+    exit_codes = [0] * len(planes)
+    ticks = [0] * len(planes)
+    damage = [0] * len(planes)
+    flying = list(range(len(planes)))
+    while flying and airspace.clock.ticks < scenario['ticks']:
+        for index in flying:
+            controllers[index](planes[index], airspace)
+        airspace.update(timestep)
+        for index in list(flying):
+            plane = planes[index]
+            damage[index] = max(damage[index], plane.damage)
+            exit_code = airspace.get_exit_code(plane)
+            if exit_code:
+                exit_codes[index] = exit_code
+                flying.remove(index)
+                airspace.remove_plane(plane.id_)
+            ticks[index] = airspace.clock.ticks
+            points[index] = plane.points
+    return {
+        'seed': seed,
+        'points': points,
+        'exit': exit_codes,
+        'ticks': ticks,
+        'damage': [round(value, 3) for value in damage],
+    }
+
+
+def load(path, scenario=None):
+    """Read a results file.
+
+    If scenario is given, it must be the one the file was started
+    with.  A line cut short by an interruption is removed from the
+    file.  Returns the scenario and the list of results."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    if end < len(data): # Interrupted while writing a line
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+    lines = data[:end].decode('utf-8').splitlines()
+    if not lines:
+        return scenario, []
+    saved = json.loads(lines[0])['scenario']
+    if scenario is not None and saved != scenario:
+        raise ValueError("{} was started with a different scenario: "
+                         "{}".format(path, json.dumps(saved, sort_keys=True)))
+    return saved, [json.loads(line) for line in lines[1:]]
+
+
+def run(path, scenario, workers=None, callback=None):
+    """Run the runs of a scenario not yet in the results file at path.
+
+    The runs are spread across workers processes (by default one per
+    CPU).  callback, if given, is called with each result as it
+    arrives.  Returns the number of runs done."""
+    scenario = dict(DEFAULT_SCENARIO, **scenario)
+    if scenario['policy'] not in POLICIES:
+        raise ValueError("Unknown policy {}.".format(scenario['policy']))
+    results = []
+    if os.path.exists(path):
+        scenario, results = load(path, scenario)
+    done = set(result['seed'] for result in results)
+    seeds = [seed for seed in range(*scenario['seeds']) if seed not in done]
+    remaining = len(seeds)
+    with open(path, 'a') as f:
+        if f.tell() == 0:
+            f.write(json.dumps({'scenario': scenario}, sort_keys=True) + '\n')
+        def write(result):
+            """Save a result straight away."""
+            f.write(json.dumps(result, separators=(',', ':')) + '\n')
+            f.flush()
+            if callback is not None:
+                callback(result)
+        if concurrent is None or workers == 1:
+            for seed in seeds:
+                write(run_once(scenario, seed))
+            return remaining
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            # Only queue a few runs at a time, so a large sweep neither
+            # fills memory nor has much to cancel when interrupted
+            limit = PENDING_PER_WORKER * (
+                workers or multiprocessing.cpu_count())
+            seeds = iter(seeds)
+            pending = set()
+            try:
+                while True:
+                    for seed in seeds:
+                        pending.add(executor.submit(run_once, scenario, seed))
+                        if len(pending) >= limit:
+                            break
+                    if not pending:
+                        break
+                    finished, pending = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        write(future.result())
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+    return remaining
+
+
+def summarize(results):
+    """Get the statistics of a list of results."""
+    planes = [plane for result in results for plane in zip(
+        result['points'], result['exit'], result['ticks'], result['damage'])]
+    count = len(planes)
+    exits = {}
+    for points, exit_code, _, _ in planes:
+        total = exits.setdefault(exit_code, {'count': 0, 'points': 0})
+        total['count'] += 1
+        total['points'] += points
+    for total in exits.values():
+        total['points'] /= total['count']
+    return {
+        'runs': len(results),
+        'planes': count,
+        'points': sum(plane[0] for plane in planes) / count if count else 0,
+        'max-points': max(plane[0] for plane in planes) if count else 0,
+        'ticks': sum(plane[2] for plane in planes) / count if count else 0,
+        'damage': sum(plane[3] for plane in planes) / count if count else 0,
+        'max-damage': max(plane[3] for plane in planes) if count else 0,
+        'exits': exits,
+    }
+
+
+def report(summary):
+    """Get a human-readable version of a summary."""
+    lines = ["{} runs, {} planes".format(summary['runs'], summary['planes'])]
+    lines.append("  Points: {:.2f} average, {} best".format(
+        summary['points'], summary['max-points']))
+    lines.append("  Ticks flown: {:.0f} average".format(summary['ticks']))
+    lines.append("  Peak damage: {:.1f} average, {:.1f} worst".format(
+        summary['damage'], summary['max-damage']))
+    for exit_code, total in sorted(summary['exits'].items()):
+        score = "{:.2f}".format(total['points'])
+        if exit_code:
+            reason = Client.EXIT_REASONS[exit_code].format(score)
+        else:
+            reason = "Still flying. The score was {}.".format(score)
+        lines.append("  {} planes ({:.1%}): {}".format(
+            total['count'], total['count'] / summary['planes'], reason))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """Run the scenario given on the command line."""
+    parser = argparse.ArgumentParser(
+        description='Run many headless airspaces and summarize them.')
+    parser.add_argument('results', metavar='RESULTS',
+                        help='the results file, resumed if it exists')
+    parser.add_argument('--planes', type=int,
+                        default=DEFAULT_SCENARIO['planes'],
+                        help='planes per airspace (default: %(default)s)')
+    parser.add_argument('--policy', choices=sorted(POLICIES),
+                        default=DEFAULT_SCENARIO['policy'],
+                        help='how the planes fly (default: %(default)s)')
+    parser.add_argument('--seeds', type=int, nargs=2,
+                        default=DEFAULT_SCENARIO['seeds'],
+                        metavar=('FIRST', 'STOP'),
+                        help='run seeds FIRST to STOP - 1 '
+                        '(default: %(default)s)')
+    parser.add_argument('--ticks', type=int,
+                        default=DEFAULT_SCENARIO['ticks'],
+                        help='most ticks per run (default: %(default)s)')
+    parser.add_argument('--tick-rate', type=float,
+                        default=DEFAULT_SCENARIO['tick-rate'],
+                        help='ticks per second (default: %(default)s)')
+    parser.add_argument('--workers', type=int,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--summary', action='store_true',
+                        help='only summarize the results file')
+    parser.add_argument('--json', action='store_true',
+                        help='print the summary as JSON')
+    args = parser.parse_args(argv)
+    if not args.summary:
+        scenario = {
+            'planes': args.planes,
+            'policy': args.policy,
+            'seeds': list(args.seeds),
+            'ticks': args.ticks,
+            'tick-rate': args.tick_rate,
+        }
+        try:
+            run(args.results, scenario, args.workers)
+        except KeyboardInterrupt:
+            print("Interrupted; run again to carry on.")
+    summary = summarize(load(args.results)[1])
+    if args.json:
+        print(json.dumps(summary, indent=2, sort_keys=True))
+    else:
+        print(report(summary))
+
+
+if __name__ == '__main__':
+    main()
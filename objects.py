@@ -22,9 +22,9 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # Installs Python 3 division and print behaviour
 from __future__ import division, print_function
 
+import collections
 import math
 import os
-import time
 
 import pygame
 
@@ -40,6 +40,8 @@ class Airplane(pygame.sprite.Sprite):
 
     MAX_SPEED = 500
     TERMINAL_VELOCITY = MAX_SPEED / 5 # Why not?
+    # The gravity formula was tuned per frame at 30 FPS
+    GRAVITY_RATE = 30
 
     LABELS = "ID:\tX:\tY:\tALT:\tSPD:\tACCEL:\tVSPD:\t\
 HDG:\tROLL:\tPITCH:\tPTS:\tDMG:\t"
@@ -85,7 +87,7 @@ HDG:\tROLL:\tPITCH:\tPTS:\tDMG:\t"
         self._points = 0
         self._exit_code = 0
         self._health = 100
-        self._time = time.time()
+        self.save_state()
 
     def __repr__(self, show_labels=True):
         """Display some important stats about the plane."""
@@ -304,6 +306,38 @@ HDG:\tROLL:\tPITCH:\tPTS:\tDMG:\t"
                 self._autopilot_info['enabled'] = False
             return self._autopilot_info['enabled']
     @property
+    def autopilot_on(self):
+        """Get whether the autopilot is on.
+
+        Unlike autopilot_enabled, this changes nothing."""
+        return bool(self._autopilot_info['enabled'])
+    @property
+    def controls(self):
+        """Get the state of the plane's controls and autopilot.
+
+        Returns (roll level, vertical roll level, throttle, autopilot
+        enabled, roll centered, vertical roll centered, throttle
+        centered).  Unlike autopilot_enabled, this changes nothing."""
+        info = self._autopilot_info
+        conditions = info['conditions']
+        return (self.roll_level, self.vertical_roll_level, self.throttle,
+                bool(info['enabled']), bool(conditions['roll-centered']),
+                bool(conditions['vertical-roll-centered']),
+                bool(conditions['throttle-centered']))
+    @controls.setter
+    def controls(self, new_value):
+        """Set the state of the plane's controls and autopilot."""
+        (self.roll_level, self.vertical_roll_level, self.throttle, enabled,
+         roll_centered, vertical_roll_centered, throttle_centered) = new_value
+        self._autopilot_info = {
+            'enabled': enabled,
+            'conditions': {
+                'roll-centered': roll_centered,
+                'vertical-roll-centered': vertical_roll_centered,
+                'throttle-centered': throttle_centered
+            }
+        }
+    @property
     def health(self):
         """Get the plane's health."""
         return self._health
@@ -343,23 +377,47 @@ HDG:\tROLL:\tPITCH:\tPTS:\tDMG:\t"
         for condition in self._autopilot_info['conditions']:
             self._autopilot_info['conditions'][condition] = False
 
+    def save_state(self):
+        """Remember the current state for interpolation."""
+        self._previous_state = (
+            self._pos[0], self._pos[1], self._altitude, self._heading)
+
+    def interpolate(self, alpha):
+        """Get the (x, z, altitude, heading) between the last steps.
+
+        alpha is the fraction of the way from the previous state to
+        the current one."""
+        x, z, altitude, heading = self._previous_state
+        # Turn the shortest way around the circle
+        turn = (self._heading - heading + math.pi) % (math.pi*2) - math.pi
+        return (x + (self._pos[0] - x) * alpha,
+                z + (self._pos[1] - z) * alpha,
+                altitude + (self._altitude - altitude) * alpha,
+                (heading + turn * alpha) % (math.pi*2))
+
+    def get_draw_position(self, client, airspace):
+        """Get where the plane is drawn on the screen.
+
+        Returns the center of its marker and the marker's rotation in
+        degrees."""
+        x, z, _, heading = self.interpolate(airspace.clock.alpha)
+        return ((x / airspace.width * client.airspace_rect.width
+                 + client.airspace_rect.left,
+                 z / airspace.height * client.airspace_rect.height
+                 + client.airspace_rect.top),
+                -math.degrees(heading))
+
     def draw(self, client, airspace):
         """Draw the airplane."""
-        image = pygame.transform.rotate(
-            client.scaled_images['navmarker'], -self.heading_degrees)
+        center, angle = self.get_draw_position(client, airspace)
+        image = client.rotations['navmarker'].get(angle)
         draw_rect = image.get_rect()
-        draw_rect.center = (
-            self.x / airspace.width * client.airspace_rect.width
-            + client.airspace_rect.left,
-            self.z / airspace.height * client.airspace_rect.height
-            + client.airspace_rect.top
-        )
+        draw_rect.center = center
         client.screen.blit(image, draw_rect)
 
-    def update(self):
-        """Update the plane."""
-        tick_duration = time.time() - self._time
-        self._time = time.time()
+    def update(self, tick_duration):
+        """Update the plane by tick_duration seconds."""
+        self.save_state()
 
         # initialize damage
         damage = 0
@@ -369,10 +427,11 @@ HDG:\tROLL:\tPITCH:\tPTS:\tDMG:\t"
             max_vert_roll = max((self.speed-(self.MAX_SPEED / 10))
                                 / (self.MAX_SPEED / 40), 0)
         else: max_vert_roll = 4
-        self.gravity += (((self.MAX_SPEED / 10 - self.speed)
-                          / self.MAX_SPEED * self.TERMINAL_VELOCITY)
-                         - (self.gravity ** 2
-                            / (self.TERMINAL_VELOCITY ** 2 / 10)))
+        self.gravity += ((((self.MAX_SPEED / 10 - self.speed)
+                           / self.MAX_SPEED * self.TERMINAL_VELOCITY)
+                          - (self.gravity ** 2
+                             / (self.TERMINAL_VELOCITY ** 2 / 10)))
+                         * self.GRAVITY_RATE * tick_duration)
         if self.gravity < 0:
             self.gravity = 0
         if self.altitude <= 0.1:
@@ -447,6 +506,8 @@ class Objective(pygame.sprite.Sprite):
         self._pos = [x, z]
         self._size = [width, height]
         self._altitude = altitude
+        self._rect = None
+        self._rect_pos = None
 
     def __repr__(self, show_labels=True):
         """Display some important stats about the objective."""
@@ -514,31 +575,71 @@ class Objective(pygame.sprite.Sprite):
         return self._image
     @property
     def rect(self):
-        """Get the plane's rect."""
-        return pygame.rect.Rect(self._pos, self._size)
+        """Get the objective's rect."""
+        # Objectives rarely move, so only rebuild the rect if it did
+        pos = (self._pos[0], self._pos[1])
+        if pos != self._rect_pos:
+            self._rect = pygame.rect.Rect(self._pos, self._size)
+            self._rect_pos = pos
+        return self._rect
+
+    def get_draw_position(self, client, airspace):
+        """Get the center of the objective's marker on the screen."""
+        return (self.x / airspace.width * client.airspace_rect.width
+                + client.airspace_rect.left,
+                self.z / airspace.height * client.airspace_rect.height
+                + client.airspace_rect.top)
 
     def draw(self, client, airspace):
         """Draw the objective."""
         draw_rect = client.scaled_images['objectivemarker'].get_rect()
-        draw_rect.center = (
-            self.x / airspace.width * client.airspace_rect.width
-            + client.airspace_rect.left,
-            self.z / airspace.height * client.airspace_rect.height
-            + client.airspace_rect.top
-        )
+        draw_rect.center = self.get_draw_position(client, airspace)
         client.screen.blit(
             client.scaled_images['objectivemarker'], draw_rect)
 
 
 class AdvancedSpriteGroup(pygame.sprite.Group):
-    """A Pygame sprite group, except you can index it."""
+    """A Pygame sprite group, except you can index it by ID.
+
+    Keeps a dictionnary from IDs to sprites next to Pygame's, so
+    lookups and removals by ID take constant time.  Sprites are kept
+    in the order they were added.  Adding a sprite with the ID of
+    another one in the group raises a ValueError.
+    """
     def __init__(self, *args, **kw):
         """Initialize the instance."""
+        self._ids = collections.OrderedDict()
         super(AdvancedSpriteGroup, self).__init__(*args, **kw)
 
     def __getitem__(self, key):
-        """Get the sprite at key."""
-        for sprite in self:
-            if sprite.id_ == key:
-                return sprite
+        """Get the sprite with ID key."""
+        try:
+            return self._ids[key]
+        except KeyError:
             raise KeyError("Item {} not found.".format(key))
+
+    def add_internal(self, sprite, *args):
+        """Add a sprite to the group's dictionnaries."""
+        if self._ids.get(sprite.id_, sprite) is not sprite:
+            raise ValueError("There is already a sprite with ID {} in the "
+                             "group.".format(sprite.id_))
+        super(AdvancedSpriteGroup, self).add_internal(sprite, *args)
+        self._ids[sprite.id_] = sprite
+
+    def remove_internal(self, sprite):
+        """Remove a sprite from the group's dictionnaries."""
+        super(AdvancedSpriteGroup, self).remove_internal(sprite)
+        if self._ids.get(sprite.id_) is sprite:
+            del self._ids[sprite.id_]
+
+    def get(self, key, default=None):
+        """Get the sprite with ID key, or default if there is none."""
+        return self._ids.get(key, default)
+
+    def ids(self):
+        """Get the IDs in the group, in the order they were added."""
+        return list(self._ids)
+
+    def ordered(self):
+        """Get the sprites in the order they were added."""
+        return list(self._ids.values())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+"""The ResourcePack class, a prebuilt binary copy of the resources
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+File layout (all numbers little-endian):
+
+ -> Header: the magic bytes b'SFPACK', the format version (2 bytes)
+    and the length of the index (4 bytes)
+ -> Index: UTF-8 JSON describing everything in the pack
+ -> Data: the images' raw pixels, the sounds' raw samples and the
+    music files, each starting on a 16 byte boundary.  Offsets in the
+    index are from the start of the data.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import io
+import json
+import mmap
+import struct
+import sys
+
+import pygame
+
+import assets
+
+MAGIC = b'SFPACK'
+VERSION = 1
+HEADER = struct.Struct('<6sHI')
+ALIGNMENT = 16
+# The pixel formats pygame.image.tostring and frombuffer both know
+PIXEL_FORMATS = ('RGBA', 'ARGB', 'BGRA')
+
+
+def _align(offset):
+    """Round an offset up to the next multiple of ALIGNMENT."""
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def display_pixel_format():
+    """Get the byte order of the display's pixels with alpha.
+
+    Returns a pygame.image.tostring format, or 'RGBA' if none matches.
+    pygame's display must be set up."""
+    masks = pygame.Surface((1, 1)).convert_alpha().get_masks()
+    positions = []
+    for mask, channel in zip(masks, 'RGBA'):
+        shift = 0
+        while mask and not mask & 1:
+            mask >>= 1
+            shift += 1
+        byte = shift // 8
+        if sys.byteorder == 'big':
+            byte = 3 - byte
+        positions.append((byte, channel))
+    pixel_format = ''.join(channel for _, channel in sorted(positions))
+    return pixel_format if pixel_format in PIXEL_FORMATS else 'RGBA'
+
+
+def build_pack(provider, path):
+    """Pack the resources from a provider into the file at path.
+
+    Images are stored as raw pixels in the display's format and sounds
+    as raw samples in the mixer's format, so pygame's display and
+    mixer must be set up first.
+    Returns the size of the pack in bytes."""
+    pixel_format = display_pixel_format()
+    index = {
+        'pixel-format': pixel_format,
+        'mixer': list(pygame.mixer.get_init()),
+        'colors': dict((name, tuple(color)) for name, color
+                       in assets.read_colors(provider).items()),
+        'fonts': assets.read_fonts(provider),
+        'images': {},
+        'sounds': {},
+        'music': {},
+    }
+    blobs = [] # (offset, data) for everything in the data section
+    def add(data):
+        """Add data to the pack and return its (offset, length)."""
+        if blobs:
+            offset = _align(blobs[-1][0] + len(blobs[-1][1]))
+        else:
+            offset = 0
+        blobs.append((offset, data))
+        return offset, len(data)
+
+    for file_name in provider.listdir("Images"):
+        file_path = assets.join("Images", file_name)
+        with provider.open(file_path) as image_file:
+            image = pygame.image.load(image_file, file_path)
+        data = pygame.image.tostring(image, pixel_format)
+        index['images'][file_name.split('.')[0]] = (
+            add(data) + image.get_size())
+    for file_name in provider.listdir("Sounds"):
+        with provider.open(assets.join("Sounds", file_name)) as sound_file:
+            sound = pygame.mixer.Sound(sound_file)
+        index['sounds'][file_name.split('.')[0]] = add(sound.get_raw())
+    for file_name in provider.listdir("Music"):
+        data = provider.read(assets.join("Music", file_name))
+        index['music'][file_name.split('.')[0]] = add(data) + (file_name,)
+
+    index_data = json.dumps(index, sort_keys=True).encode('utf-8')
+    data_start = _align(HEADER.size + len(index_data))
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(index_data)))
+        f.write(index_data)
+        for blob_offset, data in blobs:
+            f.seek(data_start + blob_offset)
+            f.write(data)
+        return f.tell()
+
+
+class ResourcePack(object):
+    """A resource pack made by build_pack, mapped into memory.
+
+    Images are surfaces over the pack's memory, so loading one copies
+    nothing.  If the display's pixel format is not the one the pack
+    was built with, images are converted when loaded.
+    """
+    def __init__(self, path):
+        """Initialize the instance."""
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            magic, version, index_length = HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise ValueError("{} is not a resource pack.".format(path))
+            if version != VERSION:
+                raise ValueError(
+                    "{} is version {} of the pack format, not {}.".format(
+                        path, version, VERSION))
+            index = json.loads(self._map[
+                HEADER.size:HEADER.size + index_length].decode('utf-8'))
+        except Exception:
+            self.close()
+            raise
+        self._data_start = _align(HEADER.size + index_length)
+        self._view = memoryview(self._map)
+        self.pixel_format = index['pixel-format']
+        self.mixer_format = tuple(index['mixer'])
+        self.colors = dict((name, pygame.color.Color(*color))
+                           for name, color in index['colors'].items())
+        self.font_data = dict((name, tuple(font))
+                              for name, font in index['fonts'].items())
+        self.images = index['images']
+        self.sounds = index['sounds']
+        self.music = index['music']
+
+    def __repr__(self):
+        """Display the pack's path and contents."""
+        return "<ResourcePack {} {} images, {} sounds, {} music>".format(
+            self.path, len(self.images), len(self.sounds), len(self.music))
+
+    def _data(self, offset, length):
+        """Get a view of some of the pack's data."""
+        start = self._data_start + offset
+        return self._view[start:start + length]
+
+    def load_image(self, image_name):
+        """Make a surface for an image.  The display must be set up."""
+        offset, length, width, height = self.images[image_name]
+        image = pygame.image.frombuffer(
+            self._data(offset, length), (width, height), self.pixel_format)
+        if display_pixel_format() != self.pixel_format:
+            image = image.convert_alpha()
+        return image
+
+    def load_sound(self, sound_name):
+        """Make a Sound for a sound.
+
+        The mixer must be set up with the pack's mixer_format."""
+        if pygame.mixer.get_init() != self.mixer_format:
+            raise ValueError(
+                "The mixer's format {} is not the pack's {}.".format(
+                    pygame.mixer.get_init(), self.mixer_format))
+        return pygame.mixer.Sound(buffer=self._data(*self.sounds[sound_name]))
+
+    def source(self, music_name):
+        """Get an in-memory file for a music track."""
+        offset, length, _ = self.music[music_name]
+        return io.BytesIO(self._data(offset, length).tobytes())
+
+    def close(self):
+        """Unmap and close the pack."""
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        if getattr(self, '_map', None) is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass # Surfaces still use it; it goes away with them
+        self._file.close()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+"""The SharedFleet class, which updates planes in several processes
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+The fleet's arrays are laid out one after the other in a single block
+of shared memory, which every worker process maps.  Each tick, the
+parent writes the tick's length and the number of planes to a small
+shared control array and meets the workers at a barrier; every process
+then steps its share of the slots and they meet again.  Nothing is
+pickled per tick.  The airspace goes on doing collisions and objectives
+in the parent, as with a plain Fleet.
+
+Run this file to compare how long a tick takes with a Fleet and with a
+SharedFleet, from MIN_PARALLEL planes up:
+    python parallel.py --processes 4
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import argparse
+import atexit
+import multiprocessing
+import threading
+import timeit
+try:
+    from multiprocessing import shared_memory
+except ImportError: # Before Python 3.8
+    shared_memory = None
+
+import numpy
+
+from fleet import Fleet, step
+
+# Commands in the control array
+STEP = 0
+STOP = 1
+ALIGNMENT = 64 # Bytes each field's array is aligned to
+
+
+def _layout(capacity):
+    """Get each field's offset in a block for capacity planes.
+
+    Returns a list of (name, dtype, offset) and the block's size."""
+    layout = []
+    offset = 0
+    for name, dtype in Fleet.FIELDS:
+        layout.append((name, dtype, offset))
+        size = capacity * numpy.dtype(dtype).itemsize
+        offset += -(-size // ALIGNMENT) * ALIGNMENT
+    return layout, max(offset, 1)
+
+
+def _views(buffer_, capacity):
+    """Make the fleet's arrays from a shared block."""
+    return dict((name, numpy.ndarray(capacity, dtype, buffer_, offset))
+                for name, dtype, offset in _layout(capacity)[0])
+
+
+def _share(processes, index, count):
+    """Get the (start, stop) of the slots a process steps."""
+    return count * index // processes, count * (index + 1) // processes
+
+
+def _run_worker(index, processes, name, capacity, generation, control,
+                barrier, connection, timeout):
+    """Step a share of a SharedFleet's planes every tick.
+
+    When the fleet grows, the new block's name and capacity come
+    through connection.  Stops if nothing happens at the barrier for
+    timeout seconds."""
+    memory = shared_memory.SharedMemory(name)
+    arrays = _views(memory.buf, capacity)
+    try:
+        while True:
+            barrier.wait(timeout)
+            command, tick_duration, count, new_generation = control[:]
+            if command == STOP:
+                break
+            if new_generation != generation: # The fleet grew
+                arrays = None
+                memory.close()
+                while generation < new_generation: # Skip to the latest
+                    name, capacity = connection.recv()
+                    generation += 1
+                memory = shared_memory.SharedMemory(name)
+                arrays = _views(memory.buf, capacity)
+            start, stop = _share(processes, index, int(count))
+            step(arrays, tick_duration, start, stop)
+            barrier.wait(timeout)
+    except threading.BrokenBarrierError: # Timed out, or the parent failed
+        pass
+    except KeyboardInterrupt: # The parent deals with it
+        pass
+    finally:
+        arrays = None
+        memory.close()
+        connection.close()
+
+
+class SharedFleet(Fleet):
+    """A Fleet whose planes are updated by several processes.
+
+    Works like a Fleet.  Once it has at least MIN_PARALLEL planes, its
+    updates are split between processes processes (by default one per
+    CPU): the calling one and persistent worker processes, started on
+    the first such update.  Smaller fleets are updated in the calling
+    process only, as starting a tick costs more than it saves.
+
+    Call close when done, which stops the workers and moves the arrays
+    out of shared memory; it is called at exit otherwise.  Workers
+    left waiting for BARRIER_TIMEOUT seconds stop, and are started
+    again by the next update.  Without multiprocessing.shared_memory
+    (before Python 3.8), everything runs in the calling process.
+    """
+    MIN_PARALLEL = 4096
+    BARRIER_TIMEOUT = 60 # Seconds to wait for a stuck process
+    def __init__(self, capacity=Fleet.DEFAULT_CAPACITY, processes=None):
+        """Initialize the instance."""
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes if shared_memory is not None else 1
+        self._memory = None # The block holding the arrays
+        self._retired = [] # Blocks to free once nothing uses them
+        self._generation = 0 # Changes when the arrays are reallocated
+        self._workers = []
+        self._connections = []
+        self._control = None
+        self._barrier = None
+        super(SharedFleet, self).__init__(capacity)
+        if self.processes > 1: # Do not leave workers or shared memory
+            atexit.register(self.close)
+
+    def __repr__(self):
+        """Display the size of the fleet and the number of workers."""
+        return "<SharedFleet of {} planes, {} workers>".format(
+            len(self), len(self._workers))
+
+    def __enter__(self):
+        """Use the fleet in a with statement, closing it at the end."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the fleet."""
+        self.close()
+
+    def _allocate(self, capacity):
+        """Create empty arrays for capacity planes in shared memory."""
+        if self.processes <= 1:
+            return super(SharedFleet, self)._allocate(capacity)
+        memory = shared_memory.SharedMemory(
+            create=True, size=_layout(capacity)[1])
+        arrays = _views(memory.buf, capacity)
+        for array in arrays.values():
+            array[:] = 0
+        if self._memory is not None:
+            self._retired.append(self._memory)
+        self._memory = memory
+        self._generation += 1
+        for connection in self._connections:
+            connection.send((memory.name, capacity))
+        return arrays
+
+    def _free_retired(self):
+        """Free the blocks the arrays were moved out of."""
+        for memory in self._retired:
+            try:
+                memory.close()
+            except BufferError: # Still viewed; unmapped when unused
+                pass
+            memory.unlink()
+        self._retired = []
+
+    def _grow(self):
+        """Double the capacity, moving the arrays to a new block."""
+        super(SharedFleet, self)._grow()
+        self._free_retired()
+
+    def _start_workers(self):
+        """Start a worker process for every share but the first."""
+        self._control = multiprocessing.RawArray('d', 4)
+        self._control[:] = (STEP, 0, 0, self._generation)
+        self._barrier = multiprocessing.Barrier(self.processes)
+        for index in range(1, self.processes):
+            receiver, sender = multiprocessing.Pipe(False)
+            worker = multiprocessing.Process(
+                target=_run_worker, args=(
+                    index, self.processes, self._memory.name,
+                    self._capacity, self._generation, self._control,
+                    self._barrier, receiver, self.BARRIER_TIMEOUT))
+            worker.daemon = True
+            worker.start()
+            receiver.close()
+            self._connections.append(sender)
+            self._workers.append(worker)
+
+    def _stop_workers(self):
+        """Stop the worker processes."""
+        self._control[0] = STOP
+        try:
+            self._barrier.wait(self.BARRIER_TIMEOUT)
+        except threading.BrokenBarrierError: # Broken by a dead worker
+            pass
+        for worker in self._workers:
+            worker.join(self.BARRIER_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+        for connection in self._connections:
+            connection.close()
+        self._workers = []
+        self._connections = []
+
+    def update(self, tick_duration):
+        """Advance every plane by tick_duration seconds."""
+        count = self._count
+        if self.processes <= 1 or count < self.MIN_PARALLEL:
+            step(self.arrays, tick_duration, 0, count)
+            return
+        if self._workers and self._barrier.broken: # They stopped waiting
+            self._stop_workers()
+        if not self._workers:
+            self._start_workers()
+        self._control[:] = (STEP, tick_duration, count, self._generation)
+        try:
+            self._barrier.wait(self.BARRIER_TIMEOUT)
+            start, stop = _share(self.processes, 0, count)
+            step(self.arrays, tick_duration, start, stop)
+            self._barrier.wait(self.BARRIER_TIMEOUT)
+        except BaseException:
+            # Do not leave the workers waiting for this tick
+            self._barrier.abort()
+            raise
+
+    def close(self):
+        """Stop the workers and move the arrays out of shared memory.
+
+        The fleet can still be used afterwards, in this process only."""
+        if self._workers:
+            self._stop_workers()
+        if self._memory is not None:
+            self.arrays = dict((name, array.copy())
+                               for name, array in self.arrays.items())
+            self._retired.append(self._memory)
+            self._memory = None
+            self._free_retired()
+        if self.processes > 1:
+            atexit.unregister(self.close)
+        self.processes = 1
+
+
+def benchmark(sizes, ticks=100, processes=None):
+    """Time updating a Fleet and a SharedFleet of each size.
+
+    Returns a list of (planes, seconds per tick with a Fleet, seconds
+    per tick with a SharedFleet)."""
+    results = []
+    for size in sizes:
+        times = []
+        for fleet in (Fleet(size), SharedFleet(size, processes)):
+            for index in range(size):
+                plane = fleet.add_plane()
+                plane.throttle = 25 + index % 75
+                plane.roll_level = index % 9 - 4
+                plane.vertical_roll_level = index % 5 - 2
+            fleet.update(0) # Starts the workers
+            times.append(min(timeit.repeat(
+                lambda: fleet.update(1 / 60), number=ticks, repeat=3))
+                         / ticks)
+            if isinstance(fleet, SharedFleet):
+                fleet.close()
+        results.append((size,) + tuple(times))
+    return results
+
+
+def main(argv=None):
+    """Print how long a tick takes with a Fleet and a SharedFleet."""
+    parser = argparse.ArgumentParser(
+        description='Compare updating a Fleet and a SharedFleet.')
+    parser.add_argument('--processes', type=int,
+                        help='SharedFleet processes (default: one per CPU)')
+    parser.add_argument('--ticks', type=int, default=100,
+                        help='ticks timed per try (default: %(default)s)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[
+        SharedFleet.MIN_PARALLEL * 2**power for power in range(6)],
+                        metavar='PLANES',
+                        help='fleet sizes (default: MIN_PARALLEL to '
+                        '32 MIN_PARALLEL)')
+    args = parser.parse_args(argv)
+    print("{:>9} {:>12} {:>12} {:>8}".format(
+        'Planes', 'Fleet', 'SharedFleet', 'Speedup'))
+    for size, plain, shared in benchmark(args.sizes, args.ticks,
+                                         args.processes):
+        print("{:>9} {:>10.3f}ms {:>10.3f}ms {:>7.2f}x".format(
+            size, plain * 1000, shared * 1000, plain / shared))
+
+
+if __name__ == '__main__':
+    main()
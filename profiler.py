@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""The FrameProfiler class
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import csv
+import json
+import math
+import timeit
+
+
+class FrameProfiler(object):
+    """Times the phases of each frame, keeping the last size frames.
+
+    Call start_frame at the start of a frame, mark(phase) at the end
+    of each phase and end_frame at the end.  A phase's time is the
+    time since the previous mark; a phase marked several times in a
+    frame adds up.  Times are in seconds.
+    """
+    def __init__(self, size=3600):
+        """Initialize the instance."""
+        if size < 1:
+            raise ValueError("size must be at least 1.")
+        self.size = size
+        self.frames = 0 # Frames finished so far
+        self.phases = [] # Phase names, in the order first marked
+        self._times = {} # Ring buffer of each phase's times per frame
+        self._current = {} # Each phase's time in this frame so far
+        self._last = None # When the last mark was
+
+    def __repr__(self):
+        """Display the number of frames and phases."""
+        return "<FrameProfiler {} frames, {} phases>".format(
+            self.frames, len(self.phases))
+
+    def start_frame(self):
+        """Start timing a frame."""
+        self._current = {}
+        self._last = timeit.default_timer()
+
+    def mark(self, phase):
+        """End a phase, giving it the time since the last mark."""
+        now = timeit.default_timer()
+        self._current[phase] = (
+            self._current.get(phase, 0) + now - self._last)
+        self._last = now
+
+    def end_frame(self):
+        """Store the frame's times."""
+        slot = self.frames % self.size
+        for phase, duration in self._current.items():
+            if phase not in self._times:
+                self.phases.append(phase)
+                self._times[phase] = [0] * self.size
+            self._times[phase][slot] = duration
+        for phase in self.phases:
+            if phase not in self._current:
+                self._times[phase][slot] = 0
+        self.frames += 1
+
+    def times(self, phase):
+        """Get a phase's time in each kept frame, oldest first."""
+        count = min(self.frames, self.size)
+        start = (self.frames - count) % self.size
+        times = self._times[phase]
+        return (times[start:] + times[:start])[:count]
+
+    def frame_times(self):
+        """Get the total time of each kept frame, oldest first."""
+        return [sum(frame) for frame
+                in zip(*(self.times(phase) for phase in self.phases))]
+
+    @staticmethod
+    def percentile(values, fraction):
+        """Get the value that fraction of the values are at or below."""
+        if not values:
+            return 0
+        values = sorted(values)
+        index = max(int(math.ceil(fraction * len(values))) - 1, 0)
+        return values[index]
+
+    def summary(self):
+        """Get each phase's statistics, and the whole frame's as 'frame'.
+
+        Returns a list of (name, p50, p99, mean, max) tuples."""
+        rows = []
+        for name, times in ([(phase, self.times(phase))
+                             for phase in self.phases]
+                            + [('frame', self.frame_times())]):
+            rows.append((
+                name, self.percentile(times, 0.5),
+                self.percentile(times, 0.99),
+                sum(times) / len(times) if times else 0,
+                max(times) if times else 0))
+        return rows
+
+    def export(self, path):
+        """Save the kept frames' times to a file.
+
+        A .csv file gets a row of phase times in milliseconds per
+        frame; any other file gets JSON with the summary and times."""
+        if path.lower().endswith('.csv'):
+            with open(path, 'w') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow(['frame'] + self.phases)
+                first = self.frames - min(self.frames, self.size)
+                columns = [self.times(phase) for phase in self.phases]
+                for index, frame in enumerate(zip(*columns)):
+                    writer.writerow([first + index] + [
+                        "%.4f" % (duration * 1000) for duration in frame])
+        else:
+            with open(path, 'w') as f:
+                json.dump({
+                    'frames': self.frames,
+                    'summary': dict(
+                        (name, {'p50': p50, 'p99': p99,
+                                'mean': mean, 'max': max_})
+                        for name, p50, p99, mean, max_
+                        in self.summary()),
+                    'times': dict((phase, self.times(phase))
+                                  for phase in self.phases),
+                }, f, indent=2, sort_keys=True)
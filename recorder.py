@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+"""The FlightRecorder class, a binary per-tick flight data recorder
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+File layout (all numbers little-endian):
+
+ -> Header: the magic bytes b'SFFDR', the format version (2 bytes)
+    and the length of the schema (4 bytes)
+ -> Schema: UTF-8 JSON with the columns' names and NumPy dtypes, the
+    timestep and whether chunks are compressed
+ -> Chunks, each made of its number of rows (4 bytes), its stored
+    length (4 bytes) and its data.  The data is every column's values
+    one column after the other.  If the file is compressed, each
+    column is zlib-compressed on its own and preceded by its
+    compressed length (4 bytes), so it can be read without the others.
+    (In version 1, the columns were compressed together.)
+
+Every row is one plane at one tick.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import json
+import struct
+import threading
+import zlib
+try:
+    import queue
+except ImportError: # Python 2
+    import Queue as queue
+
+import numpy
+
+MAGIC = b'SFFDR'
+VERSION = 2
+HEADER = struct.Struct('<5sHI')
+CHUNK = struct.Struct('<II')
+COLUMN = struct.Struct('<I') # A compressed column's length
+
+
+class FlightRecorder(object):
+    """Records the state of every plane in an airspace after every tick.
+
+    Rows go into preallocated NumPy column buffers.  When a buffer is
+    full it is handed to a background thread, which writes (and
+    compresses) it while recording goes on in the next buffer.  If
+    every buffer is waiting to be written, recording waits too, so no
+    data is lost; stalls counts how often that happened.
+
+    Add a recorder to an airspace's recorders list to use it, and
+    close it when done.
+    """
+    COLUMNS = (
+        ('tick', numpy.int64),
+        ('time', numpy.float64),
+        ('plane', numpy.int32),
+        ('x', numpy.float64),
+        ('z', numpy.float64),
+        ('altitude', numpy.float64),
+        ('heading', numpy.float64),
+        ('pitch', numpy.float64),
+        ('speed', numpy.float64),
+        ('acceleration', numpy.float64),
+        ('gravity', numpy.float64),
+        ('throttle', numpy.float64),
+        ('roll_level', numpy.float64),
+        ('vertical_roll_level', numpy.float64),
+        ('health', numpy.float64),
+        ('points', numpy.int32),
+        ('autopilot', numpy.bool_),
+    )
+    # The columns read straight from a plane's attribute of that name
+    PLANE_FIELDS = ('x', 'z', 'altitude', 'heading', 'pitch', 'speed',
+                    'acceleration', 'gravity', 'throttle', 'roll_level',
+                    'vertical_roll_level', 'health', 'points')
+    DEFAULT_CHUNK_ROWS = 4096
+    DEFAULT_BUFFERS = 4
+
+    def __init__(self, path, timestep, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 buffers=DEFAULT_BUFFERS, compress=True):
+        """Initialize the instance.
+
+        timestep is the length of a tick in seconds."""
+        if chunk_rows < 1 or buffers < 2:
+            raise ValueError(
+                "There must be at least 1 row per chunk and 2 buffers.")
+        self.path = path
+        self.timestep = timestep
+        self.chunk_rows = chunk_rows
+        self.compress = compress
+        self.rows = 0 # Rows recorded so far
+        self.stalls = 0
+        self._file = open(path, 'wb')
+        schema = json.dumps({
+            'columns': [(name, numpy.dtype(dtype).str)
+                        for name, dtype in self.COLUMNS],
+            'timestep': timestep,
+            'compressed': compress,
+        }).encode('utf-8')
+        self._file.write(HEADER.pack(MAGIC, VERSION, len(schema)))
+        self._file.write(schema)
+        # Buffers go from _free to recording to _full to the writer
+        self._free = queue.Queue()
+        self._full = queue.Queue()
+        for _ in range(buffers):
+            self._free.put(dict((name, numpy.empty(chunk_rows, dtype))
+                                for name, dtype in self.COLUMNS))
+        self._buffer = self._free.get()
+        self._count = 0 # Rows in the current buffer
+        self._error = None # An exception raised by the writer
+        self._writer = threading.Thread(target=self._write_chunks)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def __repr__(self):
+        """Display the recorder's file and progress."""
+        return "<FlightRecorder {} {} rows>".format(self.path, self.rows)
+
+    def record(self, airspace, tick):
+        """Record every plane in an airspace at a tick."""
+        fleet = airspace.fleet
+        if fleet is None:
+            planes = airspace.planes.ordered()
+        else:
+            planes = fleet.planes
+        count = len(planes)
+        start = 0
+        while start < count: # Split the planes across chunks if needed
+            if self._count == self.chunk_rows:
+                self.flush()
+            stop = min(count, start + self.chunk_rows - self._count)
+            self._record_rows(fleet, planes, start, stop, tick)
+            start = stop
+        self.rows += count
+
+    def _record_rows(self, fleet, planes, start, stop, tick):
+        """Record the planes from start to stop in the current buffer."""
+        buffer = self._buffer
+        first = self._count
+        last = first + stop - start
+        buffer['tick'][first:last] = tick
+        buffer['time'][first:last] = tick * self.timestep
+        if fleet is not None: # Copy whole columns
+            arrays = fleet.arrays
+            for name in self.PLANE_FIELDS:
+                if name in arrays:
+                    buffer[name][first:last] = arrays[name][start:stop]
+            buffer['autopilot'][first:last] = arrays['autopilot'][start:stop]
+            for row, plane in enumerate(planes[start:stop], first):
+                buffer['plane'][row] = plane.id_
+                buffer['points'][row] = plane.points
+        else:
+            for row, plane in enumerate(planes[start:stop], first):
+                buffer['plane'][row] = plane.id_
+                for name in self.PLANE_FIELDS:
+                    buffer[name][row] = getattr(plane, name)
+                # autopilot_enabled can change the plane; this does not
+                buffer['autopilot'][row] = plane.autopilot_on
+        self._count = last
+
+    def flush(self):
+        """Hand the rows recorded so far to the writer."""
+        if self._error is not None:
+            raise self._error
+        if not self._count:
+            return
+        self._full.put((self._buffer, self._count))
+        try:
+            self._buffer = self._free.get_nowait()
+        except queue.Empty: # The writer is behind
+            self.stalls += 1
+            self._buffer = self._free.get()
+        self._count = 0
+
+    def close(self):
+        """Write everything recorded and close the file."""
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._full.put(None)
+            self._writer.join()
+            self._file.close()
+        if self._error is not None:
+            raise self._error
+
+    def _write_chunks(self):
+        """Write full buffers to the file until close() is called.
+
+        Runs in the writer thread."""
+        while True:
+            item = self._full.get()
+            if item is None:
+                return
+            buffer, count = item
+            if self._error is None:
+                try:
+                    columns = [buffer[name][:count].tobytes()
+                               for name, _ in self.COLUMNS]
+                    if self.compress:
+                        columns = [zlib.compress(column, 1)
+                                   for column in columns]
+                        columns = [part for column in columns for part in (
+                            COLUMN.pack(len(column)), column)]
+                    data = b''.join(columns)
+                    self._file.write(CHUNK.pack(count, len(data)))
+                    self._file.write(data)
+                except Exception as e:
+                    self._error = e
+            self._free.put(buffer)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""The InputRecorder and Replay classes, for replaying flights
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A flight is replayed by starting an airspace the same way, with the
+same seed, and setting the plane's controls to what they were
+at the same ticks.  Only ticks where the controls changed are stored.
+
+File layout (all numbers little-endian):
+
+ -> Header: the magic bytes b'SFINP', the format version (2 bytes),
+    the airspace's seed (4 bytes), the tick rate (8 byte float), the
+    player ID (4 bytes), the number of ticks flown (4 bytes, 0 if the
+    recording was not closed) and the plane's final x, z, altitude,
+    health and points (8 byte floats)
+ -> Changes, each made of the tick they happen before (4 bytes), the
+    roll level, vertical roll level and throttle (8 byte floats) and
+    the autopilot's state (1 byte, see FLAGS)
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import struct
+
+MAGIC = b'SFINP'
+VERSION = 1
+HEADER = struct.Struct('<5sHIdiI5d')
+CHANGE = struct.Struct('<IdddB')
+# Bits of the autopilot byte, in the order of Airplane.controls
+FLAGS = (1, 2, 4, 8)
+
+
+def _final_state(plane):
+    """Get the state stored to check that a replay matches."""
+    return (plane.x, plane.z, plane.altitude, plane.health, plane.points)
+
+
+class InputRecorder(object):
+    """Records how a plane's controls change, so a flight can be replayed.
+
+    seed is the airspace's seed, a 32-bit integer; the airspace must
+    not have placed any objectives yet.  Call capture before each
+    airspace update and settle after it.  Controls that changed between
+    updates are written to the file.
+    """
+    def __init__(self, path, tick_rate, player_id, seed):
+        """Initialize the instance."""
+        self.path = path
+        self.tick_rate = tick_rate
+        self.player_id = player_id
+        self.seed = seed
+        self.changes = 0
+        self._controls = None # The controls after the last update
+        self._file = open(path, 'wb')
+        self._write_header(0, (0, 0, 0, 0, 0))
+
+    def __repr__(self):
+        """Display the file and the number of changes recorded."""
+        return "<InputRecorder {} {} changes>".format(self.path, self.changes)
+
+    def _write_header(self, ticks, final_state):
+        """Write the header at the start of the file."""
+        self._file.seek(0)
+        self._file.write(HEADER.pack(
+            MAGIC, VERSION, self.seed, self.tick_rate, self.player_id,
+            ticks, *final_state))
+
+    def capture(self, plane, tick):
+        """Record the plane's controls if they changed since settle.
+
+        tick is the tick the next update starts with."""
+        controls = plane.controls
+        if controls != self._controls:
+            flags = sum(flag for flag, on in zip(FLAGS, controls[3:]) if on)
+            self._file.write(CHANGE.pack(tick, controls[0], controls[1],
+                                         controls[2], flags))
+            self.changes += 1
+        self._controls = controls
+
+    def settle(self, plane):
+        """Remember the plane's controls after an update."""
+        self._controls = plane.controls
+
+    def close(self, plane, ticks):
+        """Finish the file with the number of ticks and the outcome."""
+        if self._file.closed:
+            return
+        self._file.flush()
+        self._write_header(ticks, _final_state(plane))
+        self._file.close()
+
+
+class Replay(object):
+    """Replays a flight recorded by an InputRecorder.
+
+    Reseed an airspace with seed, set its tick_rate and add a plane
+    with player_id like the recorded game did.  Then call the replay
+    as replay(plane, airspace) before every step; it works as a
+    HeadlessSimulation controller.
+    """
+    def __init__(self, path):
+        """Initialize the instance."""
+        self.path = path
+        with open(path, 'rb') as f:
+            data = f.read()
+        header = HEADER.unpack_from(data)
+        if header[0] != MAGIC:
+            raise ValueError("{} is not an input recording.".format(path))
+        if header[1] != VERSION:
+            raise ValueError(
+                "{} is version {} of the input format, not {}.".format(
+                    path, header[1], VERSION))
+        (self.seed, self.tick_rate, self.player_id,
+         self.recorded_ticks) = header[2:6]
+        self.final_state = header[6:]
+        self.changes = {} # Tick: list of controls, in order
+        last_tick = 0
+        end = len(data) - (len(data) - HEADER.size) % CHANGE.size
+        for offset in range(HEADER.size, end, CHANGE.size):
+            tick, roll, vertical_roll, throttle, flags = (
+                CHANGE.unpack_from(data, offset))
+            self.changes.setdefault(tick, []).append(
+                (roll, vertical_roll, throttle)
+                + tuple(bool(flags & flag) for flag in FLAGS))
+            last_tick = max(last_tick, tick)
+        # Unclosed recordings run until their last change
+        self.ticks = self.recorded_ticks or last_tick
+
+    def __repr__(self):
+        """Display the file and length of the replay."""
+        return "<Replay {} {} ticks, {} changes>".format(
+            self.path, self.ticks, sum(map(len, self.changes.values())))
+
+    def __call__(self, plane, airspace):
+        """Set the plane's controls before the airspace's next step."""
+        self.apply(plane, airspace.clock.ticks + 1)
+
+    def apply(self, plane, tick):
+        """Set the plane's controls before a tick."""
+        for controls in self.changes.get(tick, ()):
+            plane.controls = controls
+
+    def matches(self, plane):
+        """Test if a plane ended up like the recorded one.
+
+        Only meaningful after replaying every tick of a closed
+        recording."""
+        return (bool(self.recorded_ticks)
+                and _final_state(plane) == self.final_state)
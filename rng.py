@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""The RandomStream class
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import random
+
+
+class RandomStream(object):
+    """A seeded source of random objective positions for one airspace.
+
+    The same seed always gives the same positions.  Positions are drawn
+    batch_size at a time, which is much faster than one at a time;
+    uniform draws other random numbers one at a time.
+
+    If use_numpy is True, NumPy's generator is used instead of Python's
+    random module.  The two give different positions for a seed.
+    """
+    BATCH_SIZE = 256
+    def __init__(self, seed=None, use_numpy=False, batch_size=BATCH_SIZE):
+        """Initialize the instance.
+
+        If seed is None, a random one is chosen; it is kept in seed so
+        the run can be repeated."""
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+        self.seed = seed
+        self.use_numpy = use_numpy
+        self.batch_size = batch_size
+        if use_numpy:
+            import numpy # Optional
+            if isinstance(seed, numpy.random.SeedSequence):
+                self._seed_sequence = seed
+            else:
+                self._seed_sequence = numpy.random.SeedSequence(seed)
+            self._generator = numpy.random.default_rng(self._seed_sequence)
+        else:
+            self._generator = random.Random(seed)
+        self._spawned = 0
+        self._bounds = None # The bounds the batch was drawn for
+        self._batch = []
+
+    def __repr__(self):
+        """Display the seed and the kind of generator."""
+        return "<RandomStream seed {} ({})>".format(
+            self.seed, "NumPy" if self.use_numpy else "Python")
+
+    def position(self, width, height, low, high):
+        """Get a random (x, z, altitude).
+
+        x is from 0 to width, z from 0 to height and altitude from low
+        to high, all included."""
+        bounds = (width, height, low, high)
+        if bounds != self._bounds:
+            self._bounds = bounds
+            self._batch = []
+        if not self._batch:
+            self._batch = self._draw(*bounds)
+        return self._batch.pop()
+
+    def uniform(self, low, high):
+        """Get a random number from low to high.
+
+        Unlike positions, it is drawn on its own, so drawing it leaves
+        the batch of positions as it was."""
+        return float(self._generator.uniform(low, high))
+
+    def _draw(self, width, height, low, high):
+        """Draw a batch of positions, in the reverse order of use."""
+        if self.use_numpy:
+            batch = self._generator.integers(
+                (0, 0, low), (width + 1, height + 1, high + 1),
+                size=(self.batch_size, 3)).tolist()
+            return [tuple(position) for position in batch]
+        rand = self._generator.random
+        return [(int(rand() * (width + 1)), int(rand() * (height + 1)),
+                 low + int(rand() * (high - low + 1)))
+                for _ in range(self.batch_size)]
+
+    def spawn(self, n):
+        """Make n independent streams, for airspaces run side by side.
+
+        The streams only depend on this stream's seed and how many
+        were spawned before."""
+        if self.use_numpy:
+            seeds = self._seed_sequence.spawn(n)
+        else:
+            seeds = ["{}/{}".format(self.seed, index) for index
+                     in range(self._spawned, self._spawned + n)]
+        self._spawned += n
+        return [RandomStream(seed, self.use_numpy, self.batch_size)
+                for seed in seeds]
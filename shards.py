@@ -0,0 +1,522 @@
+#!/usr/bin/env python
+
+"""The ShardedAirspace class, an airspace made of tiles in processes
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+The world is a grid of tiles, each an ordinary Airspace of
+AIRSPACE_DIM x AIRSPACE_DIM with its own seeded stream, in coordinates
+local to the tile.  The tiles are split between worker processes, and
+after every tick the workers' messages are passed on by the parent, to
+be handled at the start of the next tick:
+
+ -> A plane whose position leaves its tile is handed off to the tile
+    it entered.  Leaving the world is still an exit.
+ -> Objectives close enough to an edge to be touched from the other
+    side are sent to the neighbouring tiles as ghosts whenever they
+    change.
+ -> A plane touching a ghost claims it from the tile owning it.  The
+    owner takes the objective if it is still there and grants the
+    point, which reaches the plane wherever it has flown since, or
+    refuses it.
+
+So a point scored across an edge arrives two ticks late.  If the plane
+exits before every claim it made is answered, its exit is recorded
+once they are, with the points granted.  The results only depend on
+the seed, not on the number of processes.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import multiprocessing
+
+from airspace import Airspace
+from clock import SimulationClock
+from objects import Objective
+from rng import RandomStream
+from spatial import SpatialGrid
+
+# The plane attributes handed off between tiles, besides its controls
+PLANE_STATE = ('x', 'z', 'altitude', 'heading', 'pitch', 'speed',
+               'acceleration', 'gravity', 'health', 'points')
+
+
+def _empty_inbox():
+    """Get the messages for a tile when there are none."""
+    return {'planes': [], 'claims': [], 'grants': [], 'ghosts': {},
+            'objectives': 0}
+
+
+class Tile(object):
+    """One tile of a ShardedAirspace and the airspace inside it."""
+    def __init__(self, index, column, row, columns, rows, stream,
+                 tick_rate=SimulationClock.DEFAULT_TICK_RATE, fleet=False):
+        """Initialize the instance.
+
+        If fleet is True, the tile's planes are kept in a fleet.Fleet."""
+        if fleet:
+            from fleet import Fleet # Needs NumPy
+            fleet = Fleet()
+        else:
+            fleet = None
+        self.index = index
+        self.column = column
+        self.row = row
+        self.columns = columns
+        self.rows = rows
+        self.airspace = Airspace(tick_rate=tick_rate, fleet=fleet,
+                                 stream=stream)
+        self.size = self.airspace.width
+        # How close to an edge an objective can be touched from across
+        self.margin = self.size * 0.06
+        self.ghosts = {} # Tile index: list of ghost objectives
+        self.ghost_grid = SpatialGrid(
+            self.size*0.12, Airspace.ALTITUDE_TOLERANCE*2)
+        self._borders = {} # Tile index: the ghosts last sent there
+        self._objective_ids = None # The objectives _borders is for
+
+    def __repr__(self):
+        """Display the tile's place and contents."""
+        return "<Tile ({}, {}) {} planes, {} objectives>".format(
+            self.column, self.row, len(self.airspace.planes),
+            len(self.airspace.objectives))
+
+    def neighbour(self, dx, dz):
+        """Get the index of a neighbouring tile, or None at the edge."""
+        column = self.column + dx
+        row = self.row + dz
+        if 0 <= column < self.columns and 0 <= row < self.rows:
+            return row * self.columns + column
+        return None
+
+    def to_world(self, x, z):
+        """Convert a position in the tile to one in the world."""
+        return self.column * self.size + x, self.row * self.size + z
+
+    def step(self, inbox):
+        """Handle the messages for the tile, then simulate a tick.
+
+        Returns the messages the tile sends, as a list of
+        (kind, destination, payload).  Planes, claims and ghosts go to
+        a tile index; grants and refusals go to a player ID; exits
+        go to None."""
+        airspace = self.airspace
+        outbox = []
+        for state in inbox['planes']:
+            self.add_plane(state)
+        for objective_id, player_id in inbox['claims']:
+            objective = airspace.objectives.get(objective_id)
+            if objective is not None:
+                airspace.remove_objective(objective)
+                airspace.generate_objective()
+                outbox.append(('grant', player_id, None))
+            else: # Taken first by another plane
+                outbox.append(('refuse', player_id, None))
+        for player_id in inbox['grants']:
+            plane = airspace.planes.get(player_id)
+            if plane is not None:
+                plane.points += 1
+        for index, ghosts in sorted(inbox['ghosts'].items()):
+            self.set_ghosts(index, ghosts)
+        for _ in range(inbox['objectives']):
+            airspace.generate_objective()
+
+        airspace.update(airspace.clock.timestep)
+
+        for plane in airspace.planes.ordered():
+            # Touching a ghost claims it from the tile owning it
+            if self.ghosts and self.near_edge(plane):
+                for ghost in airspace.touching(
+                        plane.rect, plane.altitude, self.ghost_grid):
+                    self.ghost_grid.discard(ghost)
+                    outbox.append(('claim', ghost.owner,
+                                   (ghost.id_, plane.id_)))
+            exit_code = airspace.get_exit_code(plane)
+            dx = int(plane.x // self.size)
+            dz = int(plane.z // self.size)
+            if exit_code == 4 and self.in_world(plane):
+                exit_code = None # Only left the tile
+            if (dx or dz) and self.neighbour(dx, dz) is None:
+                exit_code = exit_code or 4 # Left the world
+            if exit_code:
+                x, z = self.to_world(plane.x, plane.z)
+                outbox.append(('exit', None, (
+                    plane.id_, exit_code, plane.points, x, z,
+                    plane.altitude, plane.health)))
+                airspace.remove_plane(plane.id_)
+            elif dx or dz:
+                state = self.plane_state(plane)
+                state['x'] -= dx * self.size
+                state['z'] -= dz * self.size
+                outbox.append(('plane', self.neighbour(dx, dz), state))
+                airspace.remove_plane(plane.id_)
+        # Objectives never move, so borders only change with them
+        objective_ids = airspace.objectives.ids()
+        if objective_ids != self._objective_ids:
+            self._objective_ids = objective_ids
+            for index, ghosts in self.borders().items():
+                if ghosts != self._borders.get(index, []):
+                    outbox.append(('ghosts', index, ghosts))
+                    self._borders[index] = ghosts
+        return outbox
+
+    def near_edge(self, plane):
+        """Test if a plane is close enough to an edge to touch a ghost."""
+        low, high = self.margin, self.size - self.margin
+        return (plane.x < low or plane.x > high
+                or plane.z < low or plane.z > high)
+
+    def in_world(self, plane):
+        """Test if a plane is still inside the whole world."""
+        rect = plane.rect
+        x, z = self.to_world(rect.left, rect.top)
+        return (x >= 0 and z >= 0
+                and x + rect.width <= self.columns * self.size
+                and z + rect.height <= self.rows * self.size)
+
+    def add_plane(self, state):
+        """Add a plane from its state, in the tile's coordinates."""
+        plane = self.airspace.add_plane(player_id=state['player_id'])
+        for name in PLANE_STATE:
+            setattr(plane, name, state[name])
+        plane.controls = state['controls']
+        plane.save_state()
+        self.airspace.plane_grid.move(plane)
+        return plane
+
+    @staticmethod
+    def plane_state(plane):
+        """Get what is needed to carry on a plane in another tile."""
+        state = dict((name, getattr(plane, name)) for name in PLANE_STATE)
+        state['player_id'] = plane.id_
+        state['controls'] = plane.controls
+        return state
+
+    def borders(self):
+        """Get the objectives each neighbour should have as ghosts.
+
+        Returns a dictionnary from tile indexes to lists of
+        (ID, x, z, altitude), in the neighbour's coordinates."""
+        borders = {}
+        low, high = self.margin, self.size - self.margin
+        for objective in self.airspace.objectives.ordered():
+            sides_x = [0] + ([-1] if objective.x < low else []) + (
+                [1] if objective.x > high else [])
+            sides_z = [0] + ([-1] if objective.z < low else []) + (
+                [1] if objective.z > high else [])
+            for dx in sides_x:
+                for dz in sides_z:
+                    index = self.neighbour(dx, dz) if dx or dz else None
+                    if index is not None:
+                        borders.setdefault(index, []).append((
+                            objective.id_, objective.x - dx * self.size,
+                            objective.z - dz * self.size,
+                            objective.altitude))
+        for index in self._borders: # Tell them if they have none now
+            borders.setdefault(index, [])
+        return borders
+
+    def set_ghosts(self, index, ghosts):
+        """Replace the ghosts sent by a neighbouring tile."""
+        for ghost in self.ghosts.pop(index, []):
+            self.ghost_grid.discard(ghost)
+        if ghosts:
+            self.ghosts[index] = []
+            for objective_id, x, z, altitude in ghosts:
+                ghost = Objective(x, z, self.size*0.06, self.size*0.06,
+                                  altitude, obj_id=objective_id)
+                ghost.owner = index
+                self.ghosts[index].append(ghost)
+                self.ghost_grid.add(ghost)
+
+    def planes(self):
+        """Get the states of the tile's planes, in world coordinates."""
+        states = []
+        for plane in self.airspace.planes.ordered():
+            state = self.plane_state(plane)
+            state['x'], state['z'] = self.to_world(plane.x, plane.z)
+            state['tile'] = self.index
+            states.append(state)
+        return states
+
+    def objectives(self):
+        """Get the tile's objectives' (x, z, altitude) in the world."""
+        return [self.to_world(objective.x, objective.z)
+                + (objective.altitude,)
+                for objective in self.airspace.objectives.ordered()]
+
+
+class TileGroup(object):
+    """The tiles one process simulates."""
+    def __init__(self, tiles):
+        """Initialize the instance."""
+        self.tiles = dict((tile.index, tile) for tile in tiles)
+
+    def step(self, inboxes):
+        """Simulate a tick of every tile.
+
+        inboxes is a dictionnary from tile indexes to their messages.
+        Returns a list of (source tile, kind, destination, payload)."""
+        messages = []
+        for index, tile in sorted(self.tiles.items()):
+            for message in tile.step(inboxes.get(index, _empty_inbox())):
+                messages.append((index,) + message)
+        return messages
+
+    def planes(self):
+        """Get the states of every tile's planes."""
+        return [state for _, tile in sorted(self.tiles.items())
+                for state in tile.planes()]
+
+    def objectives(self):
+        """Get the positions of every tile's objectives."""
+        return [position for _, tile in sorted(self.tiles.items())
+                for position in tile.objectives()]
+
+
+def _run_worker(connection, tiles):
+    """Run a TileGroup for a ShardedAirspace's commands."""
+    group = TileGroup(tiles)
+    try:
+        while True:
+            command, args = connection.recv()
+            if command == 'close':
+                break
+            connection.send(getattr(group, command)(*args))
+    except (EOFError, KeyboardInterrupt): # Parent went away
+        pass
+    finally:
+        connection.close()
+
+
+class ShardedAirspace(object):
+    """An airspace of columns x rows tiles, split between processes.
+
+    Each tile is AIRSPACE_DIM metres wide and deep.  The tiles are
+    split in runs of neighbouring tiles between processes worker
+    processes (by default one per CPU, and none if processes is 1).
+    Positions given and returned are in world coordinates.  Call
+    close when done.
+    """
+    def __init__(self, columns, rows, seed=None, processes=None,
+                 tick_rate=SimulationClock.DEFAULT_TICK_RATE,
+                 objectives=1, fleet=False):
+        """Initialize the instance.
+
+        Each tile starts with objectives objectives.  If fleet is
+        True, each tile keeps its planes in a fleet.Fleet."""
+        self.columns = columns
+        self.rows = rows
+        self.size = Airspace.AIRSPACE_DIM
+        self.random = RandomStream(seed)
+        self.timestep = 1 / tick_rate
+        self.ticks = 0
+        self.exits = [] # (player ID, exit code, points, x, z, tick)
+        self._next_id = 0
+        self._locations = {} # Player ID: tile index
+        self._claims = {} # Player ID: claims not answered yet
+        self._held = {} # Player ID: exit waiting for its claims
+        count = columns * rows
+        tiles = [Tile(index, index % columns, index // columns, columns,
+                      rows, stream, tick_rate, fleet)
+                 for index, stream in enumerate(self.random.spawn(count))]
+        self._inboxes = dict((index, _empty_inbox())
+                             for index in range(count))
+        for inbox in self._inboxes.values():
+            inbox['objectives'] = objectives
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        processes = max(min(processes, count), 1)
+        self._shares = [] # The tile indexes of each group
+        self._connections = []
+        self._workers = []
+        self._group = None
+        if processes == 1:
+            self._group = TileGroup(tiles)
+            self._shares.append(range(count))
+            return
+        for index in range(processes):
+            share = range(count * index // processes,
+                          count * (index + 1) // processes)
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_run_worker,
+                args=(worker_connection, [tiles[tile] for tile in share]))
+            worker.daemon = True
+            worker.start()
+            worker_connection.close()
+            self._shares.append(share)
+            self._connections.append(connection)
+            self._workers.append(worker)
+
+    def __repr__(self):
+        """Display the size of the world and the number of processes."""
+        return "<ShardedAirspace {}x{} tiles, {} planes, {} workers>" \
+               "".format(self.columns, self.rows, len(self._locations),
+                         len(self._workers))
+
+    def __enter__(self):
+        """Use the airspace in a with statement, closing it at the end."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the airspace."""
+        self.close()
+
+    @property
+    def width(self):
+        """Get the width of the world in metres."""
+        return self.columns * self.size
+    @property
+    def height(self):
+        """Get the depth of the world in metres."""
+        return self.rows * self.size
+
+    def _call(self, command, args_per_group):
+        """Run a TileGroup method in every group, all at once.
+
+        Returns the results of each group, in order."""
+        if self._group is not None:
+            return [getattr(self._group, command)(*args_per_group[0])]
+        for connection, args in zip(self._connections, args_per_group):
+            connection.send((command, args))
+        return [connection.recv() for connection in self._connections]
+
+    def add_plane(self, x, z, altitude=0, player_id=None, **state):
+        """Add a plane at a position in the world.
+
+        state can give the other values of PLANE_STATE and the
+        controls.  The plane appears at the start of the next tick.
+        Returns its player ID."""
+        if not (0 <= x < self.width and 0 <= z < self.height):
+            raise ValueError("({}, {}) is outside the world.".format(x, z))
+        if player_id is None:
+            player_id = self._next_id
+        if player_id in self._locations:
+            raise ValueError("Player ID {} is taken.".format(player_id))
+        self._next_id = max(self._next_id, player_id + 1)
+        column, row = int(x // self.size), int(z // self.size)
+        index = row * self.columns + column
+        full_state = dict((name, 0) for name in PLANE_STATE)
+        full_state.update(health=100, controls=(0, 0, 0, False, True,
+                                                True, True))
+        full_state.update(state)
+        full_state.update(x=x - column * self.size,
+                          z=z - row * self.size, altitude=altitude,
+                          player_id=player_id)
+        self._inboxes[index]['planes'].append(full_state)
+        self._locations[player_id] = index
+        return player_id
+
+    def step(self):
+        """Simulate one tick everywhere."""
+        inboxes = self._inboxes
+        results = self._call('step', [
+            (dict((index, inboxes[index]) for index in share),)
+            for share in self._shares])
+        self.ticks += 1
+        self._inboxes = inboxes = dict(
+            (index, _empty_inbox()) for index in inboxes)
+        grants = {} # Points to pass on, by player ID
+        # Answers to claims come before exits, so a plane that exits
+        # in the same tick as its point is granted still gets it
+        for source, kind, destination, payload in sorted(
+                (message for messages in results for message in messages),
+                key=lambda message: (message[1] == 'exit', message[0])):
+            if kind == 'plane':
+                inboxes[destination]['planes'].append(payload)
+                self._locations[payload['player_id']] = destination
+            elif kind == 'claim':
+                inboxes[destination]['claims'].append(payload)
+                player_id = payload[1]
+                self._claims[player_id] = self._claims.get(player_id, 0) + 1
+            elif kind == 'ghosts':
+                inboxes[destination]['ghosts'][source] = payload
+            elif kind in ('grant', 'refuse'):
+                self._claims[destination] -= 1
+                if not self._claims[destination]:
+                    del self._claims[destination]
+                if destination in self._held:
+                    if kind == 'grant':
+                        self._held[destination][2] += 1
+                    if destination not in self._claims:
+                        self._finish_exit(self._held.pop(destination))
+                elif kind == 'grant':
+                    grants[destination] = grants.get(destination, 0) + 1
+            elif kind == 'exit':
+                player_id = payload[0]
+                self._locations.pop(player_id, None)
+                exit_ = list(payload) + [self.ticks]
+                exit_[2] += grants.pop(player_id, 0)
+                if player_id in self._claims:
+                    self._held[player_id] = exit_
+                else:
+                    self._finish_exit(exit_)
+        for player_id in sorted(grants): # Once every plane is where it went
+            index = self._locations.get(player_id)
+            if index is not None:
+                inboxes[index]['grants'].extend(
+                    [player_id] * grants[player_id])
+        for inbox in inboxes.values():
+            inbox['planes'].sort(key=lambda state: state['player_id'])
+            inbox['claims'].sort(key=lambda claim: claim[1])
+
+    def _finish_exit(self, exit_):
+        """Record an exit, with every point its plane was granted.
+
+        exit_ is [player ID, exit code, points, x, z, altitude, health,
+        tick].  Like Airspace.get_exit_code, landing with enough points
+        is a win unless the plane was overstressed."""
+        (player_id, exit_code, points, x, z, altitude, health,
+         tick) = exit_
+        if (health > 0 and points >= Airspace.POINTS_REQUIRED
+                and altitude <= 0):
+            exit_code = 1 # You Won!
+        self.exits.append((player_id, exit_code, points, x, z, tick))
+
+    def run(self, ticks):
+        """Simulate ticks ticks, or until every plane has exited."""
+        for _ in range(ticks):
+            if not self._locations and not self._held:
+                break
+            self.step()
+
+    def planes(self):
+        """Get the state of every plane, in world coordinates."""
+        return [state for states in self._call(
+                    'planes', [()] * len(self._shares))
+                for state in states]
+
+    def objectives(self):
+        """Get the (x, z, altitude) of every objective in the world."""
+        return [position for positions in self._call(
+                    'objectives', [()] * len(self._shares))
+                for position in positions]
+
+    def close(self):
+        """Stop the worker processes."""
+        for connection in self._connections:
+            try:
+                connection.send(('close', ()))
+            except (IOError, OSError): # Already stopped
+                pass
+            connection.close()
+        for worker in self._workers:
+            worker.join()
+        self._connections = []
+        self._workers = []
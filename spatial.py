@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""Spatial indexes for finding sprites near a point
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import heapq
+
+
+class SpatialGrid(object):
+    """A uniform grid of sprites in (x, z, altitude) cells.
+
+    Sprites are filed by the cell containing their (x, z) position
+    (the top left of their rect) and altitude.  Queries only look at
+    the cells a box overlaps, so their cost depends on how crowded the
+    box is, not on how many sprites the grid holds.
+
+    If track_near is True, the grid also keeps the set of cells that
+    are at most one cell away from a sprite.  Anything outside those
+    cells is too far from every sprite to touch it, as long as sprites
+    and queries are no bigger than a cell.
+    """
+    def __init__(self, cell_size, cell_height, track_near=False):
+        """Initialize the instance.
+
+        cell_size is the width and depth of a cell in metres, and
+        cell_height is its height in metres."""
+        self.cell_size = cell_size
+        self.cell_height = cell_height
+        self.track_near = track_near
+        self._cells = {} # The sprites in each cell, in insertion order
+        self._keys = {} # The cell of each sprite
+        self._near = {} # How many sprites are near each cell
+        self._max_size = [0, 0] # The largest sprite width and depth
+        self.version = 0 # Changes whenever the near cells change
+
+    def __len__(self):
+        """Get the number of sprites in the grid."""
+        return len(self._keys)
+
+    def __contains__(self, sprite):
+        """Test if a sprite is in the grid."""
+        return sprite in self._keys
+
+    def __iter__(self):
+        """Iterate over the sprites in the grid."""
+        return iter(self._keys)
+
+    def __repr__(self):
+        """Display the size of the grid."""
+        return "<SpatialGrid {} sprites in {} cells>".format(
+            len(self._keys), len(self._cells))
+
+    def key(self, x, z, altitude):
+        """Get the key of the cell containing a point."""
+        return (int(x // self.cell_size), int(z // self.cell_size),
+                int(altitude // self.cell_height))
+
+    def _key_of(self, sprite):
+        """Get the key of the cell a sprite belongs in."""
+        return self.key(sprite.x, sprite.z, sprite.altitude)
+
+    def cell_of(self, sprite):
+        """Get the key of the cell a sprite is filed in."""
+        return self._keys[sprite]
+
+    def is_near(self, key):
+        """Test if a cell is at most one cell away from a sprite.
+
+        Only works if track_near is True."""
+        return key in self._near
+
+    def near_keys(self):
+        """Get the keys of the cells near a sprite."""
+        return self._near.keys()
+
+    def _mark_near(self, key, change):
+        """Count a sprite in or out of the cells around key."""
+        near = self._near
+        x, z, y = key
+        for near_x in (x - 1, x, x + 1):
+            for near_z in (z - 1, z, z + 1):
+                for near_y in (y - 1, y, y + 1):
+                    near_key = (near_x, near_z, near_y)
+                    count = near.get(near_key, 0) + change
+                    if count:
+                        near[near_key] = count
+                    else:
+                        del near[near_key]
+        self.version += 1
+
+    def _file(self, sprite, key):
+        """Put a sprite in a cell."""
+        self._cells.setdefault(key, {})[sprite] = None
+        self._keys[sprite] = key
+        if self.track_near:
+            self._mark_near(key, 1)
+
+    def _unfile(self, sprite):
+        """Take a sprite out of its cell."""
+        key = self._keys.pop(sprite)
+        cell = self._cells[key]
+        del cell[sprite]
+        if not cell:
+            del self._cells[key]
+        if self.track_near:
+            self._mark_near(key, -1)
+
+    def add(self, sprite):
+        """Add a sprite to the grid."""
+        if sprite in self._keys:
+            return
+        self._file(sprite, self._key_of(sprite))
+        width, height = sprite.rect.size
+        self._max_size[0] = max(self._max_size[0], width)
+        self._max_size[1] = max(self._max_size[1], height)
+
+    def remove(self, sprite):
+        """Remove a sprite from the grid."""
+        self._unfile(sprite)
+
+    def discard(self, sprite):
+        """Remove a sprite from the grid if it is in it."""
+        if sprite in self._keys:
+            self.remove(sprite)
+
+    def move(self, sprite, key=None):
+        """Refile a sprite after it moved.
+
+        key is the sprite's new cell, if already known.
+        Returns True if it changed cells."""
+        if key is None:
+            key = self._key_of(sprite)
+        if key == self._keys[sprite]:
+            return False
+        self._unfile(sprite)
+        self._file(sprite, key)
+        return True
+
+    def clear(self):
+        """Remove every sprite from the grid."""
+        self._cells.clear()
+        self._keys.clear()
+        self._near.clear()
+        self._max_size = [0, 0]
+        self.version += 1
+
+    def query(self, left, top, right, bottom, low, high):
+        """Get the sprites that may be inside a box.
+
+        Returns every sprite whose position is in a cell the box
+        overlaps, so callers should test the results exactly."""
+        x_min, z_min, y_min = self.key(left, top, low)
+        x_max, z_max, y_max = self.key(right, bottom, high)
+        cells = self._cells
+        found = []
+        for cell_x in range(x_min, x_max + 1):
+            for cell_z in range(z_min, z_max + 1):
+                for cell_y in range(y_min, y_max + 1):
+                    cell = cells.get((cell_x, cell_z, cell_y))
+                    if cell:
+                        found.extend(cell)
+        return found
+
+    def query_rect(self, rect, low, high):
+        """Get the sprites whose rects may overlap rect.
+
+        Only sprites with altitudes from low to high are returned."""
+        # A sprite's rect starts at its position, so one that overlaps
+        # rect can start up to its own size before it.
+        return self.query(rect.left - self._max_size[0] - 1,
+                          rect.top - self._max_size[1] - 1,
+                          rect.right, rect.bottom, low, high)
+
+
+class KDTree(object):
+    """A k-d tree of items, for finding the items nearest a point.
+
+    The tree is built once from a list of items; to change the items,
+    build a new tree.  point is called on each item to get its
+    coordinates, as a tuple.
+    """
+    def __init__(self, items, point):
+        """Initialize the instance."""
+        entries = [(tuple(point(item)), index, item)
+                   for index, item in enumerate(items)]
+        self._size = len(entries)
+        self._dimensions = len(entries[0][0]) if entries else 0
+        self._root = self._build(entries, 0)
+
+    def __len__(self):
+        """Get the number of items in the tree."""
+        return self._size
+
+    def __repr__(self):
+        """Display the size of the tree."""
+        return "<KDTree of {} items>".format(self._size)
+
+    def _build(self, entries, depth):
+        """Build the subtree for entries and return its root node.
+
+        A node is a list: [entry, axis, left subtree, right subtree]."""
+        if not entries:
+            return None
+        axis = depth % self._dimensions
+        entries.sort(key=lambda entry: entry[0][axis])
+        middle = len(entries) // 2
+        return [entries[middle], axis,
+                self._build(entries[:middle], depth + 1),
+                self._build(entries[middle + 1:], depth + 1)]
+
+    def nearest(self, point, k=1):
+        """Get the k items nearest to point, nearest first.
+
+        Items at the same distance are in the order they were given."""
+        if k <= 0 or self._root is None:
+            return []
+        point = tuple(point)
+        best = [] # A heap of (-distance squared, -index, item)
+        # Subtrees to search, with the least distance they can be at
+        stack = [(self._root, 0)]
+        while stack:
+            node, bound = stack.pop()
+            if node is None:
+                continue
+            if len(best) == k and bound > -best[0][0]:
+                continue # Too far to hold anything closer
+            entry, axis, left, right = node
+            entry_point, index, item = entry
+            distance = sum((a - b) ** 2 for a, b in zip(point, entry_point))
+            candidate = (-distance, -index, item)
+            if len(best) < k:
+                heapq.heappush(best, candidate)
+            elif candidate[:2] > best[0][:2]:
+                heapq.heapreplace(best, candidate)
+            # Search the side of the split containing the point first
+            offset = point[axis] - entry_point[axis]
+            if offset < 0:
+                near, far = left, right
+            else:
+                near, far = right, left
+            stack.append((far, offset ** 2))
+            stack.append((near, 0))
+        best.sort(reverse=True)
+        return [item for _, _, item in best]
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Tests for the sharded airspace
+
+Slight Fimulator - Flight simulator in Python
+Copyright (C) 2017, 2018 Hao Tian and Adrien Hopkins
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Installs Python 3 division and print behaviour
+from __future__ import division, print_function
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from objects import Objective
+import shards
+
+# Full throttle without the autopilot, which overstresses the plane
+FULL_THROTTLE = (0, 0, 100, False, True, True, True)
+
+
+class ClaimTest(unittest.TestCase):
+    """Points claimed across an edge by planes that exit."""
+    def world(self):
+        """Get a 2x1 world with one objective just left of the edge."""
+        world = shards.ShardedAirspace(2, 1, seed=1, processes=1,
+                                       objectives=0)
+        self.addCleanup(world.close)
+        world._group.tiles[0].airspace.add_objective(
+            Objective(98000, 50000, 6000, 6000, 10000))
+        world.step() # Sends the objective to tile 1 as a ghost
+        return world
+
+    def test_grant_and_exit_in_same_tick(self):
+        """A plane exiting as its point is granted keeps the point.
+
+        The grant comes from tile 0, before the exit from tile 1."""
+        world = self.world()
+        world.add_plane(100100, 50000, 10000, health=0.006,
+                        controls=FULL_THROTTLE)
+        world.run(10)
+        self.assertEqual(len(world.exits), 1)
+        self.assertEqual(world.exits[0][2], 1)
+
+    def test_claim_and_exit_in_same_tick(self):
+        """A plane exiting as it claims a point keeps the point."""
+        world = self.world()
+        world.add_plane(100100, 50000, 10000, health=0.0001,
+                        controls=FULL_THROTTLE)
+        world.run(10)
+        self.assertEqual(len(world.exits), 1)
+        self.assertEqual(world.exits[0][2], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()